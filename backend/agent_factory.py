@@ -0,0 +1,346 @@
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+from metrics import LLM_CALL_SECONDS, LLM_FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+# Gemini model the agent runs on
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# Seconds a model call may take to start answering before it is retried on the model's fallback
+LLM_FALLBACK_TIMEOUT_SECONDS = float(os.getenv("LLM_FALLBACK_TIMEOUT_SECONDS", "15"))
+# Send one small request at startup so the first query finds an open connection
+LLM_WARMUP = os.getenv("LLM_WARMUP", "1").lower() not in ("0", "false", "no")
+# Warm-up requests tried before giving up, with the wait between them doubling from one second
+WARMUP_ATTEMPTS = 3
+# Seconds before building a model with a fallback is tried again after it failed, doubling up to the maximum
+BUILD_RETRY_SECONDS = float(os.getenv("LLM_BUILD_RETRY_SECONDS", "10"))
+BUILD_RETRY_MAX_SECONDS = 300.0
+
+
+class AgentUnavailableError(Exception):
+    """Raised when the agent cannot be built, e.g. because no API key is configured."""
+
+
+def build_gemini_llm(model: str):
+    """Create a Gemini chat model client.
+
+    The SDK is imported here rather than at module level so that importing
+    the app stays fast and health checks are served right away.
+    """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY environment variable is not set")
+
+    return ChatGoogleGenerativeAI(
+        model=model,
+        temperature=0.1,
+        google_api_key=api_key
+    )
+
+
+def create_budgeted_agent(llm, tools: List[Any], model_name: str = "", fallback_llm=None,
+                          fallback_model: str = "", fallback_timeout: Optional[float] = None):
+    """Build a ReAct agent graph whose runs stop at the budget in `current_budget`.
+
+    Same shape as LangGraph's prebuilt ReAct agent: an "agent" node calling
+    the model and a "tools" node running its tool calls, in a loop. The agent
+    node checks the run's budget before each model call, bounds the call by
+    the time left, and ends the run with a partial answer instead of letting
+    a step run that would overspend.
+
+    When the run's config has an "on_token" callable under "configurable",
+    the model's answer is streamed and each text chunk's content is passed
+    to it as it arrives.
+
+    With a `fallback_llm`, a model call that fails or does not start
+    answering within `fallback_timeout` seconds is made again on the
+    fallback model. A call that has already streamed part of its answer is
+    not retried, so the fallback's answer is never streamed after it.
+    """
+    from typing import Annotated, Sequence, TypedDict
+    from langchain_core.messages import AIMessage, BaseMessage, message_chunk_to_message
+    from langgraph.graph import END, StateGraph
+    from langgraph.graph.message import add_messages
+    from langgraph.prebuilt import ToolNode
+
+    from budget import current_budget
+
+    class AgentState(TypedDict):
+        messages: Annotated[Sequence[BaseMessage], add_messages]
+
+    class SlowStartError(Exception):
+        """The model did not start answering within the fallback timeout."""
+
+    model = llm.bind_tools(tools)
+    fallback = fallback_llm.bind_tools(tools) if fallback_llm is not None else None
+
+    async def generate(runnable, messages: List[BaseMessage], config, on_token,
+                       start_timeout: Optional[float] = None):
+        """Call the model, raising SlowStartError if nothing arrives within `start_timeout` seconds."""
+        if on_token is None:
+            try:
+                return await asyncio.wait_for(runnable.ainvoke(messages, config), start_timeout)
+            except asyncio.TimeoutError:
+                raise SlowStartError() from None
+        response = None
+        chunks = runnable.astream(messages, config)
+        try:
+            while True:
+                try:
+                    if response is None and start_timeout is not None:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), start_timeout)
+                    else:
+                        chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise SlowStartError() from None
+                response = chunk if response is None else response + chunk
+                # Text of the answer, but not the chunks that build up a tool call
+                if chunk.content and not chunk.tool_call_chunks:
+                    on_token(chunk.content)
+        finally:
+            await chunks.aclose()
+        return AIMessage(content="") if response is None else message_chunk_to_message(response)
+
+    async def invoke(messages: List[BaseMessage], config, time_left: Optional[float]):
+        on_token = (config.get("configurable") or {}).get("on_token")
+        start_timeout = None
+        if fallback is not None and fallback_timeout and (time_left is None or fallback_timeout < time_left):
+            start_timeout = fallback_timeout
+        streamed = False
+
+        def relay(text):
+            nonlocal streamed
+            streamed = True
+            on_token(text)
+
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                generate(model, messages, config, relay if on_token else None, start_timeout), time_left
+            )
+        except Exception as e:
+            timed_out = isinstance(e, SlowStartError)
+            # Running out of the run's own time is not the model's fault, and streamed text cannot be taken back
+            if fallback is None or isinstance(e, asyncio.TimeoutError) or streamed:
+                raise
+            LLM_FALLBACKS.inc(model=model_name, reason="timeout" if timed_out else "error")
+            logger.warning("Call to %s failed (%s), retrying on %s", model_name, "timed out" if timed_out else e, fallback_model)
+            if time_left is not None:
+                time_left -= time.perf_counter() - started
+            started = time.perf_counter()
+            response = await asyncio.wait_for(generate(fallback, messages, config, on_token), time_left)
+            LLM_CALL_SECONDS.observe(time.perf_counter() - started, model=fallback_model)
+            return response
+        LLM_CALL_SECONDS.observe(time.perf_counter() - started, model=model_name)
+        return response
+
+    async def call_model(state: AgentState, config):
+        messages = list(state["messages"])
+        budget = current_budget.get()
+        if budget is None:
+            return {"messages": [await invoke(messages, config, None)]}
+
+        reason = budget.check_call(messages)
+        if reason:
+            return {"messages": [budget.stop(reason)]}
+        try:
+            response = await invoke(messages, config, budget.remaining_seconds())
+        except asyncio.TimeoutError:
+            return {"messages": [budget.stop("deadline")]}
+        budget.record(messages, response)
+
+        if response.tool_calls:
+            reason = budget.check_tools(response)
+            if reason:
+                return {"messages": [budget.stop(reason)]}
+            budget.record_tools(response)
+        return {"messages": [response]}
+
+    def should_continue(state: AgentState) -> str:
+        return "tools" if state["messages"][-1].tool_calls else END
+
+    workflow = StateGraph(AgentState)
+    workflow.add_node("agent", call_model)
+    workflow.add_node("tools", ToolNode(tools))
+    workflow.set_entry_point("agent")
+    workflow.add_conditional_edges("agent", should_continue, {"tools": "tools", END: END})
+    workflow.add_edge("tools", "agent")
+    return workflow.compile()
+
+
+class AgentFactory:
+    def __init__(self, tools: List[Any], build_llm: Callable[[str], Any] = build_gemini_llm,
+                 model: str = DEFAULT_MODEL, warmup: bool = LLM_WARMUP,
+                 fallbacks: Optional[Dict[str, str]] = None,
+                 fallback_timeout: float = LLM_FALLBACK_TIMEOUT_SECONDS):
+        """
+        Builds the ReAct agents on first use and shares them between requests.
+
+        One chat model client and one agent are kept per model name. Each
+        client owns the HTTP connection pool to the provider, so every
+        request reuses warm connections instead of opening its own. Building
+        happens in a worker thread because it imports the heavy SDKs.
+
+        Args:
+            tools: Tools the agent can call
+            build_llm: Creates the chat model client for a model name
+            model: Model used when none is requested
+            warmup: Whether `warm_up()` sends a request to open the connection pool
+            fallbacks: Model to retry a failed or slow call on, by model name
+            fallback_timeout: Seconds a call on a model with a fallback may take to start answering
+        """
+        self.tools = tools
+        self.build_llm = build_llm
+        self.model = model
+        self.warmup = warmup
+        self.fallbacks = fallbacks or {}
+        self.fallback_timeout = fallback_timeout
+        self.llms: Dict[str, Any] = {}
+        self.agents: Dict[str, Any] = {}
+        # model -> (error, seconds to wait after it, monotonic time of the next attempt)
+        self.build_failures: Dict[str, Tuple[str, float, float]] = {}
+        self._lock = asyncio.Lock()
+
+        # Status
+        self.error: Optional[str] = None
+        self.warmed = False
+        self.warmup_error: Optional[str] = None
+        self.build_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        # A failed warm-up only costs the first query a cold connection, so it does not hold readiness back
+        return self.model in self.agents and (self.warmed or not self.warmup or self.warmup_error is not None)
+
+    def get_llm(self, model: Optional[str] = None):
+        """Get the shared chat model client for `model`, creating it on first use."""
+        model = model or self.model
+        llm = self.llms.get(model)
+        if llm is None:
+            llm = self.llms[model] = self.build_llm(model)
+        return llm
+
+    def _build_agent(self, model: str):
+        fallback = self.fallbacks.get(model)
+        return create_budgeted_agent(
+            self.get_llm(model), self.tools, model_name=model,
+            fallback_llm=self.get_llm(fallback) if fallback else None,
+            fallback_model=fallback or "", fallback_timeout=self.fallback_timeout,
+        )
+
+    async def get_agent(self, model: Optional[str] = None):
+        """Get the agent for `model`, building it on first use.
+
+        A model with a fallback that fails to build is answered by the
+        fallback's agent instead, as a failed call would be. The failure is
+        remembered and the build only tried again after a backoff, so
+        requests for the model go straight to the fallback meanwhile.
+
+        Raises:
+            AgentUnavailableError: If neither the agent nor its fallback can be built
+        """
+        model = model or self.model
+        agent = self.agents.get(model)
+        if agent is not None:
+            return agent
+
+        fallback = self.fallbacks.get(model)
+        if not fallback or fallback == model:
+            return await self._get_or_build_agent(model)
+        if not self._build_due(model):
+            return await self.get_agent(fallback)
+        try:
+            return await self._get_or_build_agent(model)
+        except AgentUnavailableError as e:
+            logger.warning("%s: %s, using %s", model, e, fallback)
+        return await self.get_agent(fallback)
+
+    def _build_due(self, model: str) -> bool:
+        failure = self.build_failures.get(model)
+        return failure is None or time.monotonic() >= failure[2]
+
+    async def _get_or_build_agent(self, model: str):
+        async with self._lock:
+            if model not in self.agents:
+                if not self._build_due(model):
+                    # Failed while this request waited for the lock
+                    raise AgentUnavailableError(f"Agent not initialized: {self.build_failures[model][0]}")
+                started = time.perf_counter()
+                try:
+                    self.agents[model] = await asyncio.to_thread(self._build_agent, model)
+                except Exception as e:
+                    if model == self.model:
+                        self.error = str(e)
+                    if self.fallbacks.get(model):
+                        previous = self.build_failures.get(model)
+                        delay = min(previous[1] * 2, BUILD_RETRY_MAX_SECONDS) if previous else BUILD_RETRY_SECONDS
+                        self.build_failures[model] = (str(e), delay, time.monotonic() + delay)
+                        LLM_FALLBACKS.inc(model=model, reason="build")
+                    raise AgentUnavailableError(f"Agent not initialized: {e}") from e
+                self.build_failures.pop(model, None)
+                if model == self.model:
+                    self.error = None
+                    self.build_seconds = round(time.perf_counter() - started, 3)
+                logger.info("ReAct agent for %s initialized in %ss", model, round(time.perf_counter() - started, 3))
+        return self.agents[model]
+
+    async def warm_up(self, models: Iterable[str] = ()):
+        """Build the agents and open a connection to the provider ahead of the first query.
+
+        Only failing to build the default agent is an error. Warm-up requests
+        that fail are retried a few times and then given up with a warning.
+
+        Args:
+            models: Models to prepare besides the default one
+        """
+        try:
+            await self.get_agent()
+        except AgentUnavailableError as e:
+            logger.error("%s", e)
+            return
+        for model in models:
+            if model != self.model:
+                try:
+                    await self.get_agent(model)
+                except AgentUnavailableError as e:
+                    logger.warning("%s: %s", model, e)
+        if not self.warmup:
+            return
+
+        models = sorted(self.agents)
+        for attempt in range(1, WARMUP_ATTEMPTS + 1):
+            try:
+                await asyncio.gather(*(self.get_llm(model).ainvoke("Reply with OK.") for model in models))
+            except Exception as e:
+                self.warmup_error = f"Warm-up request failed: {e}"
+                logger.warning("%s (attempt %d of %d)", self.warmup_error, attempt, WARMUP_ATTEMPTS)
+                if attempt < WARMUP_ATTEMPTS:
+                    await asyncio.sleep(2 ** (attempt - 1))
+                continue
+            self.warmed = True
+            self.warmup_error = None
+            logger.info("Connections to %s warmed up", ", ".join(models))
+            return
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get readiness details for the default agent and the models that are built."""
+        return {
+            "ready": self.ready,
+            "model": self.model,
+            "built": self.model in self.agents,
+            "models": sorted(self.agents),
+            "fallbacks": self.fallbacks,
+            "build_failures": {model: error for model, (error, _, _) in self.build_failures.items()},
+            "warmed": self.warmed,
+            "warmup_error": self.warmup_error,
+            "build_seconds": self.build_seconds,
+            "error": self.error,
+        }
@@ -0,0 +1,318 @@
+"""Offline load test for the agent path.
+
+Starts the app in-process with a scripted fake chat model instead of Gemini,
+connects N simulated browser clients to /ws/{client_id} and drives /agent
+requests from all of them concurrently. Nothing leaves the machine.
+
+Usage:
+    python benchmark.py --clients 20 --requests 10 --llm-latency-ms 200
+
+Every tool call the fake model emits names the client whose request caused
+it, so each simulated browser can tell when it receives another client's
+tool call. The run exits non-zero if any request failed or any tool call was
+misrouted. With --stream the requests go to /agent/stream instead, and a
+request whose answer did not arrive as token events before the done event
+counts as failed. Requires httpx and websockets.
+"""
+from typing import Any, AsyncIterator, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+# Keep every request on the agent path and the output quiet
+os.environ.setdefault("PLAN_CACHE_MAX_ENTRIES", "0")
+os.environ.setdefault("WORKFLOW_FAST_PATH", "0")
+# The scripted plan targets made-up pages
+os.environ.setdefault("SELECTOR_VALIDATION", "0")
+os.environ.setdefault("MEMORY_BACKEND", "memory")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Fake chat model that plays back a fixed tool-call plan.
+
+    Each turn sleeps for `latency` seconds, then emits the calls of the next
+    step in `plan`, or a final answer once every step has run. String
+    arguments may contain "{client}" and "{request}", which are filled in
+    from the "<client> <request>" query the benchmark sends. When streamed,
+    the final answer arrives one word at a time.
+    """
+    plan: List[List[Dict[str, Any]]] = []
+    latency: float = 0.1
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        step = sum(1 for message in messages if isinstance(message, AIMessage) and message.tool_calls)
+        if step >= len(self.plan):
+            results = sum(1 for message in messages if isinstance(message, ToolMessage))
+            return AIMessage(content=f"Done after {step} steps and {results} tool results")
+
+        query = next(message.content for message in reversed(messages) if isinstance(message, HumanMessage))
+        client, _, request = query.partition(" ")
+        calls = []
+        for index, call in enumerate(self.plan[step]):
+            args = {
+                key: value.format(client=client, request=request) if isinstance(value, str) else value
+                for key, value in call["args"].items()
+            }
+            calls.append({"name": call["name"], "args": args, "id": f"call_{step}_{index}"})
+        return AIMessage(content="", tool_calls=calls)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        message = self._next_message(messages)
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                for index, call in enumerate(message.tool_calls)
+            ]))
+            return
+        for word in message.content.split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+def build_plan(steps: int, calls_per_step: int) -> List[List[Dict[str, Any]]]:
+    """A navigation step followed by steps of form fills, like a typical form request."""
+    plan = [[{"name": "navigate_to_page", "args": {"path": "/bench/{client}/{request}"}}]]
+    for step in range(1, steps):
+        plan.append([
+            {"name": "fill_input", "args": {"selector": f"#field-{step}-{index}", "value": "{client}/{request}"}}
+            for index in range(calls_per_step)
+        ])
+    return plan[:steps]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class SimulatedBrowser:
+    def __init__(self, client_id: str, tool_latency: float):
+        """
+        Plays the browser side of /ws/{client_id}: runs tool calls and reports results.
+
+        Args:
+            client_id: Client ID the browser connects as
+            tool_latency: Seconds each tool takes to "execute"
+        """
+        self.client_id = client_id
+        self.tool_latency = tool_latency
+        self.request_started: Optional[float] = None
+        self.first_tool_at: Optional[float] = None
+        self.tool_calls = 0
+        self.misrouted = 0
+
+    def _check(self, call: Dict[str, Any]):
+        """Count the call, and flag it if it was meant for another client."""
+        self.tool_calls += 1
+        if self.first_tool_at is None and self.request_started is not None:
+            self.first_tool_at = time.perf_counter()
+        marker = call["args"].get("path") or call["args"].get("value") or ""
+        if not marker.split("/bench/")[-1].startswith(self.client_id + "/"):
+            self.misrouted += 1
+
+    async def _run(self, call: Dict[str, Any]) -> Dict[str, Any]:
+        self._check(call)
+        await asyncio.sleep(self.tool_latency)
+        return {"id": call["id"], "success": True, "result": f"{call['tool']} ok"}
+
+    async def serve(self, websocket):
+        async for raw in websocket:
+            frame = json.loads(raw)
+            for message in frame["messages"] if frame.get("type") == "batch" else [frame]:
+                if message.get("type") == "tool_batch":
+                    results = []
+                    calls = message["calls"]
+                    i = 0
+                    while i < len(calls):
+                        end = i + 1
+                        if calls[i].get("concurrent"):
+                            while end < len(calls) and calls[end].get("concurrent"):
+                                end += 1
+                        results.extend(await asyncio.gather(*(self._run(call) for call in calls[i:end])))
+                        i = end
+                    await websocket.send(json.dumps({"type": "tool_batch_result", "id": message["id"], "results": results}))
+                elif message.get("type") == "tool_call":
+                    result = await self._run(message)
+                    await websocket.send(json.dumps({"type": "tool_result", **result}))
+
+
+def start_server(app, port: int):
+    """Run the app with uvicorn in a background thread with its own event loop."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Benchmark server failed to start on port {port}")
+        time.sleep(0.05)
+    return server
+
+
+async def stream_request(http, url: str, payload: Dict[str, Any]) -> bool:
+    """Post to /agent/stream; succeeds if token events arrived before the done event."""
+    tokens = 0
+    event = None
+    async with http.stream("POST", url, json=payload) as response:
+        if response.status_code != 200:
+            return False
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "token":
+                    tokens += 1
+                elif event == "done":
+                    return tokens > 0
+                elif event == "error":
+                    return False
+    return False
+
+
+async def run_client(base_url: str, ws_url: str, client_id: str, requests: int,
+                     tool_latency: float, http, results: Dict[str, List[Any]], stream: bool = False):
+    import websockets
+
+    browser = SimulatedBrowser(client_id, tool_latency)
+    async with websockets.connect(f"{ws_url}/ws/{client_id}") as websocket:
+        serving = asyncio.create_task(browser.serve(websocket))
+        try:
+            for request in range(requests):
+                browser.request_started = started = time.perf_counter()
+                browser.first_tool_at = None
+                payload = {"query": f"{client_id} {request}", "client_id": client_id}
+                try:
+                    if stream:
+                        ok = await stream_request(http, f"{base_url}/agent/stream", payload)
+                    else:
+                        ok = (await http.post(f"{base_url}/agent", json=payload)).status_code == 200
+                except Exception:
+                    ok = False
+                finished = time.perf_counter()
+
+                if not ok:
+                    results["errors"].append(client_id)
+                    continue
+                results["latencies"].append(finished - started)
+                if browser.first_tool_at is not None:
+                    results["first_tool"].append(browser.first_tool_at - started)
+        finally:
+            serving.cancel()
+    results["tool_calls"].append(browser.tool_calls)
+    results["misrouted"].append(browser.misrouted)
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    import httpx
+
+    import main
+
+    plan = build_plan(args.steps, args.calls_per_step)
+    main.agent_factory.build_llm = lambda model: ScriptedChatModel(plan=plan, latency=args.llm_latency_ms / 1000)
+    main.agent_factory.warmup = False
+
+    server = start_server(main.app, args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+    ws_url = f"ws://127.0.0.1:{args.port}"
+    results: Dict[str, List[Any]] = {"latencies": [], "first_tool": [], "errors": [], "tool_calls": [], "misrouted": []}
+
+    try:
+        limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as http:
+            # Wait for the server to build the agent so that is not counted against the first requests
+            while (await http.get(f"{base_url}/ready")).status_code != 200:
+                await asyncio.sleep(0.05)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                run_client(base_url, ws_url, f"bench{index}", args.requests, args.tool_latency_ms / 1000,
+                           http, results, args.stream)
+                for index in range(args.clients)
+            ))
+            elapsed = time.perf_counter() - started
+    finally:
+        server.should_exit = True
+
+    latencies = results["latencies"]
+    first_tool = results["first_tool"]
+    return {
+        "clients": args.clients,
+        "requests": args.clients * args.requests,
+        "completed": len(latencies),
+        "errors": len(results["errors"]),
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+        },
+        "first_tool_ms": {
+            "p50": round(percentile(first_tool, 50) * 1000, 1),
+            "p95": round(percentile(first_tool, 95) * 1000, 1),
+            "p99": round(percentile(first_tool, 99) * 1000, 1),
+        },
+        "tool_calls": sum(results["tool_calls"]),
+        "misrouted_tool_calls": sum(results["misrouted"]),
+    }
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline load test for the agent path")
+    parser.add_argument("--clients", type=int, default=10, help="Simulated browser clients")
+    parser.add_argument("--requests", type=int, default=5, help="Sequential requests per client")
+    parser.add_argument("--steps", type=int, default=2, help="Agent steps with tool calls per request")
+    parser.add_argument("--calls-per-step", type=int, default=3, help="Tool calls in each step after the first")
+    parser.add_argument("--llm-latency-ms", type=float, default=100, help="Latency of each fake LLM turn")
+    parser.add_argument("--tool-latency-ms", type=float, default=5, help="Time each simulated tool takes")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds before a request counts as failed")
+    parser.add_argument("--port", type=int, default=8799, help="Local port for the benchmark server")
+    parser.add_argument("--stream", action="store_true", help="Use /agent/stream and require streamed tokens")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['completed']}/{report['requests']} requests from {report['clients']} clients "
+              f"in {report['elapsed_s']}s ({report['requests_per_s']} req/s), {report['errors']} errors")
+        latency, first_tool = report["latency_ms"], report["first_tool_ms"]
+        print(f"latency ms:         p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  mean {latency['mean']}")
+        print(f"first tool ms:      p50 {first_tool['p50']}  p95 {first_tool['p95']}  p99 {first_tool['p99']}")
+        print(f"tool calls:         {report['tool_calls']} ({report['misrouted_tool_calls']} misrouted)")
+
+    return 1 if report["errors"] or report["misrouted_tool_calls"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,133 @@
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+import os
+import time
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+from metrics import BUDGET_EXHAUSTED
+from tokens import estimate_message_tokens, estimate_tokens
+
+# Per-request limits; 0 disables a limit
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "8"))
+AGENT_DEADLINE_SECONDS = float(os.getenv("AGENT_DEADLINE_SECONDS", "60"))
+AGENT_MAX_INPUT_TOKENS = int(os.getenv("AGENT_MAX_INPUT_TOKENS", "32000"))
+AGENT_MAX_OUTPUT_TOKENS = int(os.getenv("AGENT_MAX_OUTPUT_TOKENS", "4000"))
+AGENT_MAX_TOOL_CALLS = int(os.getenv("AGENT_MAX_TOOL_CALLS", "30"))
+
+# What the user is told for each exhausted budget
+_REASONS = {
+    "steps": "it needed more steps than allowed",
+    "deadline": "it ran out of time",
+    "input_tokens": "the conversation grew too long",
+    "output_tokens": "the answer grew too long",
+    "tool_calls": "it needed more browser actions than allowed",
+}
+
+
+class RequestBudget:
+    def __init__(self, max_steps: int = AGENT_MAX_STEPS, deadline_seconds: float = AGENT_DEADLINE_SECONDS,
+                 max_input_tokens: int = AGENT_MAX_INPUT_TOKENS, max_output_tokens: int = AGENT_MAX_OUTPUT_TOKENS,
+                 max_tool_calls: int = AGENT_MAX_TOOL_CALLS):
+        """
+        Limits on what one agent run may spend.
+
+        The agent node checks the budget before every model call and again
+        before letting a step's tool calls run. Once a limit is hit the run
+        ends with a partial answer listing what was done, instead of an error.
+        Token counts come from the model's usage metadata when it reports
+        them and are estimated otherwise.
+
+        Args:
+            max_steps: Maximum number of model calls
+            deadline_seconds: Wall-clock time the run may take
+            max_input_tokens: Maximum prompt tokens over all model calls
+            max_output_tokens: Maximum generated tokens over all model calls
+            max_tool_calls: Maximum number of browser tool calls
+        """
+        self.max_steps = max_steps
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.max_tool_calls = max_tool_calls
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+
+        # Spent so far
+        self.steps = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.tool_calls = 0
+        self.tools_run: List[str] = []
+        self.exhausted: Optional[str] = None
+
+    @property
+    def recursion_limit(self) -> int:
+        """Graph step limit that backs up `max_steps`: an agent and a tools node per step, plus slack."""
+        return 2 * self.max_steps + 3 if self.max_steps else 100
+
+    def remaining_seconds(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def check_call(self, messages: List[BaseMessage]) -> Optional[str]:
+        """Return the exhausted budget if another model call is not allowed."""
+        if self.max_steps and self.steps >= self.max_steps:
+            return "steps"
+        remaining = self.remaining_seconds()
+        if remaining is not None and remaining <= 0:
+            return "deadline"
+        if self.max_output_tokens and self.output_tokens >= self.max_output_tokens:
+            return "output_tokens"
+        if self.max_input_tokens:
+            prompt_tokens = estimate_message_tokens(str(message.content) for message in messages)
+            if self.input_tokens + prompt_tokens > self.max_input_tokens:
+                return "input_tokens"
+        return None
+
+    def record(self, messages: List[BaseMessage], response: AIMessage):
+        """Count a model call that produced `response` from `messages`."""
+        self.steps += 1
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            self.input_tokens += usage.get("input_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+        else:
+            self.input_tokens += estimate_message_tokens(str(message.content) for message in messages)
+            self.output_tokens += estimate_tokens(str(response.content))
+
+    def check_tools(self, response: AIMessage) -> Optional[str]:
+        """Return the exhausted budget if the tool calls in `response` may not run."""
+        if self.max_steps and self.steps >= self.max_steps:
+            # Their results would need another model call to be read
+            return "steps"
+        if self.max_tool_calls and self.tool_calls + len(response.tool_calls) > self.max_tool_calls:
+            return "tool_calls"
+        return None
+
+    def record_tools(self, response: AIMessage):
+        self.tool_calls += len(response.tool_calls)
+        self.tools_run.extend(call["name"] for call in response.tool_calls)
+
+    def stop(self, reason: str) -> AIMessage:
+        """End the run because `reason` is exhausted, with an answer summing up what was done."""
+        self.exhausted = reason
+        BUDGET_EXHAUSTED.inc(reason=reason)
+        answer = f"I stopped before finishing because {_REASONS[reason]}."
+        if self.tools_run:
+            counts: Dict[str, int] = {}
+            for name in self.tools_run:
+                counts[name] = counts.get(name, 0) + 1
+            done = ", ".join(name if count == 1 else f"{name} x{count}" for name, count in counts.items())
+            answer += f" Actions completed so far: {done}."
+        return AIMessage(content=answer)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "steps": self.steps,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "tool_calls": self.tool_calls,
+            "exhausted": self.exhausted,
+        }
+
+
+# Budget of the agent run executing in the current context
+current_budget: ContextVar[Optional[RequestBudget]] = ContextVar("current_budget", default=None)
@@ -0,0 +1,150 @@
+"""Offline check of tool calls for clients that move between workers.
+
+Runs two connection managers in-process on one message bus, like two
+workers of a deployment, with stub browsers for sockets, and checks that
+tool calls reach a client wherever it is connected: calls from either
+worker after the client reconnects to the other one, calls that were
+waiting on the old worker when the client left, and calls after the
+workers claim their clients again following a broker failover. Nothing
+leaves the machine.
+
+Usage:
+    python bus_check.py
+
+Exits non-zero if any call failed or was answered by the wrong socket.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from connections import ConnectionManager
+from message_bus import BusRouter, InProcessMessageBus
+
+
+class StubBrowser:
+    def __init__(self, name: str, manager: ConnectionManager):
+        """
+        Stands in for a client's WebSocket and answers every tool call with its own name.
+
+        Args:
+            name: Answer to every tool call
+            manager: Connection manager the results are reported to
+        """
+        self.name = name
+        self.manager = manager
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.closed = True
+
+    async def send_text(self, data: str):
+        if self.closed:
+            raise ConnectionError("socket closed")
+        frame = json.loads(data)
+        for message in frame["messages"] if frame.get("type") == "batch" else [frame]:
+            if message.get("type") == "tool_call":
+                self.manager.resolve_tool_result({"id": message["id"], "success": True, "result": self.name})
+
+
+async def call(manager: ConnectionManager, client_id: str) -> str:
+    try:
+        return await manager.call_tool(client_id, "highlight_element", {"selector": "#pricing"}, timeout=1)
+    except Exception as e:
+        return f"error: {e}"
+
+
+async def reconnect_elsewhere(a: ConnectionManager, b: ConnectionManager) -> List[Dict[str, str]]:
+    """The client leaves worker A and reconnects to worker B before A's grace window ends."""
+    await a.connect(StubBrowser("old socket", a), "c1")
+    a.disconnect("c1")
+    await b.connect(StubBrowser("new socket", b), "c1")
+    await asyncio.sleep(0)
+    return [
+        {"call": "from A", "expected": "new socket", "answered": await call(a, "c1")},
+        {"call": "from B", "expected": "new socket", "answered": await call(b, "c1")},
+    ]
+
+
+async def parked_call_forwarded(a: ConnectionManager, b: ConnectionManager) -> List[Dict[str, str]]:
+    """A call is waiting on worker A for the client when it reconnects to worker B."""
+    await a.connect(StubBrowser("old socket", a), "c1")
+    a.disconnect("c1")
+    waiting = asyncio.create_task(call(a, "c1"))
+    await asyncio.sleep(0.01)
+    await b.connect(StubBrowser("new socket", b), "c1")
+    return [{"call": "waiting on A", "expected": "new socket", "answered": await waiting}]
+
+
+async def failover_reclaim(a: ConnectionManager, b: ConnectionManager) -> List[Dict[str, str]]:
+    """After a broker failover worker A claims the client again, though it has since moved to B."""
+    await a.connect(StubBrowser("old socket", a), "c1")
+    a.disconnect("c1")
+    await b.connect(StubBrowser("new socket", b), "c1")
+    # A's claim from before the client moved arrives after B's
+    a.bus.router.claim(a.bus.worker_id, "c1", 0.0)
+    await asyncio.sleep(0)
+    return [
+        {"call": "from A", "expected": "new socket", "answered": await call(a, "c1")},
+        {"call": "from B", "expected": "new socket", "answered": await call(b, "c1")},
+    ]
+
+
+SCENARIOS: Dict[str, Callable[[ConnectionManager, ConnectionManager], Awaitable[List[Dict[str, str]]]]] = {
+    "reconnect elsewhere": reconnect_elsewhere,
+    "parked call forwarded": parked_call_forwarded,
+    "failover reclaim": failover_reclaim,
+}
+
+
+async def run_checks(args) -> List[Dict[str, Any]]:
+    report = []
+    for name, scenario in SCENARIOS.items():
+        router = BusRouter()
+        a = ConnectionManager(reconnect_grace_seconds=args.grace, bus=InProcessMessageBus(router, "A"),
+                              heartbeat_interval=0)
+        b = ConnectionManager(reconnect_grace_seconds=args.grace, bus=InProcessMessageBus(router, "B"),
+                              heartbeat_interval=0)
+        await a.start()
+        await b.start()
+        try:
+            calls = await scenario(a, b)
+        finally:
+            await a.close()
+            await b.close()
+        report.append({
+            "scenario": name,
+            "calls": len(calls),
+            "wrong": [result for result in calls if result["answered"] != result["expected"]],
+        })
+    return report
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline check of tool calls for clients that move between workers")
+    parser.add_argument("--grace", type=float, default=30, help="Reconnect grace window of each worker")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_checks(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for scenario in report:
+            print(f"{scenario['scenario']:<22} {scenario['calls'] - len(scenario['wrong'])}/{scenario['calls']} "
+                  f"answered by the client's current socket")
+            for wrong in scenario["wrong"]:
+                print(f"  {wrong['call']}: expected {wrong['expected']}, got {wrong['answered']}")
+
+    return 1 if any(scenario["wrong"] for scenario in report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,139 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from metrics import COALESCED_REQUESTS
+
+
+class RequestSupersededError(Exception):
+    """Raised to the callers of a run that was cancelled for a newer query from the same client."""
+
+
+def coalesce_key(query: str) -> str:
+    """Normalize a query for duplicate detection: case and whitespace only, values stay distinct."""
+    return " ".join(query.lower().split())
+
+
+TokenCallback = Callable[[str], None]
+
+
+class _Flight:
+    __slots__ = ('task', 'waiters', 'superseded', 'tokens', 'listeners')
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.superseded = False
+        # Answer text streamed so far, replayed to callers that join late
+        self.tokens: List[str] = []
+        self.listeners: List[TokenCallback] = []
+
+    def emit(self, text: str):
+        self.tokens.append(text)
+        for listener in list(self.listeners):
+            listener(text)
+
+
+class RequestCoalescer:
+    def __init__(self, cancel_superseded: bool = False, debounce_ms: float = 0):
+        """
+        Single-flight execution of agent requests per client.
+
+        A request whose client already has a run for the same query in
+        flight attaches to that run and gets its result, instead of starting
+        a second run that would send every tool call to the browser again.
+        The run is cancelled once every caller waiting on it has gone away.
+
+        Args:
+            cancel_superseded: Cancel a client's in-flight runs when it sends a different query
+            debounce_ms: Delay before a run starts, so a query replaced right away never reaches the LLM
+        """
+        self.cancel_superseded = cancel_superseded
+        self.debounce = debounce_ms / 1000
+        # client_id -> coalesce key -> run in flight
+        self._flights: Dict[str, Dict[str, _Flight]] = {}
+
+        # Stats
+        self.total_runs = 0
+        self.total_coalesced = 0
+        self.total_superseded = 0
+        self.total_abandoned = 0
+
+    async def run(self, client_id: Optional[str], query: str,
+                  fn: Callable[[Optional[TokenCallback]], Awaitable[Any]],
+                  on_token: Optional[TokenCallback] = None) -> Any:
+        """Run `fn` for the client's query, or wait for the identical run already in flight.
+
+        `fn` runs in its own task, which starts with a copy of the caller's
+        context. It is called with a callback for the pieces of the answer
+        text, which reach the `on_token` of every caller sharing the run,
+        including the pieces streamed before a caller joined.
+
+        Raises:
+            RequestSupersededError: If the run was cancelled for a newer query
+        """
+        if not client_id:
+            return await fn(on_token)
+
+        key = coalesce_key(query)
+        flights = self._flights.setdefault(client_id, {})
+        flight = flights.get(key)
+        if flight is not None:
+            self.total_coalesced += 1
+            COALESCED_REQUESTS.inc(outcome="joined")
+        else:
+            if self.cancel_superseded:
+                for stale in flights.values():
+                    stale.superseded = True
+                    stale.task.cancel()
+                    self.total_superseded += 1
+                    COALESCED_REQUESTS.inc(outcome="superseded")
+                flights.clear()
+            flight = flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._execute(fn, flight.emit))
+            flight.task.add_done_callback(lambda task: self._finish(client_id, key, flight))
+            self.total_runs += 1
+
+        if on_token:
+            for text in flight.tokens:
+                on_token(text)
+            flight.listeners.append(on_token)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.task.cancelled() and flight.superseded:
+                raise RequestSupersededError("Superseded by a newer request from this client")
+            raise
+        finally:
+            if on_token:
+                flight.listeners.remove(on_token)
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # Nobody is left to read the answer
+                flight.task.cancel()
+                self.total_abandoned += 1
+
+    async def _execute(self, fn: Callable[[Optional[TokenCallback]], Awaitable[Any]], emit: TokenCallback) -> Any:
+        if self.debounce:
+            await asyncio.sleep(self.debounce)
+        return await fn(emit)
+
+    def _finish(self, client_id: str, key: str, flight: _Flight):
+        flights = self._flights.get(client_id)
+        if flights is not None and flights.get(key) is flight:
+            del flights[key]
+            if not flights:
+                del self._flights[client_id]
+        # Mark the outcome retrieved in case no caller was left to await it
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get coalescing statistics."""
+        return {
+            "in_flight_runs": sum(len(flights) for flights in self._flights.values()),
+            "total_runs": self.total_runs,
+            "total_coalesced": self.total_coalesced,
+            "total_superseded": self.total_superseded,
+            "total_abandoned": self.total_abandoned,
+        }
@@ -0,0 +1,89 @@
+from typing import Dict, Any, List, Optional, Tuple
+from typing_extensions import Required, TypedDict
+
+# Composite tools run several browser actions in one call; the browser expands them itself
+COMPOSITE_TOOLS = {"fill_form", "navigate_and_wait", "sequence"}
+
+# Actions allowed inside a sequence
+SEQUENCE_TOOLS = {
+    "highlight_element", "fill_input", "navigate_to_page", "click_element",
+    "wait_for_element", "scroll_to_element", "get_element_text",
+}
+
+# Arguments each sequence action passes on to its tool
+_ACTION_ARGS = {
+    "highlight_element": ("selector", "duration"),
+    "fill_input": ("selector", "value"),
+    "navigate_to_page": ("path",),
+    "click_element": ("selector",),
+    "wait_for_element": ("selector", "timeout"),
+    "scroll_to_element": ("selector",),
+    "get_element_text": ("selector",),
+}
+
+Action = Tuple[str, Dict[str, Any]]
+
+
+class FormField(TypedDict):
+    """An input field and the value to fill in."""
+    selector: str
+    value: str
+
+
+class SequenceAction(TypedDict, total=False):
+    """One step of a sequence; only the arguments its tool takes are used."""
+    tool: Required[str]
+    selector: str
+    value: str
+    path: str
+    timeout: int
+    duration: int
+
+
+def expand_actions(tool_name: str, args: Dict[str, Any]) -> List[Action]:
+    """The primitive tool calls a call performs, in order.
+
+    Raises:
+        ValueError: If a sequence contains an action that is not allowed
+    """
+    if tool_name == "fill_form":
+        actions = [("fill_input", {"selector": field["selector"], "value": field["value"]})
+                   for field in args.get("fields") or []]
+        if args.get("submit_selector"):
+            actions.append(("click_element", {"selector": args["submit_selector"]}))
+        return actions
+    if tool_name == "navigate_and_wait":
+        actions = [("navigate_to_page", {"path": args.get("path")})]
+        if args.get("selector"):
+            actions.append(("wait_for_element", {"selector": args["selector"], "timeout": args.get("timeout", 5000)}))
+        return actions
+    if tool_name == "sequence":
+        actions = []
+        for action in args.get("actions") or []:
+            name = action.get("tool")
+            if name not in SEQUENCE_TOOLS:
+                raise ValueError(f"{name} cannot be used in a sequence; allowed: {', '.join(sorted(SEQUENCE_TOOLS))}")
+            actions.append((name, {key: action[key] for key in _ACTION_ARGS[name] if action.get(key) is not None}))
+        return actions
+    return [(tool_name, args)]
+
+
+def action_wait_ms(tool_name: str, args: Dict[str, Any]) -> int:
+    """Milliseconds a primitive action deliberately waits, on top of its own timeout."""
+    if tool_name == "highlight_element":
+        return args.get("duration") or 2000
+    if tool_name == "wait_for_element":
+        return args.get("timeout") or 5000
+    return 0
+
+
+def final_path(tool_name: str, args: Dict[str, Any], path: Optional[str]) -> Optional[str]:
+    """Path the browser is on after a call, given the path it started on."""
+    try:
+        actions = expand_actions(tool_name, args)
+    except ValueError:
+        return path
+    for name, action_args in actions:
+        if name == "navigate_to_page" and action_args.get("path"):
+            path = action_args["path"]
+    return path
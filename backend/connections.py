@@ -0,0 +1,684 @@
+from fastapi import WebSocket
+from typing import Dict, Any, Optional, List, Tuple
+from collections import defaultdict, deque
+from datetime import datetime
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
+import uuid
+
+from metrics import STAGE_SECONDS, WS_CONNECTION_EVENTS
+from message_bus import MessageBus, InProcessMessageBus
+
+logger = logging.getLogger(__name__)
+
+# Default seconds to wait for the browser to report a tool result
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "10"))
+
+# Outbound buffering per client
+OUTBOX_MAX_SIZE = int(os.getenv("WS_OUTBOX_MAX_SIZE", "256"))
+OUTBOX_MAX_BATCH = int(os.getenv("WS_OUTBOX_MAX_BATCH", "32"))
+# "reject" fails new messages when the outbox is full, "drop_oldest" evicts the oldest one
+OUTBOX_POLICY = os.getenv("WS_OUTBOX_POLICY", "reject")
+# Seconds undelivered messages are kept for a client that may reconnect
+RECONNECT_GRACE_SECONDS = float(os.getenv("WS_RECONNECT_GRACE_SECONDS", "30"))
+# Milliseconds to wait for the rest of an agent step's tool calls before sending a partial batch
+TOOL_BATCH_WINDOW_MS = float(os.getenv("TOOL_BATCH_WINDOW_MS", "20"))
+# Seconds a client may stay silent before it is pinged, and before its socket is considered dead
+HEARTBEAT_INTERVAL_SECONDS = float(os.getenv("WS_HEARTBEAT_INTERVAL_SECONDS", "20"))
+IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "60"))
+# Open sockets per worker; further clients are turned away until some leave (0 disables the limit)
+MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "5000"))
+# Seconds a rejected client is told to wait before trying again
+REJECT_RETRY_AFTER_SECONDS = float(os.getenv("WS_REJECT_RETRY_AFTER_SECONDS", "10"))
+
+# WebSocket close codes
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class ToolCallError(Exception):
+    """Raised when a tool call could not be completed by the browser."""
+
+
+class ToolTimeoutError(ToolCallError):
+    """Raised when the browser does not report a tool result in time."""
+
+
+class OutboxFullError(ToolCallError):
+    """Raised when a client's outbound queue is full and the policy rejects new messages."""
+
+
+class ClientOutbox:
+    def __init__(self, client_id: str, max_size: int = OUTBOX_MAX_SIZE,
+                 max_batch: int = OUTBOX_MAX_BATCH, policy: str = OUTBOX_POLICY):
+        """
+        Outbound message queue with a dedicated writer task for one client.
+
+        Messages are buffered while the client is disconnected and delivered
+        once it reconnects. Whatever is waiting when the writer wakes up is
+        sent as a single frame.
+
+        Args:
+            client_id: Client the messages are addressed to
+            max_size: Maximum number of buffered messages
+            max_batch: Maximum number of messages combined into one frame
+            policy: Backpressure policy when full, "reject" or "drop_oldest"
+        """
+        self.client_id = client_id
+        self.max_batch = max_batch
+        self.policy = policy
+        # Entries are (enqueue time, message)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        # Entries taken off the queue whose frame failed to send
+        self.retry: deque = deque()
+        self.websocket: Optional[WebSocket] = None
+        self.writer_task: Optional[asyncio.Task] = None
+        self.expiry_handle: Optional[asyncio.TimerHandle] = None
+
+        # Stats
+        self.frames_sent = 0
+        self.messages_sent = 0
+        self.messages_dropped = 0
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() + len(self.retry)
+
+    def enqueue(self, message: Dict[str, Any]):
+        """Buffer a message for delivery without waiting on the socket."""
+        if self.queue.full():
+            if self.policy != "drop_oldest":
+                raise OutboxFullError(f"Outbound queue for client {self.client_id} is full")
+            self.queue.get_nowait()
+            self.messages_dropped += 1
+        self.queue.put_nowait((time.perf_counter(), message))
+
+    def attach(self, websocket: WebSocket):
+        """Start delivering buffered and new messages over `websocket`."""
+        self.detach()
+        if self.expiry_handle:
+            self.expiry_handle.cancel()
+            self.expiry_handle = None
+        self.websocket = websocket
+        self.writer_task = asyncio.create_task(self._write_loop(websocket))
+
+    def detach(self):
+        """Stop the writer; undelivered messages stay buffered."""
+        if self.writer_task:
+            self.writer_task.cancel()
+            self.writer_task = None
+        self.websocket = None
+
+    async def _write_loop(self, websocket: WebSocket):
+        while True:
+            batch: List[Tuple[float, Dict[str, Any]]] = list(self.retry)
+            self.retry.clear()
+            if not batch:
+                batch.append(await self.queue.get())
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            messages = [message for _, message in batch]
+            frame = messages[0] if len(messages) == 1 else {"type": "batch", "messages": messages}
+            try:
+                await websocket.send_text(json.dumps(frame))
+            except asyncio.CancelledError:
+                self.retry.extendleft(reversed(batch))
+                raise
+            except Exception as e:
+                # Socket is gone; keep the batch for redelivery on reconnect
+                self.retry.extendleft(reversed(batch))
+                logger.warning("Send to client %s failed, buffering %d messages: %s", self.client_id, len(batch), e)
+                return
+
+            # How long the oldest message in the frame waited to go out
+            STAGE_SECONDS.observe(time.perf_counter() - batch[0][0], stage="queue_drain")
+            self.frames_sent += 1
+            self.messages_sent += len(batch)
+
+
+class ToolBatcher:
+    def __init__(self, manager: "ConnectionManager", client_id: str,
+                 window_ms: float = TOOL_BATCH_WINDOW_MS):
+        """
+        Collects the tool calls of one agent step into a single tool_batch frame.
+
+        A frame is sent as soon as the number of calls announced with
+        `expect()` has been added, or `window_ms` after the first call if the
+        step turns out smaller. The browser runs the calls in order, running
+        adjacent calls marked concurrent together, and answers with one
+        tool_batch_result frame.
+
+        Args:
+            manager: Connection manager used to send the frames
+            client_id: Client that executes the calls
+            window_ms: Longest time the first call of a frame waits for the others
+        """
+        self.manager = manager
+        self.client_id = client_id
+        self.window = window_ms / 1000
+        self.expected = 0
+        self.calls: List[Dict[str, Any]] = []
+        # Seconds the browser may need for the pending calls if they run one after another
+        self.timeout = 0.0
+        self.sent: Optional[asyncio.Future] = None
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def expect(self, count: int):
+        """Announce how many tool calls the next agent step will make."""
+        self.expected = count
+
+    def skip(self):
+        """Note that one of the announced calls will not be added after all."""
+        if self.expected:
+            self.expected -= 1
+            if self.calls and len(self.calls) >= self.expected:
+                self.flush()
+
+    def add(self, call: Dict[str, Any], timeout: float) -> asyncio.Future:
+        """Add a call to the pending frame.
+
+        Returns:
+            A future resolved with the loop time by which the frame's results
+            are due, once the frame has been sent
+        """
+        loop = asyncio.get_running_loop()
+        if self.sent is None:
+            self.sent = loop.create_future()
+            self.flush_handle = loop.call_later(self.window, self.flush)
+
+        sent = self.sent
+        self.calls.append(call)
+        self.timeout += timeout
+        if self.expected and len(self.calls) >= self.expected:
+            self.flush()
+        return sent
+
+    def flush(self):
+        """Send the pending calls as one frame."""
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.calls:
+            return
+
+        calls, timeout, sent = self.calls, self.timeout, self.sent
+        self.calls, self.timeout, self.sent = [], 0.0, None
+        self.expected = max(self.expected - len(calls), 0)
+        try:
+            self.manager.send(self.client_id, {
+                "type": "tool_batch",
+                "id": str(uuid.uuid4()),
+                "calls": calls,
+                "timestamp": datetime.now().isoformat()
+            })
+        except ToolCallError as e:
+            sent.set_exception(e)
+            return
+
+        self.manager.tool_batches_sent += 1
+        self.manager.batched_tool_calls += len(calls)
+        logger.debug("Sent batch of %d tool calls to client %s", len(calls), self.client_id)
+        sent.set_result(asyncio.get_running_loop().time() + timeout)
+
+
+def _call_ids(message: Dict[str, Any]) -> List[str]:
+    """IDs of the tool calls carried by an outbound message."""
+    if message.get("type") == "tool_call":
+        return [message["id"]]
+    if message.get("type") == "tool_batch":
+        return [call["id"] for call in message["calls"]]
+    return []
+
+
+# WebSocket connection manager
+class ConnectionManager:
+    def __init__(self, reconnect_grace_seconds: float = RECONNECT_GRACE_SECONDS,
+                 bus: Optional[MessageBus] = None,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL_SECONDS,
+                 idle_timeout: float = IDLE_TIMEOUT_SECONDS,
+                 max_connections: int = MAX_CONNECTIONS):
+        """
+        Tracks the browser sockets of this worker and the tool calls waiting on them.
+
+        Messages for clients connected to another worker go over `bus` to
+        that worker, which sends the browser's results back the same way.
+
+        Any frame from a client counts as a sign of life, so only clients
+        that have been silent for `heartbeat_interval` are pinged, and a
+        socket silent for `idle_timeout` is closed as half-open. Each
+        connection gets a resume token; reconnecting with it picks up the
+        buffered messages and pending tool calls of the previous socket.
+
+        Resume tokens are only known to the worker that issued them. A
+        client that reconnects to another worker starts a fresh session
+        there, and the worker it left forwards the messages it was holding
+        for the client over the bus once told the client has moved.
+
+        Args:
+            reconnect_grace_seconds: Seconds undelivered messages are kept for a disconnected client
+            bus: Transport to the other workers; process-local if not given
+            heartbeat_interval: Seconds of client silence before it is pinged (0 disables heartbeats)
+            idle_timeout: Seconds of client silence before its socket is closed
+            max_connections: Open sockets allowed on this worker (0 for no limit)
+        """
+        self.active_connections: Dict[str, WebSocket] = {}
+        self.outboxes: Dict[str, ClientOutbox] = {}
+        self.reconnect_grace_seconds = reconnect_grace_seconds
+        self.bus = bus or InProcessMessageBus()
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = max(idle_timeout, heartbeat_interval)
+        self.max_connections = max_connections
+        # client_id -> monotonic time the client was last heard from
+        self.last_seen: Dict[str, float] = {}
+        # client_id -> token a reconnecting socket presents to resume the session
+        self.resume_tokens: Dict[str, str] = {}
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        # call_id -> future resolved by the browser's tool_result message
+        self.pending_calls: Dict[str, asyncio.Future] = {}
+        self.client_calls: Dict[str, set] = defaultdict(set)
+        # call_id -> (worker_id, client_id) for calls this worker runs on behalf of another worker
+        self.remote_calls: Dict[str, Tuple[str, str]] = {}
+
+        # Stats
+        self.tool_batches_sent = 0
+        self.batched_tool_calls = 0
+        self.remote_messages_sent = 0
+        self.remote_messages_received = 0
+        self.connections_rejected = 0
+        self.connections_reaped = 0
+        self.sessions_resumed = 0
+        self.heartbeats_sent = 0
+
+    async def start(self):
+        """Join the message bus and start the heartbeat."""
+        await self.bus.start(self.handle_bus_message)
+        if self.heartbeat_interval > 0:
+            self.heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def close(self):
+        """Stop the heartbeat and leave the message bus."""
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+        await self.bus.close()
+
+    async def connect(self, websocket: WebSocket, client_id: str, resume_token: Optional[str] = None) -> bool:
+        """Accept a client's socket, resuming its session if it presents the session's token.
+
+        A client id already in use is only taken over with its resume token;
+        without one, a live session is refused and a buffered one is replaced
+        by a fresh session.
+
+        Returns:
+            Whether the connection was accepted; refused sockets are closed with a reason
+        """
+        await websocket.accept()
+        token = self.resume_tokens.get(client_id)
+        resumed = token is not None and resume_token is not None and secrets.compare_digest(token, resume_token)
+        if client_id in self.active_connections and not resumed:
+            await self._refuse(websocket, client_id, CLOSE_POLICY_VIOLATION, "Client id in use")
+            return False
+        if (self.max_connections and client_id not in self.active_connections
+                and len(self.active_connections) >= self.max_connections):
+            await self._refuse(websocket, client_id, CLOSE_TRY_AGAIN_LATER, "Server busy",
+                               retry_after=REJECT_RETRY_AFTER_SECONDS)
+            return False
+
+        if client_id in self.outboxes and not resumed:
+            # The previous session cannot be resumed without its token
+            self._expire(client_id)
+        previous = self.active_connections.get(client_id)
+        if previous is not None and previous is not websocket:
+            asyncio.create_task(self._close_socket(previous, CLOSE_GOING_AWAY, "Resumed on another connection"))
+        self.active_connections[client_id] = websocket
+        self.last_seen[client_id] = time.monotonic()
+
+        outbox = self.outboxes.get(client_id)
+        if outbox is None:
+            outbox = self.outboxes[client_id] = ClientOutbox(client_id)
+        elif outbox.depth:
+            logger.info("Redelivering %d buffered messages to client %s", outbox.depth, client_id)
+        if resumed:
+            self.sessions_resumed += 1
+            WS_CONNECTION_EVENTS.inc(event="resumed")
+        token = self.resume_tokens[client_id] = secrets.token_urlsafe(16)
+        # Goes out ahead of anything buffered, so the client has the new token first
+        outbox.retry.appendleft((time.perf_counter(), {
+            "type": "welcome",
+            "resumed": resumed,
+            "resume_token": token,
+            "heartbeat_interval": self.heartbeat_interval,
+            "idle_timeout": self.idle_timeout,
+        }))
+        outbox.attach(websocket)
+        self.bus.claim(client_id)
+        WS_CONNECTION_EVENTS.inc(event="connected")
+        logger.info("Client %s connected%s", client_id, " (resumed)" if resumed else "")
+        return True
+
+    async def _refuse(self, websocket: WebSocket, client_id: str, code: int, reason: str,
+                      retry_after: Optional[float] = None):
+        self.connections_rejected += 1
+        WS_CONNECTION_EVENTS.inc(event="rejected")
+        logger.warning("Refused connection from client %s: %s", client_id, reason)
+        try:
+            await websocket.send_text(json.dumps({"type": "rejected", "reason": reason, "retry_after": retry_after}))
+        except Exception:
+            pass
+        await self._close_socket(websocket, code, reason)
+
+    @staticmethod
+    async def _close_socket(websocket: WebSocket, code: int, reason: str):
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), 5)
+        except Exception as e:
+            logger.debug("Closing socket failed: %s", e)
+
+    def touch(self, client_id: str):
+        """Note that a frame arrived from the client."""
+        if client_id in self.last_seen:
+            self.last_seen[client_id] = time.monotonic()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(min(self.heartbeat_interval, self.idle_timeout / 2))
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error("Error in WebSocket heartbeat: %s", e)
+
+    def heartbeat(self):
+        """Ping clients that have gone quiet and close the sockets of those silent too long."""
+        now = time.monotonic()
+        for client_id, websocket in list(self.active_connections.items()):
+            silent = now - self.last_seen.get(client_id, now)
+            if silent >= self.idle_timeout:
+                logger.info("Closing socket of client %s, silent for %.0fs", client_id, silent)
+                self.connections_reaped += 1
+                WS_CONNECTION_EVENTS.inc(event="reaped")
+                # A half-open socket may never report its close, so detach it here
+                self.disconnect(client_id, websocket)
+                asyncio.create_task(self._close_socket(websocket, CLOSE_GOING_AWAY, "Idle timeout"))
+            elif silent >= self.heartbeat_interval:
+                outbox = self.outboxes.get(client_id)
+                if outbox is not None and not outbox.queue.full():
+                    outbox.enqueue({"type": "ping"})
+                    self.heartbeats_sent += 1
+
+    def disconnect(self, client_id: str, websocket: Optional[WebSocket] = None):
+        """Detach a client's socket, keeping its outbox for the reconnect grace window.
+
+        Args:
+            client_id: Client whose socket closed
+            websocket: The socket that closed; ignored if the client has already reconnected on a new one
+        """
+        if websocket is not None and self.active_connections.get(client_id) is not websocket:
+            return
+
+        if client_id in self.active_connections:
+            del self.active_connections[client_id]
+            self.last_seen.pop(client_id, None)
+            logger.info("Client %s disconnected", client_id)
+
+        outbox = self.outboxes.get(client_id)
+        if outbox is None:
+            return
+        outbox.detach()
+        if self.reconnect_grace_seconds > 0:
+            outbox.expiry_handle = asyncio.get_running_loop().call_later(
+                self.reconnect_grace_seconds, self._expire, client_id
+            )
+        else:
+            self._expire(client_id)
+
+    def _expire(self, client_id: str):
+        """Drop a client that did not reconnect within the grace window."""
+        outbox = self.outboxes.pop(client_id, None)
+        if outbox:
+            outbox.detach()
+            if outbox.expiry_handle:
+                outbox.expiry_handle.cancel()
+            if outbox.depth:
+                logger.warning("Dropped %d undelivered messages for client %s", outbox.depth, client_id)
+        self.resume_tokens.pop(client_id, None)
+        self.bus.release(client_id)
+
+        # Tell other workers their calls on this client will not complete
+        for call_id, (worker_id, owner) in list(self.remote_calls.items()):
+            if owner == client_id:
+                del self.remote_calls[call_id]
+                self.bus.reply(worker_id, {"id": call_id, "success": False, "error": f"Client {client_id} disconnected"})
+
+        # Fail any tool calls still waiting on this client
+        for call_id in self.client_calls.pop(client_id, set()):
+            future = self.pending_calls.get(call_id)
+            if future and not future.done():
+                future.set_exception(ToolCallError(f"Client {client_id} disconnected"))
+
+    def send(self, client_id: str, message: Dict[str, Any]):
+        """Queue a message on the client's outbox, or publish it to the worker holding the client.
+
+        A client waiting out its reconnect grace window may have reconnected
+        to another worker, so its messages go over the bus, which knows
+        where the client is now.
+
+        Raises:
+            ToolCallError: If the client is unknown or its outbox is full
+        """
+        outbox = self.outboxes.get(client_id)
+        if outbox is not None and outbox.websocket is not None:
+            outbox.enqueue(message)
+        elif self.bus.publish(client_id, message):
+            self.remote_messages_sent += 1
+        elif outbox is not None:
+            # The bus is unreachable; hold the message for the client to reconnect here
+            outbox.enqueue(message)
+        else:
+            raise ToolCallError(f"No browser connected for client {client_id}")
+
+    def handle_bus_message(self, envelope: Dict[str, Any]):
+        """Handle an envelope the message bus delivered to this worker."""
+        kind = envelope.get("kind")
+        message = envelope.get("message") or {}
+        if kind == "result":
+            self.resolve_tool_result(message)
+        elif kind == "deliver":
+            self._deliver_remote(envelope["client_id"], message, envelope["reply_to"])
+        elif kind == "undeliverable":
+            self._fail_calls(_call_ids(message), f"No browser connected for client {envelope.get('client_id')}")
+        elif kind == "moved":
+            self._hand_over(envelope["client_id"])
+
+    def _hand_over(self, client_id: str):
+        """Let go of a client that connected to another worker.
+
+        Messages still waiting in its outbox are published to the new
+        worker. Calls that already went out on the old socket will not be
+        answered there, so they fail right away.
+        """
+        websocket = self.active_connections.pop(client_id, None)
+        self.last_seen.pop(client_id, None)
+        if websocket is not None:
+            asyncio.create_task(self._close_socket(websocket, CLOSE_GOING_AWAY, "Connected to another worker"))
+        self.resume_tokens.pop(client_id, None)
+        self.bus.release(client_id)
+
+        forwarded = set()
+        outbox = self.outboxes.pop(client_id, None)
+        if outbox is not None:
+            outbox.detach()
+            if outbox.expiry_handle:
+                outbox.expiry_handle.cancel()
+            waiting = [message for _, message in outbox.retry]
+            while not outbox.queue.empty():
+                waiting.append(outbox.queue.get_nowait()[1])
+            sent = 0
+            for message in waiting:
+                if message.get("type") in ("welcome", "ping"):
+                    continue
+                if self.bus.publish(client_id, message):
+                    sent += 1
+                    forwarded.update(_call_ids(message))
+            self.remote_messages_sent += sent
+            if sent:
+                logger.info("Client %s moved to another worker, forwarded %d messages", client_id, sent)
+
+        error = f"Client {client_id} reconnected to another worker"
+        for call_id, (worker_id, owner) in list(self.remote_calls.items()):
+            if owner == client_id and call_id not in forwarded:
+                del self.remote_calls[call_id]
+                self.bus.reply(worker_id, {"id": call_id, "success": False, "error": error})
+        self._fail_calls([call_id for call_id in self.client_calls.get(client_id, ()) if call_id not in forwarded], error)
+
+    def _deliver_remote(self, client_id: str, message: Dict[str, Any], reply_to: str):
+        """Queue a message another worker published for a client connected here."""
+        self.remote_messages_received += 1
+        call_ids = _call_ids(message)
+        if message.get("type") == "tool_cancel":
+            self.remote_calls.pop(message.get("id"), None)
+
+        outbox = self.outboxes.get(client_id)
+        try:
+            if outbox is None:
+                raise ToolCallError(f"No browser connected for client {client_id}")
+            outbox.enqueue(message)
+        except ToolCallError as e:
+            for call_id in call_ids:
+                self.bus.reply(reply_to, {"id": call_id, "success": False, "error": str(e)})
+            return
+
+        for call_id in call_ids:
+            self.remote_calls[call_id] = (reply_to, client_id)
+
+    def _fail_calls(self, call_ids: List[str], error: str):
+        for call_id in call_ids:
+            future = self.pending_calls.get(call_id)
+            if future and not future.done():
+                future.set_exception(ToolCallError(error))
+
+    async def call_tool(self, client_id: str, tool_name: str, args: Dict[str, Any],
+                        timeout: float = DEFAULT_TOOL_TIMEOUT,
+                        batcher: Optional[ToolBatcher] = None, concurrent: bool = False) -> str:
+        """Send a tool call to the client and wait for its result.
+
+        Args:
+            client_id: Client that should execute the tool
+            tool_name: Name of the frontend tool
+            args: Tool arguments
+            timeout: Seconds to wait for the result before cancelling the call
+            batcher: Send the call as part of this batcher's next frame instead of on its own
+            concurrent: Whether the call may run alongside adjacent concurrent calls in a batch
+
+        Returns:
+            The result reported by the browser
+
+        Raises:
+            ToolCallError: If the client is not connected, the tool failed or timed out
+        """
+        call_id = str(uuid.uuid4())
+        if batcher is None:
+            self.send(client_id, {
+                "type": "tool_call",
+                "id": call_id,
+                "tool": tool_name,
+                "args": args,
+                "timestamp": datetime.now().isoformat()
+            })
+            logger.debug("Queued tool %s (%s) for client %s", tool_name, call_id, client_id)
+            sent = None
+        else:
+            sent = batcher.add({
+                "id": call_id,
+                "tool": tool_name,
+                "args": args,
+                "concurrent": concurrent
+            }, timeout)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending_calls[call_id] = future
+        self.client_calls[client_id].add(call_id)
+
+        try:
+            if sent is not None:
+                # Results of a batch arrive together, so wait as long as the whole batch may take
+                deadline = await sent
+                timeout = deadline - loop.time()
+            return await asyncio.wait_for(future, max(timeout, 0))
+        except asyncio.TimeoutError:
+            self._cancel_call(client_id, call_id)
+            raise ToolTimeoutError(f"{tool_name} timed out after {round(timeout, 1):g}s")
+        except asyncio.CancelledError:
+            self._cancel_call(client_id, call_id)
+            raise
+        finally:
+            self.pending_calls.pop(call_id, None)
+            calls = self.client_calls.get(client_id)
+            if calls is not None:
+                calls.discard(call_id)
+                if not calls:
+                    del self.client_calls[client_id]
+
+    def _cancel_call(self, client_id: str, call_id: str):
+        """Tell the client to drop a call nobody is waiting for anymore."""
+        try:
+            self.send(client_id, {"type": "tool_cancel", "id": call_id})
+        except ToolCallError as e:
+            logger.warning("Failed to cancel tool call %s for client %s: %s", call_id, client_id, e)
+
+    def resolve_tool_result(self, message: Dict[str, Any]):
+        """Complete a pending tool call with the result reported by the browser.
+
+        Results of calls another worker sent are passed back to it.
+        """
+        remote = self.remote_calls.pop(message.get("id"), None)
+        if remote is not None:
+            self.bus.reply(remote[0], message)
+            return
+
+        future = self.pending_calls.get(message.get("id"))
+        if future is None or future.done():
+            # Late result for a call that already timed out or was cancelled
+            return
+
+        if message.get("success"):
+            future.set_result(str(message.get("result", "")))
+        else:
+            future.set_exception(ToolCallError(message.get("error") or "Tool failed"))
+
+    def resolve_tool_batch_result(self, message: Dict[str, Any]):
+        """Complete the calls of a tool batch from the browser's aggregated result frame."""
+        for result in message.get("results") or []:
+            self.resolve_tool_result(result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get connection and outbound queue statistics."""
+        return {
+            "active_connections": len(self.active_connections),
+            "buffered_clients": len(self.outboxes) - len(self.active_connections),
+            "pending_tool_calls": len(self.pending_calls),
+            "queue_depth": sum(outbox.depth for outbox in self.outboxes.values()),
+            "frames_sent": sum(outbox.frames_sent for outbox in self.outboxes.values()),
+            "messages_sent": sum(outbox.messages_sent for outbox in self.outboxes.values()),
+            "messages_dropped": sum(outbox.messages_dropped for outbox in self.outboxes.values()),
+            "tool_batches_sent": self.tool_batches_sent,
+            "avg_calls_per_batch": (
+                round(self.batched_tool_calls / self.tool_batches_sent, 2)
+                if self.tool_batches_sent else 0.0
+            ),
+            "remote_messages_sent": self.remote_messages_sent,
+            "remote_messages_received": self.remote_messages_received,
+            "remote_tool_calls": len(self.remote_calls),
+            "max_connections": self.max_connections,
+            "connections_rejected": self.connections_rejected,
+            "connections_reaped": self.connections_reaped,
+            "sessions_resumed": self.sessions_resumed,
+            "heartbeats_sent": self.heartbeats_sent,
+            "bus": self.bus.get_stats(),
+        }
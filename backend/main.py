@@ -1,24 +1,70 @@
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field   
-from typing import Dict, Any, Union, Optional, List
+from typing import Dict, Any, Union, Optional, List, Callable
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, BaseMessage
 from langchain_core.tools import tool
-from langgraph.prebuilt import create_react_agent
-from langgraph.managed import IsLastStep, RemainingSteps
 import json
 import dotenv
 import asyncio
-import uuid
-from datetime import datetime, timedelta
-from collections import defaultdict, deque
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 
 dotenv.load_dotenv()
 
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Local modules read their settings from the environment at import time
+from scheduler import AgentScheduler, SchedulerFullError
+from coalescer import RequestCoalescer, RequestSupersededError
+from connections import ConnectionManager, ToolBatcher, ToolCallError, ToolTimeoutError, DEFAULT_TOOL_TIMEOUT
+from message_bus import create_message_bus
+from session_store import SessionStore, InMemorySessionStore, MessageRecord, create_session_store
+from prompts import PromptAssembler
+from workflows import PlannedCall, create_default_registry
+from plan_cache import PlanCache
+from agent_factory import AgentFactory, AgentUnavailableError, DEFAULT_MODEL
+from model_router import ModelRouter
+from budget import RequestBudget, current_budget
+from tracing import TraceRecorder, RunTrace, current_trace
+from composite import COMPOSITE_TOOLS, FormField, SequenceAction, expand_actions, action_wait_ms, final_path
+from page_model import PageIndex, PageCursor, current_page, normalize_path, DEFAULT_FRONTEND_SRC
+from metrics import (
+    REGISTRY, STAGE_SECONDS, TOOL_CALL_SECONDS, TOOL_CALLS, REQUESTS, REQUEST_TOKENS, LLM_TOKENS
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run background tasks while the app is up and persist memory on shutdown.
+
+    The agent is built and warmed in the background, so the server answers
+    /health right away and /ready reports when queries can be served.
+    """
+    await manager.start()
+    tasks = [
+        asyncio.create_task(periodic_memory_cleanup()),
+        asyncio.create_task(periodic_memory_flush()),
+        asyncio.create_task(agent_factory.warm_up(model_router.models())),
+    ]
+    logger.info("Background memory cleanup task started")
+    yield
+    for task in tasks:
+        task.cancel()
+    await manager.close()
+    trace_recorder.close()
+    # Persist buffered memory writes before the worker exits
+    memory_manager.store.close()
+
 # Initialize FastAPI app
-app = FastAPI(title="Client-Side Tool Agent", version="1.0.0")
+app = FastAPI(title="Client-Side Tool Agent", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -29,440 +75,751 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.tool_queue: List[Dict[str, Any]] = []
-
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
-        self.active_connections[client_id] = websocket
-        print(f"Client {client_id} connected")
-
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
-            print(f"Client {client_id} disconnected")
-
-    def queue_tool_for_client(self, client_id: str, tool_name: str, args: Dict[str, Any]):
-        """Queue tool execution request for frontend client (thread-safe)"""
-        tool_data = {
-            "client_id": client_id,
-            "tool": tool_name,
-            "args": args,
-            "timestamp": datetime.now().isoformat()
-        }
-        self.tool_queue.append(tool_data)
-        print(f"Queued tool {tool_name} for client {client_id}")
-
-    async def process_tool_queue(self):
-        """Process queued tools and send via WebSocket"""
-        while self.tool_queue:
-            tool_data = self.tool_queue.pop(0)
-            client_id = tool_data["client_id"]
-            
-            if client_id in self.active_connections:
-                await self.active_connections[client_id].send_text(json.dumps({
-                    "tool": tool_data["tool"],
-                    "args": tool_data["args"],
-                    "timestamp": tool_data["timestamp"]
-                }))
-                print(f"Sent tool {tool_data['tool']} to client {client_id}")
+# Global connection manager. With several workers, the "unix" message bus
+# delivers tool calls to whichever worker holds the client's WebSocket.
+manager = ConnectionManager(
+    bus=create_message_bus(os.getenv("MESSAGE_BUS", "memory"), os.getenv("MESSAGE_BUS_SOCKET")),
+)
+
+# Client ID of the agent run executing in the current context. Each request
+# sets it in its own task, so concurrent runs never see each other's value.
+current_client_id: ContextVar[Optional[str]] = ContextVar("current_client_id", default=None)
 
-# Global connection manager
-manager = ConnectionManager()
+# Batcher that groups the current run's tool calls into one frame per agent step
+current_tool_batcher: ContextVar[Optional[ToolBatcher]] = ContextVar("current_tool_batcher", default=None)
 
-# Store current client ID for tool execution
-current_client_id = None
+# Scheduler for agent runs
+scheduler = AgentScheduler(
+    max_concurrent_runs=int(os.getenv("AGENT_MAX_CONCURRENCY", "4")),
+    max_queued_per_client=int(os.getenv("AGENT_MAX_QUEUED_PER_CLIENT", "8")),
+)
+
+# Identical requests from a client share one run
+coalescer = RequestCoalescer(
+    cancel_superseded=os.getenv("AGENT_CANCEL_SUPERSEDED", "0") == "1",
+    debounce_ms=float(os.getenv("AGENT_DEBOUNCE_MS", "0")),
+)
 
 # Memory Management System
 class MemoryManager:
-    def __init__(self, max_messages_per_session: int = 20, session_timeout_hours: int = 1):
+    def __init__(self, max_messages_per_session: int = 100, session_timeout_hours: int = 1,
+                 token_budget: int = 2000, summary_token_budget: int = 300,
+                 store: Optional[SessionStore] = None):
         """
         Initialize memory manager for storing conversation history.
         
         Args:
             max_messages_per_session: Maximum number of messages to keep per session
             session_timeout_hours: Hours after which a session expires
+            token_budget: Estimated tokens of recent history sent with each request
+            summary_token_budget: Estimated tokens of summary kept for older turns
+            store: Session storage backend; defaults to process-local memory
         """
         self.max_messages_per_session = max_messages_per_session
         self.session_timeout_hours = session_timeout_hours
-        self.sessions: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
-            'messages': deque(maxlen=max_messages_per_session),
-            'last_activity': datetime.now(),
-            'session_id': None
-        })
+        self.store = store or InMemorySessionStore(
+            max_messages_per_session, session_timeout_hours * 3600, token_budget, summary_token_budget
+        )
     
-    def get_or_create_session(self, client_id: str) -> str:
+    async def get_or_create_session(self, client_id: str) -> str:
         """Get existing session or create new one for client."""
-        session_data = self.sessions[client_id]
-        
-        # Check if session has expired
-        if (datetime.now() - session_data['last_activity']).total_seconds() > (self.session_timeout_hours * 3600):
-            # Session expired, create new one
-            session_data['messages'].clear()
-            session_data['session_id'] = str(uuid.uuid4())
-        
-        # Create session ID if it doesn't exist
-        if not session_data['session_id']:
-            session_data['session_id'] = str(uuid.uuid4())
-        
-        # Update last activity
-        session_data['last_activity'] = datetime.now()
-        
-        return session_data['session_id']
+        return await self.store.run(self.store.get_or_create_session, client_id)
     
-    def add_message(self, client_id: str, message: Union[HumanMessage, AIMessage, SystemMessage]):
+    async def add_message(self, client_id: str, message: Union[HumanMessage, AIMessage]):
         """Add a message to the client's conversation history."""
-        session_data = self.sessions[client_id]
-        session_data['messages'].append({
-            'type': message.__class__.__name__,
-            'content': message.content,
-            'timestamp': datetime.now().isoformat()
-        })
-        session_data['last_activity'] = datetime.now()
+        await self.store.run(self.store.append_message, client_id, MessageRecord(message))
     
-    def get_conversation_history(self, client_id: str) -> List[Union[HumanMessage, AIMessage, SystemMessage]]:
-        """Get conversation history for a client as LangChain messages."""
-        session_data = self.sessions[client_id]
-        messages = []
-        
-        for msg_data in session_data['messages']:
-            if msg_data['type'] == 'HumanMessage':
-                messages.append(HumanMessage(content=msg_data['content']))
-            elif msg_data['type'] == 'AIMessage':
-                messages.append(AIMessage(content=msg_data['content']))
-            elif msg_data['type'] == 'SystemMessage':
-                messages.append(SystemMessage(content=msg_data['content']))
-        
-        return messages
+    async def get_conversation_history(self, client_id: str) -> List[Union[HumanMessage, AIMessage]]:
+        """Get conversation history for a client as LangChain messages.
+
+        The stored message objects are shared between requests rather than copied.
+        """
+        return [record.message for record in await self.store.run(self.store.get_messages, client_id)]
     
-    def get_conversation_summary(self, client_id: str) -> str:
+    async def get_rolling_summary(self, client_id: str) -> str:
+        """Get the running summary of turns that no longer fit the history budget."""
+        return await self.store.run(self.store.get_summary, client_id)
+    
+    async def get_conversation_summary(self, client_id: str) -> str:
         """Get a brief summary of the conversation for context."""
-        session_data = self.sessions[client_id]
-        messages = list(session_data['messages'])
+        records = await self.store.run(self.store.get_messages, client_id)
         
-        if not messages:
+        if not records:
             return "No previous conversation history."
         
         # Get last few messages for context
-        recent_messages = messages[-6:] if len(messages) > 6 else messages
+        recent_records = records[-6:]
         
         summary_parts = []
-        for msg in recent_messages:
-            if msg['type'] == 'HumanMessage':
-                summary_parts.append(f"User: {msg['content'][:100]}...")
-            elif msg['type'] == 'AIMessage':
-                summary_parts.append(f"Assistant: {msg['content'][:100]}...")
+        for record in recent_records:
+            if isinstance(record.message, HumanMessage):
+                summary_parts.append(f"User: {record.content[:100]}...")
+            elif isinstance(record.message, AIMessage):
+                summary_parts.append(f"Assistant: {record.content[:100]}...")
         
         return "Recent conversation:\n" + "\n".join(summary_parts)
     
-    def clear_session(self, client_id: str):
+    async def clear_session(self, client_id: str):
         """Clear conversation history for a client."""
-        if client_id in self.sessions:
-            self.sessions[client_id]['messages'].clear()
-            self.sessions[client_id]['session_id'] = str(uuid.uuid4())
+        await self.store.run(self.store.clear_session, client_id)
     
-    def cleanup_expired_sessions(self):
+    async def cleanup_expired_sessions(self):
         """Remove expired sessions to free memory."""
-        current_time = datetime.now()
-        expired_clients = []
-        
-        for client_id, session_data in self.sessions.items():
-            if (current_time - session_data['last_activity']).total_seconds() > (self.session_timeout_hours * 3600):
-                expired_clients.append(client_id)
-        
-        for client_id in expired_clients:
-            del self.sessions[client_id]
-            print(f"Cleaned up expired session for client: {client_id}")
+        removed = await self.store.run(self.store.cleanup_expired)
+        if removed:
+            logger.info("Cleaned up %d expired sessions", removed)
+
+# Deterministic workflows that bypass the LLM
+WORKFLOW_FAST_PATH = os.getenv("WORKFLOW_FAST_PATH", "1") == "1"
+workflow_registry = create_default_registry()
+
+# System prompt, built once at startup
+prompt_assembler = PromptAssembler()
+
+# Opt-in recording of every agent run, for replay with replay.py
+trace_recorder = TraceRecorder(
+    os.getenv("AGENT_TRACE_PATH") or None,
+    max_bytes=int(os.getenv("AGENT_TRACE_MAX_BYTES", str(50 * 1024 * 1024))),
+    backups=int(os.getenv("AGENT_TRACE_BACKUPS", "3")),
+)
+
+# Index of the website's pages and their elements, used to check selectors before dispatch
+SELECTOR_VALIDATION = os.getenv("SELECTOR_VALIDATION", "1") == "1"
+page_index = PageIndex()
+page_index.load_frontend(os.getenv("PAGE_MODEL_SOURCE") or DEFAULT_FRONTEND_SRC)
+
+# Global cache of answers and tool-call plans for repeated queries
+plan_cache = PlanCache(
+    max_entries=int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "512")),
+    ttl_seconds=float(os.getenv("PLAN_CACHE_TTL_SECONDS", "3600")),
+)
 
 # Global memory manager
-memory_manager = MemoryManager()
+MAX_MESSAGES_PER_SESSION = int(os.getenv("MEMORY_MAX_MESSAGES", "100"))
+SESSION_TIMEOUT_HOURS = float(os.getenv("MEMORY_SESSION_TIMEOUT_HOURS", "1"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("MEMORY_SUMMARY_TOKEN_BUDGET", "300"))
+memory_manager = MemoryManager(
+    max_messages_per_session=MAX_MESSAGES_PER_SESSION,
+    session_timeout_hours=SESSION_TIMEOUT_HOURS,
+    store=create_session_store(
+        os.getenv("MEMORY_BACKEND", "memory"),
+        MAX_MESSAGES_PER_SESSION,
+        SESSION_TIMEOUT_HOURS * 3600,
+        token_budget=HISTORY_TOKEN_BUDGET,
+        summary_token_budget=SUMMARY_TOKEN_BUDGET,
+        sqlite_path=os.getenv("MEMORY_SQLITE_PATH"),
+        max_sessions=int(os.getenv("MEMORY_MAX_SESSIONS", "10000")),
+    ),
+)
+
+# Current state read on every /metrics scrape
+REGISTRY.gauge("ws_active_connections", "Open WebSocket connections", lambda: len(manager.active_connections))
+REGISTRY.gauge("ws_queue_depth", "Messages waiting in client outboxes",
+               lambda: sum(outbox.depth for outbox in manager.outboxes.values()))
+REGISTRY.gauge("ws_pending_tool_calls", "Tool calls waiting for a browser result", lambda: len(manager.pending_calls))
+REGISTRY.gauge("scheduler_in_flight_runs", "Agent runs executing", lambda: scheduler.in_flight)
+REGISTRY.gauge("scheduler_queue_depth", "Agent runs waiting for a slot", lambda: scheduler.queue_depth)
+REGISTRY.gauge("memory_sessions", "Live conversation sessions",
+               lambda: memory_manager.store.approximate_session_count())
 
 # Request/Response models
 class AgentRequest(BaseModel):
     query: str
     client_id: Optional[str] = None
+    # Path of the page the client is on
+    page: Optional[str] = None
 
 class AgentResponse(BaseModel):
     content: str = Field(..., description="Response to the user's query")
 
 
-# Define tools - These will queue WebSocket messages for frontend
+# Per-tool result timeouts in seconds; tools with their own duration add it on top
+TOOL_TIMEOUTS: Dict[str, float] = {
+    "navigate_to_page": 5.0,
+    "take_screenshot": 15.0,
+}
+
+# Tools that only act on their own element, so adjacent calls in a batch may run together
+CONCURRENT_TOOLS = {"fill_input", "highlight_element", "get_element_text"}
+
+# Tools whose results the answer is built from; runs using them are not cached
+RESULT_DEPENDENT_TOOLS = {"get_element_text", "take_screenshot"}
+
+def call_timeout(tool_name: str, args: Dict[str, Any], extra_timeout_ms: int = 0) -> float:
+    """Seconds to wait for a call's result; a composite call gets the total of its actions.
+
+    Raises:
+        ValueError: If a composite call contains an action that is not allowed
+    """
+    if tool_name not in COMPOSITE_TOOLS:
+        return TOOL_TIMEOUTS.get(tool_name, DEFAULT_TOOL_TIMEOUT) + extra_timeout_ms / 1000
+    return sum(
+        TOOL_TIMEOUTS.get(name, DEFAULT_TOOL_TIMEOUT) + action_wait_ms(name, action_args) / 1000
+        for name, action_args in expand_actions(tool_name, args)
+    )
+
+async def dispatch_tool(tool_name: str, args: Dict[str, Any], extra_timeout_ms: int = 0) -> str:
+    """Execute a tool in the browser of the client that owns the current agent run.
+
+    Returns the browser's result, or an error description the agent can act on.
+    """
+    client_id = current_client_id.get()
+    if not client_id:
+        return f"Error: {tool_name} was not executed because no browser client is attached to this request"
+
+    # Calls that cannot succeed on the page the browser is on fail without a round trip
+    page = current_page.get()
+    if SELECTOR_VALIDATION:
+        problem = page_index.validate(tool_name, args, page.path if page else None)
+        if problem:
+            batcher = current_tool_batcher.get()
+            if batcher:
+                batcher.skip()
+            TOOL_CALLS.inc(tool=tool_name, outcome="rejected")
+            trace = current_trace.get()
+            if trace:
+                trace.tool_call(tool_name, args, 0.0, "rejected", f"Error: {problem}")
+            return f"Error: {problem}"
+    try:
+        timeout = call_timeout(tool_name, args, extra_timeout_ms)
+    except ValueError as e:
+        batcher = current_tool_batcher.get()
+        if batcher:
+            batcher.skip()
+        TOOL_CALLS.inc(tool=tool_name, outcome="rejected")
+        return f"Error: {e}"
+    if page:
+        # Later calls, including the rest of this batch, run on the page this call ends on
+        path = final_path(tool_name, args, page.path)
+        page.path = normalize_path(path) if path else None
+
+    started = time.perf_counter()
+    outcome = "error"
+    result = "Error: cancelled"
+    try:
+        result = await manager.call_tool(
+            client_id, tool_name, args, timeout=timeout,
+            batcher=current_tool_batcher.get(), concurrent=tool_name in CONCURRENT_TOOLS
+        )
+        outcome = "ok"
+        return result
+    except ToolTimeoutError as e:
+        outcome = "timeout"
+        result = f"Error: {e}"
+        return result
+    except ToolCallError as e:
+        result = f"Error: {e}"
+        return result
+    finally:
+        seconds = time.perf_counter() - started
+        TOOL_CALL_SECONDS.observe(seconds, tool=tool_name)
+        TOOL_CALLS.inc(tool=tool_name, outcome=outcome)
+        trace = current_trace.get()
+        if trace:
+            trace.tool_call(tool_name, args, seconds, outcome, result)
+
+# Define tools - These are executed by the frontend over the WebSocket
 @tool
-def highlight_element(selector: str, duration: int = 2000) -> str:
+async def highlight_element(selector: str, duration: int = 2000) -> str:
     """Highlight an element on the page for a specified duration.
     
     Args:
         selector: CSS selector for the element to highlight
         duration: Duration in milliseconds to highlight the element
     """
-    if current_client_id:
-        manager.queue_tool_for_client(
-            current_client_id, 
-            "highlight_element", 
-            {"selector": selector, "duration": duration}
-        )
-    return f"Highlighting element {selector} for {duration}ms"
+    return await dispatch_tool("highlight_element", {"selector": selector, "duration": duration}, extra_timeout_ms=duration)
 
 @tool
-def fill_input(selector: str, value: str) -> str:
+async def fill_input(selector: str, value: str) -> str:
     """Fill an input field with a specified value.
     
     Args:
         selector: CSS selector for the input element
         value: Value to fill in the input field
     """
-    if current_client_id:
-        manager.queue_tool_for_client(
-            current_client_id, 
-            "fill_input", 
-            {"selector": selector, "value": value}
-        )
-    return f"Filling input {selector} with value '{value}'"
+    return await dispatch_tool("fill_input", {"selector": selector, "value": value})
 
 @tool   
-def navigate_to_page(path: str) -> str:
+async def navigate_to_page(path: str) -> str:
     """Navigate to a specified page.
     
     Args:
         path: Path to navigate to
     """
-    if current_client_id:
-        manager.queue_tool_for_client(
-            current_client_id, 
-            "navigate_to_page", 
-            {"path": path}
-        )
-    return f"Navigating to {path}"
+    return await dispatch_tool("navigate_to_page", {"path": path})
 
 @tool
-def click_element(selector: str) -> str:
+async def click_element(selector: str) -> str:
     """Click an element on the page.
     
     Args:
         selector: CSS selector for the element to click
     """
-    if current_client_id:
-        manager.queue_tool_for_client(
-            current_client_id, 
-            "click_element", 
-            {"selector": selector}
-        )
-    return f"Clicking element {selector}"
+    return await dispatch_tool("click_element", {"selector": selector})
 
 @tool
-def wait_for_element(selector: str, timeout: int = 5000) -> str:
+async def wait_for_element(selector: str, timeout: int = 5000) -> str:
     """Wait for an element to appear on the page.
     
     Args:
         selector: CSS selector for the element to wait for
         timeout: Timeout in milliseconds
     """
-    if current_client_id:
-        manager.queue_tool_for_client(
-            current_client_id, 
-            "wait_for_element", 
-            {"selector": selector, "timeout": timeout}
-        )
-    return f"Waiting for element {selector} with timeout {timeout}ms"
+    return await dispatch_tool("wait_for_element", {"selector": selector, "timeout": timeout}, extra_timeout_ms=timeout)
 
 @tool
-def scroll_to_element(selector: str) -> str:
+async def scroll_to_element(selector: str) -> str:
     """Scroll to an element on the page.
     
     Args:
         selector: CSS selector for the element to scroll to
     """
-    if current_client_id:
-        manager.queue_tool_for_client(
-            current_client_id, 
-            "scroll_to_element", 
-            {"selector": selector}
-        )
-    return f"Scrolling to element {selector}"
+    return await dispatch_tool("scroll_to_element", {"selector": selector})
 
 @tool
-def get_element_text(selector: str) -> str:
+async def get_element_text(selector: str) -> str:
     """Get text content from an element.
     
     Args:
         selector: CSS selector for the element
     """
-    if current_client_id:
-        manager.queue_tool_for_client(
-            current_client_id, 
-            "get_element_text", 
-            {"selector": selector}
-        )
-    return f"Getting text from element {selector}"
+    return await dispatch_tool("get_element_text", {"selector": selector})
 
 @tool
-def take_screenshot(filename: str = None) -> str:
+async def take_screenshot(filename: str = None) -> str:
     """Take a screenshot of the current page.
     
     Args:
         filename: Optional filename for the screenshot
     """
-    if current_client_id:
-        manager.queue_tool_for_client(
-            current_client_id, 
-            "take_screenshot", 
-            {"filename": filename}
-        )
-    return f"Taking screenshot{' with filename ' + filename if filename else ''}"
+    return await dispatch_tool("take_screenshot", {"filename": filename})
 
-# Initialize the LLM
-def get_llm():
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY environment variable is not set")
+# Composite tools - Several actions in one call, run by the frontend in one pass
+
+@tool
+async def fill_form(fields: List[FormField], submit_selector: Optional[str] = None) -> str:
+    """Fill several input fields at once, then optionally click a submit button.
     
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        temperature=0.1,
-        google_api_key=api_key
-    )
+    Args:
+        fields: Input fields to fill, each a CSS selector and the value to fill in
+        submit_selector: CSS selector of the button to click after all fields are filled
+    """
+    return await dispatch_tool("fill_form", {"fields": fields, "submit_selector": submit_selector})
 
-# Create the ReAct agent with tools
-try:
-    llm = get_llm()
-    tools = [
-        highlight_element, fill_input, navigate_to_page, click_element,
-        wait_for_element, scroll_to_element, get_element_text, take_screenshot
-    ]
-    agent = create_react_agent(llm, tools)
-    # Set recursion limit to prevent infinite loops
-    # agent.config = {"recursion_limit": 10}
-    print("✅ ReAct agent initialized successfully")
-except Exception as e:
-    print(f"❌ Failed to initialize agent: {e}")
-    agent = None
+@tool
+async def navigate_and_wait(path: str, selector: Optional[str] = None, timeout: int = 5000) -> str:
+    """Navigate to a page and wait until an element on it has appeared.
+    
+    Args:
+        path: Path to navigate to
+        selector: CSS selector of an element to wait for on the new page
+        timeout: Timeout in milliseconds for the element to appear
+    """
+    return await dispatch_tool("navigate_and_wait", {"path": path, "selector": selector, "timeout": timeout})
+
+@tool
+async def sequence(actions: List[SequenceAction]) -> str:
+    """Run several page actions in order in one call, stopping at the first one that fails.
+    
+    Args:
+        actions: Actions to run; each names a tool (click_element, fill_input, navigate_to_page, wait_for_element, scroll_to_element, highlight_element, get_element_text) and the arguments it takes
+    """
+    return await dispatch_tool("sequence", {"actions": actions})
+
+tools = [
+    highlight_element, fill_input, navigate_to_page, click_element,
+    wait_for_element, scroll_to_element, get_element_text, take_screenshot,
+    fill_form, navigate_and_wait, sequence
+]
+
+# Simple commands go to a fast model when ROUTER_FAST_MODEL is set, everything else to GEMINI_MODEL
+model_router = ModelRouter(DEFAULT_MODEL)
+
+# Calls the fast model fails or is slow to answer are retried on the default model
+model_fallbacks = {model_router.fast_model: DEFAULT_MODEL} if model_router.enabled else {}
+if os.getenv("LLM_FALLBACK_MODEL"):
+    model_fallbacks[DEFAULT_MODEL] = os.getenv("LLM_FALLBACK_MODEL")
+
+# Global agent factory; the ReAct agents and their model clients are built on first use
+agent_factory = AgentFactory(tools, fallbacks=model_fallbacks)
 
 @app.post("/agent", response_model=AgentResponse)
 async def agent_endpoint(request: AgentRequest):
     """Process a query through the LangGraph ReAct agent with memory."""
-    global current_client_id
-    
     try:
-        # Check if agent is initialized
-        if agent is None:
-            raise HTTPException(
-                status_code=500, 
-                detail="Agent not initialized. Please check GOOGLE_API_KEY environment variable."
+        return await coalescer.run(
+            request.client_id, request.query,
+            lambda on_token: scheduler.run(request.client_id, lambda: run_agent(request, on_token))
+        )
+    except SchedulerFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except RequestSupersededError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except AgentUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in agent endpoint: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+# References to streaming runs, which keep going if their client disconnects
+streaming_runs: set = set()
+
+@app.post("/agent/stream")
+async def agent_stream_endpoint(request: AgentRequest):
+    """Process a query like /agent, streaming the answer as Server-Sent Events.
+
+    Emits `token` events with pieces of the answer as the model generates
+    them, then a single `done` event with the complete answer, or `error`.
+    Errors raised before the first event are returned as HTTP errors.
+    Requests coalesce with identical ones from the same client like /agent,
+    and every caller sharing a run receives its token events.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            response = await coalescer.run(
+                request.client_id, request.query,
+                lambda on_token: scheduler.run(request.client_id, lambda: run_agent(request, on_token)),
+                on_token=lambda text: events.put_nowait(("token", text)),
             )
-        
-        # Set the current client ID for tool execution
-        if request.client_id:
-            current_client_id = request.client_id
-            # Get or create session for this client
-            session_id = memory_manager.get_or_create_session(request.client_id)
-            print(f"Using session {session_id} for client {request.client_id}")
-        
+            events.put_nowait(("done", response.content))
+        except Exception as e:
+            events.put_nowait(("error", e))
+
+    run = asyncio.create_task(produce())
+    streaming_runs.add(run)
+    run.add_done_callback(streaming_runs.discard)
+
+    first = await events.get()
+    if first[0] == "error":
+        e = first[1]
+        if isinstance(e, SchedulerFullError):
+            raise HTTPException(status_code=429, detail=str(e))
+        if isinstance(e, RequestSupersededError):
+            raise HTTPException(status_code=409, detail=str(e))
+        if isinstance(e, AgentUnavailableError):
+            raise HTTPException(status_code=503, detail=str(e))
+        logger.error("Error in agent stream endpoint: %s", e, exc_info=e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def stream():
+        event, data = first
+        while True:
+            if event == "error":
+                logger.error("Error in agent stream endpoint: %s", data, exc_info=data)
+                data = str(data)
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            if event != "token":
+                return
+            event, data = await events.get()
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+async def run_agent(request: AgentRequest,
+                    on_token: Optional[Callable[[str], None]] = None) -> AgentResponse:
+    """Run the agent for a single request once the scheduler grants a slot.
+
+    When trace recording is enabled the run, including a failed one, is
+    appended to the trace file.
+
+    Args:
+        request: The user's query
+        on_token: Called with each piece of the answer text as the model generates it
+    """
+    if not trace_recorder.enabled:
+        return await answer_request(request, on_token)
+
+    trace = RunTrace(request.client_id, request.query, request.page)
+    current_trace.set(trace)
+    try:
+        response = await answer_request(request, on_token)
+    except BaseException as e:
+        trace_recorder.write(trace.finish(error=repr(e)))
+        raise
+    trace_recorder.write(trace.finish(answer=response.content))
+    return response
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a stage of the current run for the latency histogram and the run's trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        trace = current_trace.get()
+        if trace:
+            trace.stage(stage, seconds)
+
+async def answer_request(request: AgentRequest,
+                         on_token: Optional[Callable[[str], None]] = None) -> AgentResponse:
+    """Answer a request by workflow, cached plan or agent run, and store the turn in memory."""
+    started = time.perf_counter()
+    # Set the current client ID for tool execution
+    current_client_id.set(request.client_id)
+    current_page.set(PageCursor(request.page))
+    if request.client_id:
+        current_tool_batcher.set(ToolBatcher(manager, request.client_id))
+        # Get or create session for this client
+        session_id = await memory_manager.get_or_create_session(request.client_id)
+        logger.debug("Using session %s for client %s", session_id, request.client_id)
+    
+    query_message = HumanMessage(content=request.query)
+    
+    # Known multi-step flows with every slot present run without the LLM
+    answer = None
+    path = "workflow"
+    if request.client_id and WORKFLOW_FAST_PATH:
+        answer = await run_workflow(request.query)
+    
+    # Repeated queries replay the plan an earlier run came up with
+    cache_key = None
+    if answer is None and request.client_id:
+        cache_key = plan_cache.key(request.query, request.page)
+        cached = plan_cache.get(cache_key) if cache_key else None
+        if cached:
+            logger.info("Replaying cached plan for query: %s", request.query)
+            path = "cache"
+            answer = await replay_plan(cached.steps, cached.answer)
+            if answer is None:
+                plan_cache.invalidate(cache_key)
+    
+    if answer is None:
+        path = "agent"
         # Get conversation history for context
         conversation_history = []
-        conversation_summary = ""
+        earlier_summary = ""
         
         if request.client_id:
-            conversation_history = memory_manager.get_conversation_history(request.client_id)
-            conversation_summary = memory_manager.get_conversation_summary(request.client_id)
-        
-        # Create system message with memory context
-        system_prompt = f"""You are a Website Interaction Agent that completes user requests by interacting with web pages.
-
-### CRITICAL RULES
-1. ALWAYS complete the user's ENTIRE request - never stop midway
-2. Execute ALL necessary steps parallelly until you fill this steps need sequencial execution.
-3. For form submissions: fill ALL fields AND click submit - this is ONE complete task
-4. Only use "Final Answer" after ALL steps are complete and verified
-5. REMEMBER previous conversations and use that context to provide better responses
-
-
-
-### Contact Form Workflow
-When filling and submitting a contact form, you MUST do ALL these steps:
-1. Navigate to contact page (/contact)
-2. Fill name field (#agent-name)
-3. Fill email field (#agent-email)
-4. Fill message field (#agent-message)
-5. Wait for submit button (#agent-submit)
-6. Click submit button
-7. Verify success
-8. Only then respond with completion message
-If any field is not provide by user ask for it and then fill it and then submit the form.
-
-### Example Workflow
-User: "Fill contact form with John Doe, john@example.com, 'Hello'"
-
-Step 1: Call navigate_to_page with "/contact"
-Step 2: Call fill_input with selector="#agent-name", value="John Doe"
-Step 3: Call fill_input with selector="#agent-email", value="john@example.com"
-Step 4: Call fill_input with selector="#agent-message", value="Hello"
-Step 5: Call wait_for_element with "#agent-submit"
-Step 6: Call click_element with "#agent-submit"
-Step 7: Final Response with tool execution summary
-
-IMPORTANT: Do not stop until ALL steps are complete!
-"""
+            with stage_timer("history_load"):
+                conversation_history = await memory_manager.get_conversation_history(request.client_id)
+                earlier_summary = await memory_manager.get_rolling_summary(request.client_id)
         
-        # Build messages list with conversation history and current query
-        messages = [SystemMessage(content=system_prompt)]
-        
-        # Add conversation history (excluding system messages to avoid duplication)
-        for msg in conversation_history:
-            if not isinstance(msg, SystemMessage):
-                messages.append(msg)
-        
-        # Add current user query
-        messages.append(HumanMessage(content=request.query))
+        # Build messages list: static prompt prefix, per-request context,
+        # conversation history and current query
+        with stage_timer("prompt_build"):
+            messages = prompt_assembler.build(
+                conversation_history,
+                query_message,
+                context={
+                    "Earlier Conversation (summarized)": earlier_summary,
+                    "Page Map": page_index.render() if SELECTOR_VALIDATION else "",
+                    "Current Page": current_page.get().path or "",
+                },
+            )
         
         initial_state = {
             "messages": messages
         }
         
-        # Run the ReAct agent with memory context
-        result = agent.invoke(initial_state)
+        # Run the ReAct agent with memory context, executing tool calls as they happen
+        model = model_router.route(request.query)
+        trace = current_trace.get()
+        if trace:
+            trace.model = model
+        produced = await stream_agent(initial_state, on_token, model)
+        answer = message_text(produced[-1].content)
         
-        # Get the last message from the result
-        last_message = result["messages"][-1]
-        print("Agent response:", last_message.content)
-        
-        # Store the conversation in memory
-        if request.client_id:
+        # Partial answers from a run that hit its budget are not worth replaying
+        budget = current_budget.get()
+        steps = cacheable_plan(produced) if not (budget and budget.exhausted) else None
+        if cache_key and steps is not None and answer:
+            plan_cache.put(cache_key, answer, steps)
+    logger.debug("Agent response: %s", answer)
+    
+    # Store the conversation in memory
+    if request.client_id:
+        with stage_timer("memory_write"):
             # Add user message to memory
-            memory_manager.add_message(request.client_id, HumanMessage(content=request.query))
+            await memory_manager.add_message(request.client_id, query_message)
             # Add AI response to memory
-            memory_manager.add_message(request.client_id, AIMessage(content=last_message.content))
-        
-        # Process any queued tools for the current client
-        if current_client_id:
-            await manager.process_tool_queue()
-        
-        return AgentResponse(content=last_message.content)
-            
-    except Exception as e:
-        print(f"Error in agent endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+            await memory_manager.add_message(request.client_id, AIMessage(content=answer))
+    
+    REQUESTS.inc(path=path)
+    trace = current_trace.get()
+    if trace:
+        trace.path = path
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage="run")
+    return AgentResponse(content=answer)
+
+async def run_workflow(query: str) -> Optional[str]:
+    """Run a registered workflow matching `query` without calling the LLM.
+
+    All of the workflow's tool calls are dispatched at once, so they reach
+    the browser in a single batch and run there in order.
+
+    Returns:
+        The response for the user, or None if no workflow matches
+    """
+    matched = workflow_registry.match(query)
+    if matched is None:
+        return None
+
+    workflow, slots = matched
+    logger.info("Running workflow %s without the LLM", workflow.name)
+    plan = workflow.plan(slots)
+    batcher = current_tool_batcher.get()
+    if batcher:
+        batcher.expect(len(plan))
+    results = await asyncio.gather(*(
+        dispatch_tool(tool_name, args, extra_timeout_ms=args.get("timeout", 0))
+        for tool_name, args in plan
+    ))
+
+    errors = [result for result in results if result.startswith("Error:")]
+    if errors:
+        return f"I couldn't complete the {workflow.name.replace('_', ' ')}. " + " ".join(errors)
+    return workflow.response.format(**slots)
+
+async def replay_plan(steps: List[List[PlannedCall]], answer: str) -> Optional[str]:
+    """Run a cached plan step by step, each step as one batch.
+
+    Returns:
+        The cached answer, or None if a tool failed and the agent has to handle the query
+    """
+    batcher = current_tool_batcher.get()
+    for step in steps:
+        if batcher:
+            batcher.expect(len(step))
+        results = await asyncio.gather(*(
+            dispatch_tool(tool_name, args, extra_timeout_ms=args.get("timeout", 0))
+            for tool_name, args in step
+        ))
+        if any(result.startswith("Error:") for result in results):
+            logger.info("Cached plan failed, running the agent instead")
+            return None
+    return answer
+
+def cacheable_plan(messages: List[BaseMessage]) -> Optional[List[List[PlannedCall]]]:
+    """Extract the tool calls of a run, one list per step, if the run can be replayed.
+
+    Runs where a tool failed or whose answer depends on what a tool read are not replayable.
+    """
+    steps = []
+    for message in messages:
+        if isinstance(message, ToolMessage):
+            if str(message.content).startswith("Error:"):
+                return None
+        elif isinstance(message, AIMessage) and message.tool_calls:
+            try:
+                names = [name for call in message.tool_calls for name, _ in expand_actions(call["name"], call["args"])]
+            except ValueError:
+                return None
+            if any(name in RESULT_DEPENDENT_TOOLS for name in names):
+                return None
+            steps.append([(call["name"], call["args"]) for call in message.tool_calls])
+    return steps
+
+# Stage names for the agent graph's nodes
+NODE_STAGES = {"agent": "llm_turn", "tools": "tool_step"}
+
+def message_text(content: Union[str, List[Any]]) -> str:
+    """Get the text of a message whose content may be a list of content blocks."""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block if isinstance(block, str) else block.get("text", "")
+        for block in content
+        if isinstance(block, str) or block.get("type") == "text"
+    )
+
+async def stream_agent(initial_state: Dict[str, Any],
+                       on_token: Optional[Callable[[str], None]] = None,
+                       model: Optional[str] = None) -> List[BaseMessage]:
+    """Run the agent step by step.
+
+    Tools send their calls to the browser the moment the agent emits them
+    and feed the browser's results back into the loop. All calls from one
+    agent step go out together as a single batch.
+
+    Args:
+        initial_state: Input messages for the agent
+        on_token: Called with the text of each answer chunk the model streams
+        model: Model to run the agent on; the default model if not given
+
+    Returns:
+        The messages produced by the agent, in order
+    """
+    agent = await agent_factory.get_agent(model)
+    batcher = current_tool_batcher.get()
+    # Steps, time, tokens and tool calls of this run are capped inside the graph
+    budget = RequestBudget()
+    current_budget.set(budget)
+    produced: List[BaseMessage] = []
+    config: Dict[str, Any] = {"recursion_limit": budget.recursion_limit}
+    if on_token:
+        def emit(content):
+            text = message_text(content)
+            if text:
+                on_token(text)
+        # The agent node streams its answer to this callback
+        config["configurable"] = {"on_token": emit}
+    step_started = time.perf_counter()
+    async for chunk in agent.astream(initial_state, config, stream_mode="updates"):
+        # Steps run one after another, so the time since the previous update is this node's
+        now = time.perf_counter()
+        trace = current_trace.get()
+        for node, node_update in chunk.items():
+            STAGE_SECONDS.observe(now - step_started, stage=NODE_STAGES.get(node, node))
+            if node_update and node_update.get("messages"):
+                produced.extend(node_update["messages"])
+                if trace and node == "agent":
+                    trace.llm_turn(produced[-1], now - step_started)
+                elif trace:
+                    trace.stage(NODE_STAGES.get(node, node), now - step_started)
+                tool_calls = getattr(produced[-1], "tool_calls", None)
+                if batcher and tool_calls:
+                    # Let the batch go out as soon as the step's last call is added
+                    batcher.expect(len(tool_calls))
+        step_started = now
+
+    if not produced:
+        raise RuntimeError("Agent produced no messages")
+    if budget.exhausted:
+        logger.warning("Agent run stopped early, %s budget exhausted: %s", budget.exhausted, budget.get_stats())
+
+    usage = [message.usage_metadata for message in produced
+             if isinstance(message, AIMessage) and getattr(message, "usage_metadata", None)]
+    if usage:
+        input_tokens = sum(item.get("input_tokens", 0) for item in usage)
+        output_tokens = sum(item.get("output_tokens", 0) for item in usage)
+        LLM_TOKENS.inc(input_tokens, kind="input")
+        LLM_TOKENS.inc(output_tokens, kind="output")
+        REQUEST_TOKENS.observe(input_tokens + output_tokens)
+    return produced
 
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    """WebSocket endpoint for real-time tool execution communication."""
-    await manager.connect(websocket, client_id)
+    """WebSocket endpoint for real-time tool execution communication.
+
+    A reconnecting client passes the resume token it was last given as the
+    "resume" query parameter to pick up its session.
+    """
+    if not await manager.connect(websocket, client_id, websocket.query_params.get("resume")):
+        return
     try:
         while True:
-            # Just keep the connection alive
             data = await websocket.receive_text()
+            manager.touch(client_id)
             message = json.loads(data)
             
             if message.get("type") == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
+                manager.send(client_id, {"type": "pong"})
+            elif message.get("type") == "tool_result":
+                manager.resolve_tool_result(message)
+            elif message.get("type") == "tool_batch_result":
+                manager.resolve_tool_batch_result(message)
                 
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        manager.disconnect(client_id, websocket)
     except Exception as e:
-        print(f"WebSocket error for client {client_id}: {e}")
-        manager.disconnect(client_id)
+        logger.warning("WebSocket error for client %s: %s", client_id, e)
+        manager.disconnect(client_id, websocket)
 
 @app.get("/")
 async def root():
@@ -474,44 +831,115 @@ async def health():
     """Health check endpoint for testing."""
     return {"status": "healthy", "message": "Backend is running"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness check: 503 until the agent is built and its model connection is warm or warm-up has failed."""
+    status = agent_factory.get_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """Get agent scheduler queue depth and wait time statistics."""
+    return scheduler.get_stats()
+
+@app.get("/coalescer/stats")
+async def coalescer_stats():
+    """Get how many requests joined an identical run or were superseded."""
+    return coalescer.get_stats()
+
+@app.get("/router/stats")
+async def router_stats():
+    """Get how many agent runs were routed to each model."""
+    return model_router.get_stats()
+
+@app.get("/traces/stats")
+async def trace_stats():
+    """Get how many agent runs were recorded to the trace file."""
+    return trace_recorder.get_stats()
+
+@app.get("/prompt/stats")
+async def prompt_stats():
+    """Get system prompt prefix size and average prompt size in estimated tokens."""
+    return prompt_assembler.get_stats()
+
+@app.get("/workflows/stats")
+async def workflow_stats():
+    """Get how often requests were served by a deterministic workflow."""
+    return workflow_registry.get_stats()
+
+@app.get("/page-model")
+async def page_model():
+    """Get the indexed pages, their elements and how many tool calls were rejected."""
+    return page_index.get_stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Get plan cache size and hit rate."""
+    return plan_cache.get_stats()
+
+@app.post("/cache/clear")
+async def clear_cache():
+    """Drop all cached plans."""
+    return {"message": f"Cleared {plan_cache.clear()} cached plans"}
+
+@app.get("/metrics")
+async def metrics():
+    """Expose latency histograms, counters and gauges in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/connections/stats")
+async def connection_stats():
+    """Get WebSocket connection and outbound queue statistics."""
+    return manager.get_stats()
+
 class ClearMemoryRequest(BaseModel):
     client_id: str
 
 @app.post("/memory/clear")
 async def clear_memory(request: ClearMemoryRequest):
     """Clear conversation memory for a specific client."""
-    memory_manager.clear_session(request.client_id)
+    await memory_manager.clear_session(request.client_id)
     return {"message": f"Memory cleared for client {request.client_id}"}
 
 @app.get("/memory/summary/{client_id}")
 async def get_memory_summary(client_id: str):
     """Get conversation summary for a specific client."""
-    summary = memory_manager.get_conversation_summary(client_id)
+    summary = await memory_manager.get_conversation_summary(client_id)
     return {"client_id": client_id, "summary": summary}
 
+@app.get("/memory/stats")
+async def memory_stats():
+    """Get the number of stored conversation sessions."""
+    store = memory_manager.store
+    return {"sessions": await store.run(store.session_count)}
+
 @app.post("/memory/cleanup")
 async def cleanup_memory():
     """Manually trigger cleanup of expired sessions."""
-    memory_manager.cleanup_expired_sessions()
+    await memory_manager.cleanup_expired_sessions()
     return {"message": "Memory cleanup completed"}
 
 # Background task for memory cleanup
+MEMORY_CLEANUP_INTERVAL_SECONDS = float(os.getenv("MEMORY_CLEANUP_INTERVAL_SECONDS", "60"))
+
 async def periodic_memory_cleanup():
     """Periodically clean up expired sessions."""
     while True:
         try:
-            await asyncio.sleep(3600)  # Run every hour
-            memory_manager.cleanup_expired_sessions()
-            print("Periodic memory cleanup completed")
+            # Sweeps only touch expired sessions, so they can run often
+            await asyncio.sleep(MEMORY_CLEANUP_INTERVAL_SECONDS)
+            await memory_manager.cleanup_expired_sessions()
+        except Exception as e:
+            logger.error("Error in periodic memory cleanup: %s", e)
+
+async def periodic_memory_flush():
+    """Periodically persist buffered memory writes so other workers see them."""
+    while True:
+        try:
+            await asyncio.sleep(1)
+            await memory_manager.store.run(memory_manager.store.flush)
         except Exception as e:
-            print(f"Error in periodic memory cleanup: {e}")
-
-# Start background task when the app starts
-@app.on_event("startup")
-async def startup_event():
-    """Start background tasks on app startup."""
-    asyncio.create_task(periodic_memory_cleanup())
-    print("Background memory cleanup task started")
+            logger.error("Error in periodic memory flush: %s", e)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,387 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Callable, Optional
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Socket shared by the workers of the "unix" bus
+DEFAULT_BUS_SOCKET = "/tmp/website-agent-bus.sock"
+# Largest frame accepted on the bus socket
+BUS_FRAME_LIMIT = 16 * 1024 * 1024
+
+# Receives envelopes addressed to this worker:
+#   {"kind": "deliver", "client_id", "message", "reply_to"}  a message for a client whose socket this worker holds
+#   {"kind": "result", "message"}                            a tool result for a call this worker sent
+#   {"kind": "undeliverable", "client_id", "message"}        a message no worker could take
+#   {"kind": "moved", "client_id"}                           a client this worker held connected to another worker
+BusHandler = Callable[[Dict[str, Any]], None]
+
+
+class BusRouter:
+    """Routing table shared by the workers on a bus.
+
+    Tracks which worker holds each client's WebSocket and hands every
+    envelope to the deliver callback of the worker it is addressed to. The
+    claim of the latest connection wins, so a client that reconnects to
+    another worker is routed there right away and the worker it left is
+    told with a "moved" envelope. Claims are ordered by connection time
+    rather than arrival, so workers claiming their clients again after a
+    broker failover do not take back clients that have moved on.
+    """
+
+    def __init__(self):
+        self.owners: Dict[str, str] = {}
+        # client_id -> connection time of the owner's claim
+        self.claimed_at: Dict[str, float] = {}
+        self.workers: Dict[str, BusHandler] = {}
+
+        # Stats
+        self.routed = 0
+        self.undeliverable = 0
+
+    def add_worker(self, worker_id: str, deliver: BusHandler):
+        self.workers[worker_id] = deliver
+
+    def remove_worker(self, worker_id: str, deliver: Optional[BusHandler] = None):
+        """Forget a worker and its clients, unless it has re-registered with another callback."""
+        if deliver is not None and self.workers.get(worker_id) is not deliver:
+            return
+        self.workers.pop(worker_id, None)
+        for client_id in [client_id for client_id, owner in self.owners.items() if owner == worker_id]:
+            del self.owners[client_id]
+            self.claimed_at.pop(client_id, None)
+
+    def claim(self, worker_id: str, client_id: str, since: float = 0.0):
+        """Route `client_id` to `worker_id`, whose connection from the client opened at `since`."""
+        owner = self.owners.get(client_id)
+        if owner is not None and owner != worker_id and since < self.claimed_at.get(client_id, 0.0):
+            self._moved(worker_id, client_id)
+            return
+        self.owners[client_id] = worker_id
+        self.claimed_at[client_id] = since
+        if owner is not None and owner != worker_id:
+            self._moved(owner, client_id)
+
+    def _moved(self, worker_id: str, client_id: str):
+        deliver = self.workers.get(worker_id)
+        if deliver is not None:
+            deliver({"kind": "moved", "client_id": client_id})
+
+    def release(self, worker_id: str, client_id: str):
+        if self.owners.get(client_id) == worker_id:
+            del self.owners[client_id]
+            self.claimed_at.pop(client_id, None)
+
+    def publish(self, origin: str, client_id: str, message: Dict[str, Any]) -> bool:
+        """Deliver a message to the worker holding `client_id`.
+
+        Returns:
+            False if no worker holds the client
+        """
+        deliver = self.workers.get(self.owners.get(client_id))
+        if deliver is None:
+            self.undeliverable += 1
+            return False
+        deliver({"kind": "deliver", "client_id": client_id, "message": message, "reply_to": origin})
+        self.routed += 1
+        return True
+
+    def reply(self, worker_id: str, message: Dict[str, Any]):
+        """Return a tool result to the worker that sent the call."""
+        deliver = self.workers.get(worker_id)
+        if deliver is None:
+            logger.warning("Dropped tool result %s for departed worker %s", message.get("id"), worker_id)
+            return
+        deliver({"kind": "result", "message": message})
+
+
+class MessageBus(ABC):
+    """Transport between the worker running an agent and the worker holding its client's WebSocket.
+
+    Each worker claims the clients whose sockets it accepts. Messages for a
+    client the worker does not hold are published to whichever worker
+    claimed it, and that worker replies with the browser's tool results.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    @abstractmethod
+    async def start(self, handler: BusHandler):
+        """Join the bus; `handler` is called on the event loop with each envelope for this worker."""
+
+    @abstractmethod
+    def claim(self, client_id: str):
+        """Route messages for `client_id` to this worker, which the client has just connected to."""
+
+    @abstractmethod
+    def release(self, client_id: str):
+        """Stop routing messages for `client_id` to this worker."""
+
+    @abstractmethod
+    def publish(self, client_id: str, message: Dict[str, Any]) -> bool:
+        """Send a message to the worker holding `client_id` without waiting.
+
+        Returns:
+            False if the message could not be handed to the bus
+        """
+
+    @abstractmethod
+    def reply(self, worker_id: str, message: Dict[str, Any]):
+        """Send a tool result back to the worker that published the call."""
+
+    async def close(self):
+        """Leave the bus."""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.__class__.__name__, "worker_id": self.worker_id}
+
+
+class InProcessMessageBus(MessageBus):
+    def __init__(self, router: Optional[BusRouter] = None, worker_id: Optional[str] = None):
+        """
+        Bus for a single process; the default.
+
+        Connection managers given the same router deliver to each other, so
+        several of them can share one process. Envelopes are handed over on
+        the next loop iteration, like they would be by a real transport.
+
+        Args:
+            router: Routing table to join; a private one if not given
+            worker_id: Name of this worker on the bus
+        """
+        super().__init__(worker_id)
+        self.router = router or BusRouter()
+        self.handler: Optional[BusHandler] = None
+
+    def _deliver(self, envelope: Dict[str, Any]):
+        asyncio.get_running_loop().call_soon(self.handler, envelope)
+
+    async def start(self, handler: BusHandler):
+        self.handler = handler
+        self.router.add_worker(self.worker_id, self._deliver)
+
+    def claim(self, client_id: str):
+        self.router.claim(self.worker_id, client_id, time.time())
+
+    def release(self, client_id: str):
+        self.router.release(self.worker_id, client_id)
+
+    def publish(self, client_id: str, message: Dict[str, Any]) -> bool:
+        return self.router.publish(self.worker_id, client_id, message)
+
+    def reply(self, worker_id: str, message: Dict[str, Any]):
+        self.router.reply(worker_id, message)
+
+    async def close(self):
+        self.router.remove_worker(self.worker_id, self._deliver)
+
+
+def _encode(frame: Dict[str, Any]) -> bytes:
+    return (json.dumps(frame) + "\n").encode()
+
+
+class UnixSocketMessageBus(MessageBus):
+    def __init__(self, path: str = DEFAULT_BUS_SOCKET, worker_id: Optional[str] = None,
+                 retry_delay: float = 0.2):
+        """
+        Bus between the worker processes of one machine over a Unix socket.
+
+        The first worker to take the lock file next to the socket runs the
+        broker, a BusRouter behind the socket, and every worker (the broker's
+        own included) joins it as a client. If the broker goes away the
+        remaining workers elect a new one and claim their clients again.
+        Messages for a client nobody holds come back as "undeliverable".
+
+        Frames are newline-delimited JSON.
+
+        Args:
+            path: Path of the broker's socket
+            worker_id: Name of this worker on the bus
+            retry_delay: Seconds between attempts to reach the broker
+        """
+        super().__init__(worker_id)
+        self.path = path
+        self.retry_delay = retry_delay
+        self.handler: Optional[BusHandler] = None
+        # client_id -> time the client connected, sent again with every claim after a failover
+        self.claimed: Dict[str, float] = {}
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.read_task: Optional[asyncio.Task] = None
+
+        # Broker state, set when this worker runs the broker
+        self.router: Optional[BusRouter] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        # Tasks serving the workers connected to the broker
+        self.serve_tasks: set = set()
+        self.lock_file = None
+
+        # Stats
+        self.reconnects = 0
+
+    async def _elect(self):
+        """Start the broker if no other worker is running it."""
+        if self.server is not None:
+            return
+
+        import fcntl
+
+        lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return
+
+        # Holding the lock means any socket file left behind is stale
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.lock_file = lock_file
+        self.router = BusRouter()
+        self.server = await asyncio.start_unix_server(self._serve_worker, path=self.path, limit=BUS_FRAME_LIMIT)
+        logger.info("Worker %s is running the message bus broker on %s", self.worker_id, self.path)
+
+    async def _serve_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Broker side of one worker's connection."""
+        worker_id = None
+        deliver = lambda envelope: writer.write(_encode(envelope))
+        self.serve_tasks.add(asyncio.current_task())
+        try:
+            async for line in reader:
+                frame = json.loads(line)
+                op = frame.get("op")
+                if op == "hello":
+                    worker_id = frame["worker"]
+                    self.router.add_worker(worker_id, deliver)
+                elif worker_id is None:
+                    continue
+                elif op == "claim":
+                    self.router.claim(worker_id, frame["client_id"], frame.get("since", 0.0))
+                elif op == "release":
+                    self.router.release(worker_id, frame["client_id"])
+                elif op == "publish":
+                    if not self.router.publish(worker_id, frame["client_id"], frame["message"]):
+                        deliver({"kind": "undeliverable", "client_id": frame["client_id"], "message": frame["message"]})
+                elif op == "reply":
+                    self.router.reply(frame["worker"], frame["message"])
+        except (ConnectionError, ValueError) as e:
+            logger.warning("Message bus connection from worker %s failed: %s", worker_id, e)
+        except asyncio.CancelledError:
+            # The broker is shutting down; ending normally keeps asyncio's stream server from logging it
+            pass
+        finally:
+            if worker_id is not None:
+                self.router.remove_worker(worker_id, deliver)
+            self.serve_tasks.discard(asyncio.current_task())
+            writer.close()
+
+    async def _connect(self):
+        while True:
+            await self._elect()
+            try:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.path, limit=BUS_FRAME_LIMIT)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                # Another worker holds the lock but has not started listening yet
+                await asyncio.sleep(self.retry_delay)
+
+        self._write({"op": "hello", "worker": self.worker_id})
+        for client_id, since in self.claimed.items():
+            self._write({"op": "claim", "client_id": client_id, "since": since})
+
+    async def _read_loop(self):
+        while True:
+            try:
+                async for line in self.reader:
+                    try:
+                        self.handler(json.loads(line))
+                    except Exception as e:
+                        logger.error("Error handling message bus frame: %s", e)
+            except (ConnectionError, ValueError) as e:
+                logger.warning("Message bus read failed: %s", e)
+            if self.writer:
+                self.writer.close()
+            self.writer = None
+            logger.warning("Lost connection to the message bus broker, reconnecting")
+            self.reconnects += 1
+            await self._connect()
+
+    def _write(self, frame: Dict[str, Any]) -> bool:
+        if self.writer is None or self.writer.is_closing():
+            return False
+        self.writer.write(_encode(frame))
+        return True
+
+    async def start(self, handler: BusHandler):
+        self.handler = handler
+        await self._connect()
+        self.read_task = asyncio.create_task(self._read_loop())
+
+    def claim(self, client_id: str):
+        since = self.claimed[client_id] = time.time()
+        self._write({"op": "claim", "client_id": client_id, "since": since})
+
+    def release(self, client_id: str):
+        self.claimed.pop(client_id, None)
+        self._write({"op": "release", "client_id": client_id})
+
+    def publish(self, client_id: str, message: Dict[str, Any]) -> bool:
+        return self._write({"op": "publish", "client_id": client_id, "message": message})
+
+    def reply(self, worker_id: str, message: Dict[str, Any]):
+        if not self._write({"op": "reply", "worker": worker_id, "message": message}):
+            logger.warning("Dropped tool result %s: message bus is not connected", message.get("id"))
+
+    async def close(self):
+        if self.read_task:
+            self.read_task.cancel()
+            await asyncio.gather(self.read_task, return_exceptions=True)
+            self.read_task = None
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        if self.server:
+            server, self.server = self.server, None
+            server.close()
+            # Dropping the connections makes the other workers elect a new broker
+            tasks = list(self.serve_tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await server.wait_closed()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            # Releasing the lock lets another worker take over as broker
+            self.lock_file.close()
+            self.lock_file = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats.update({
+            "connected": self.writer is not None,
+            "broker": self.server is not None,
+            "reconnects": self.reconnects,
+        })
+        if self.router is not None:
+            stats.update({
+                "workers": len(self.router.workers),
+                "routed_clients": len(self.router.owners),
+                "messages_routed": self.router.routed,
+                "messages_undeliverable": self.router.undeliverable,
+            })
+        return stats
+
+
+def create_message_bus(backend: str, path: Optional[str] = None) -> MessageBus:
+    """Create the message bus selected by `backend` ("memory" or "unix")."""
+    if backend == "memory":
+        return InProcessMessageBus()
+    if backend == "unix":
+        return UnixSocketMessageBus(path or DEFAULT_BUS_SOCKET)
+    raise ValueError(f"Unknown message bus backend: {backend}")
@@ -0,0 +1,195 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Sequence, Tuple
+import time
+
+# Default latency buckets in seconds, from sub-millisecond sends to slow LLM turns
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Buckets for estimated or reported tokens per request
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        """Monotonically increasing count, optionally split by labels."""
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        """
+        Distribution of observed values in fixed buckets, optionally split by labels.
+
+        Each observation increments a single bucket; the cumulative counts
+        Prometheus expects are only computed when rendering.
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self.series: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        """Observe the wall time spent in the block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total:g}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        """Current value read from the application whenever metrics are scraped."""
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.read():g}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """Collection of metrics rendered together in the Prometheus text format."""
+        self.metrics: List[Any] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        metric = Gauge(name, help, read)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # A failing gauge must not break the whole scrape
+                continue
+        return "\n".join(lines) + "\n"
+
+
+# Global registry shared by all modules
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "agent_stage_seconds",
+    "Time spent in each stage of handling an agent request",
+    labelnames=("stage",),
+)
+TOOL_CALL_SECONDS = REGISTRY.histogram(
+    "agent_tool_call_seconds",
+    "Time from dispatching a browser tool call to receiving its result",
+    labelnames=("tool",),
+)
+TOOL_CALLS = REGISTRY.counter(
+    "agent_tool_calls_total",
+    "Browser tool calls by outcome",
+    labelnames=("tool", "outcome"),
+)
+REQUESTS = REGISTRY.counter(
+    "agent_requests_total",
+    "Agent requests by how they were answered",
+    labelnames=("path",),
+)
+REQUEST_TOKENS = REGISTRY.histogram(
+    "agent_request_tokens",
+    "LLM tokens used per agent request, as reported by the model",
+    buckets=TOKEN_BUCKETS,
+)
+LLM_TOKENS = REGISTRY.counter(
+    "agent_llm_tokens_total",
+    "LLM tokens used, by direction",
+    labelnames=("kind",),
+)
+BUDGET_EXHAUSTED = REGISTRY.counter(
+    "agent_budget_exhausted_total",
+    "Agent runs ended early with a partial answer, by the budget that ran out",
+    labelnames=("reason",),
+)
+COALESCED_REQUESTS = REGISTRY.counter(
+    "agent_coalesced_requests_total",
+    "Agent requests that joined an identical run in flight, or whose run a newer query superseded",
+    labelnames=("outcome",),
+)
+WS_CONNECTION_EVENTS = REGISTRY.counter(
+    "ws_connection_events_total",
+    "WebSocket connections accepted, resumed, refused or closed for inactivity",
+    labelnames=("event",),
+)
+MODEL_ROUTES = REGISTRY.counter(
+    "agent_model_routes_total",
+    "Agent runs by the model they were routed to and why",
+    labelnames=("model", "reason"),
+)
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    "agent_llm_call_seconds",
+    "Time for one model call of an agent step, by model",
+    labelnames=("model",),
+)
+LLM_FALLBACKS = REGISTRY.counter(
+    "agent_llm_fallbacks_total",
+    "Model calls retried on the fallback model and failed builds of models with one, by the model that failed and how",
+    labelnames=("model", "reason"),
+)
@@ -0,0 +1,92 @@
+from typing import Dict, Any, List, Optional, Tuple
+import os
+import re
+
+from metrics import MODEL_ROUTES
+
+# Model for simple navigation and highlight commands; unset sends every query to the default model
+ROUTER_FAST_MODEL = os.getenv("ROUTER_FAST_MODEL", "")
+# Longest query, in words, that can count as a simple command
+ROUTER_FAST_MAX_WORDS = int(os.getenv("ROUTER_FAST_MAX_WORDS", "12"))
+
+# Verbs of the single-action commands the fast model handles
+_SIMPLE_ACTION = re.compile(
+    r"\b(?:go|navigate|open|show|take me|bring me|highlight|point|scroll|click|press|where)\b", re.I
+)
+# Signs of form work, several steps or a question that needs reasoning
+_COMPLEX = re.compile(
+    r"\b(?:fill|form|submit|type|enter|write|send|message|e-?mail|sign ?up|log ?in|register|contact|"
+    r"then|after|before|also|compare|explain|why|how|read|tell me|what)\b|@|[\"“'‘]",
+    re.I,
+)
+
+
+def classify_query(query: str, max_words: int = ROUTER_FAST_MAX_WORDS) -> Tuple[bool, str]:
+    """Decide whether a query is a simple command a fast model can handle.
+
+    Returns:
+        Whether it is simple, and why: "simple", "long", "complex", "multi_action" or "no_action"
+    """
+    if len(query.split()) > max_words:
+        return False, "long"
+    if _COMPLEX.search(query):
+        return False, "complex"
+    actions = _SIMPLE_ACTION.findall(query)
+    if not actions:
+        return False, "no_action"
+    if len(actions) > 1:
+        return False, "multi_action"
+    return True, "simple"
+
+
+class ModelRouter:
+    def __init__(self, default_model: str, fast_model: Optional[str] = ROUTER_FAST_MODEL,
+                 fast_max_words: int = ROUTER_FAST_MAX_WORDS):
+        """
+        Picks the model for each agent run from the query alone.
+
+        Short single-action commands ("go to the about page", "highlight the
+        pricing table") go to `fast_model`; forms, multi-step requests and
+        questions go to `default_model`. Anything the heuristic is unsure
+        about goes to the default model, so a misroute only costs latency,
+        never a wrong answer from an underpowered model.
+
+        Args:
+            default_model: Model for everything that is not a simple command
+            fast_model: Cheaper, faster model for simple commands; routing is off without one
+            fast_max_words: Longest query that can count as a simple command
+        """
+        self.default_model = default_model
+        self.fast_model = fast_model or None
+        self.fast_max_words = fast_max_words
+
+        # Stats
+        self.routes: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.fast_model is not None and self.fast_model != self.default_model
+
+    def models(self) -> List[str]:
+        """Models requests can be routed to."""
+        return [self.default_model, self.fast_model] if self.enabled else [self.default_model]
+
+    def route(self, query: str) -> str:
+        """Get the model to answer `query` with."""
+        if not self.enabled:
+            model, reason = self.default_model, "disabled"
+        else:
+            simple, reason = classify_query(query, self.fast_max_words)
+            model = self.fast_model if simple else self.default_model
+        self.routes[model] = self.routes.get(model, 0) + 1
+        MODEL_ROUTES.inc(model=model, reason=reason)
+        return model
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get routing statistics."""
+        return {
+            "enabled": self.enabled,
+            "default_model": self.default_model,
+            "fast_model": self.fast_model,
+            "routes": dict(self.routes),
+        }
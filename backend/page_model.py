@@ -0,0 +1,219 @@
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+import logging
+import os
+import re
+
+from composite import COMPOSITE_TOOLS, expand_actions
+
+logger = logging.getLogger(__name__)
+
+# Frontend sources the index is built from
+DEFAULT_FRONTEND_SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "src")
+
+# Tools whose "selector" argument must match an element of the current page
+SELECTOR_TOOLS = {
+    "highlight_element", "fill_input", "click_element",
+    "wait_for_element", "scroll_to_element", "get_element_text",
+}
+
+_ROUTE = re.compile(r'<Route\s+path="([^"]+)"\s+element=\{<(\w+)')
+# An opening tag with a static id; JSX attributes are assumed not to contain ">"
+_ELEMENT = re.compile(r'<(\w+)([^>]*?)\sid="([\w-]+)"([^>]*)>', re.S)
+_ATTRIBUTE = re.compile(r'(\w+)="([^"]*)"')
+_LABEL = re.compile(r'<label[^>]*>([^<]+)</label>')
+_ID_SELECTOR = re.compile(r'^#([\w-]+)$')
+
+_ROLES = {"button": "button", "textarea": "textbox", "select": "combobox", "a": "link", "Link": "link", "form": "form"}
+_TEXTBOX_TYPES = {"text", "email", "password", "search", "tel", "url", "number", None}
+
+
+class PageElement:
+    """An interactive element the agent can target."""
+
+    __slots__ = ('selector', 'role', 'label')
+
+    def __init__(self, selector: str, role: str, label: str = ""):
+        self.selector = selector
+        self.role = role
+        self.label = label
+
+    def describe(self) -> str:
+        return f'{self.selector} {self.role} "{self.label}"' if self.label else f"{self.selector} {self.role}"
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"selector": self.selector, "role": self.role, "label": self.label}
+
+
+def _role(tag: str, attributes: Dict[str, str]) -> str:
+    if tag == "input":
+        input_type = attributes.get("type")
+        return "textbox" if input_type in _TEXTBOX_TYPES else input_type
+    return _ROLES.get(tag, "element")
+
+
+def parse_page_elements(source: str) -> List[PageElement]:
+    """Find the elements with a static id in a JSX page component.
+
+    Labels come from the closest preceding <label>, the element's own text
+    for buttons and links, or its placeholder.
+    """
+    elements = []
+    for match in _ELEMENT.finditer(source):
+        tag, element_id = match.group(1), match.group(3)
+        attributes = dict(_ATTRIBUTE.findall(match.group(2) + match.group(4)))
+        role = _role(tag, attributes)
+
+        label = ""
+        if role in ("button", "link"):
+            label = source[match.end():].split("<", 1)[0]
+        else:
+            labels = _LABEL.findall(source, max(0, match.start() - 300), match.start())
+            label = labels[-1] if labels else attributes.get("placeholder", "")
+        elements.append(PageElement(f"#{element_id}", role, " ".join(label.split())))
+    return elements
+
+
+class PageIndex:
+    def __init__(self):
+        """
+        Per-route index of the interactive elements of the website.
+
+        Built from the frontend sources at startup. Tool calls are checked
+        against it before they are sent, so a selector the model guessed
+        fails right away with a list of what exists instead of after a
+        browser round trip and a timeout. Only "#id" selectors on known
+        routes are checked.
+        """
+        self.routes: List[str] = []
+        self.pages: Dict[str, List[PageElement]] = {}
+        self._map: Optional[str] = None
+
+        # Stats
+        self.validated = 0
+        self.rejected = 0
+
+    def load_frontend(self, src_dir: str = DEFAULT_FRONTEND_SRC):
+        """Index the routes in App.jsx and the ids on each routed page component."""
+        try:
+            with open(os.path.join(src_dir, "App.jsx"), encoding="utf-8") as f:
+                routes = _ROUTE.findall(f.read())
+        except OSError as e:
+            logger.warning("Page index not built, frontend sources not found: %s", e)
+            return
+
+        for path, component in routes:
+            self.routes.append(path)
+            try:
+                with open(os.path.join(src_dir, "pages", f"{component}.jsx"), encoding="utf-8") as f:
+                    elements = parse_page_elements(f.read())
+            except OSError:
+                continue
+            if elements:
+                self.pages[path] = elements
+        self._map = None
+        logger.info("Indexed %d routes, %d with interactive elements", len(self.routes), len(self.pages))
+
+    def _find(self, path: Optional[str], selector: str) -> Optional[PageElement]:
+        for element in self.pages.get(path, ()):
+            if element.selector == selector:
+                return element
+        return None
+
+    def validate(self, tool_name: str, args: Dict[str, Any], path: Optional[str]) -> Optional[str]:
+        """Check a tool call against the index.
+
+        The actions of a composite call are checked in order, following any
+        navigation between them.
+
+        Args:
+            tool_name: Tool being called
+            args: Its arguments
+            path: Route the browser will be on when the call runs
+
+        Returns:
+            Why the call cannot succeed, or None if it may
+        """
+        if tool_name not in COMPOSITE_TOOLS:
+            return self._validate_action(tool_name, args, path)
+
+        try:
+            actions = expand_actions(tool_name, args)
+        except ValueError as e:
+            return str(e)
+        for index, (name, action_args) in enumerate(actions, 1):
+            problem = self._validate_action(name, action_args, path)
+            if problem:
+                return f"Step {index} ({name}): {problem}"
+            if name == "navigate_to_page":
+                path = normalize_path(action_args.get("path") or "/")
+        return None
+
+    def _validate_action(self, tool_name: str, args: Dict[str, Any], path: Optional[str]) -> Optional[str]:
+        if tool_name == "navigate_to_page":
+            target = normalize_path(args.get("path") or "")
+            self.validated += 1
+            if self.routes and target not in self.routes:
+                self.rejected += 1
+                return f"There is no page {target}. Pages: {', '.join(self.routes)}"
+            return None
+
+        selector = (args.get("selector") or "").strip()
+        if tool_name not in SELECTOR_TOOLS or not _ID_SELECTOR.match(selector) or path not in self.routes:
+            return None
+
+        self.validated += 1
+        element = self._find(path, selector)
+        if element is None:
+            elsewhere = [route for route in self.pages if route != path and self._find(route, selector)]
+            if elsewhere:
+                self.rejected += 1
+                return f"{selector} is not on {path}; it is on {elsewhere[0]}, navigate there first"
+            if path in self.pages:
+                self.rejected += 1
+                available = "; ".join(element.describe() for element in self.pages[path])
+                return f"No element matches {selector} on {path}. Available: {available}"
+            # A page without indexed elements may still have it
+            return None
+        if tool_name == "fill_input" and element.role != "textbox":
+            self.rejected += 1
+            return f"{selector} is a {element.role}, not an input field"
+        return None
+
+    def render(self) -> str:
+        """Compact map of the pages and their elements for the prompt."""
+        if self._map is None:
+            lines = [f"Pages: {', '.join(self.routes)}"] if self.routes else []
+            lines.extend(
+                f"{path}: " + "; ".join(element.describe() for element in elements)
+                for path, elements in self.pages.items()
+            )
+            self._map = "\n".join(lines)
+        return self._map
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "routes": self.routes,
+            "pages": {path: [element.to_dict() for element in elements] for path, elements in self.pages.items()},
+            "validated_calls": self.validated,
+            "rejected_calls": self.rejected,
+        }
+
+
+def normalize_path(path: str) -> str:
+    """Strip the query and fragment and any trailing slash from a route path."""
+    path = path.split("?", 1)[0].split("#", 1)[0].strip() or "/"
+    return path.rstrip("/") or "/"
+
+
+class PageCursor:
+    """Route the browser of the current agent run is on, as far as its tool calls tell."""
+
+    __slots__ = ('path',)
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = normalize_path(path) if path else None
+
+
+# Page of the agent run executing in the current context
+current_page: ContextVar[Optional[PageCursor]] = ContextVar("current_page", default=None)
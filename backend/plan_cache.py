@@ -0,0 +1,141 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+import re
+import time
+
+from workflows import PlannedCall
+
+# Words that do not change what a request asks for
+_FILLER_WORDS = {
+    "please", "pls", "kindly", "can", "could", "would", "will", "you", "hey", "hi",
+    "hello", "me", "just", "now", "to", "the", "a", "an", "and", "then",
+}
+
+# References to earlier turns; the answer to such a query depends on the conversation
+_HISTORY_REFERENCE = re.compile(
+    r"\b(?:it|its|that|this|these|those|them|they|again|previous(?:ly)?|last|earlier|"
+    r"before|same|above|back|undo|said|told|remember|my|mine|we|us|our)\b",
+    re.IGNORECASE,
+)
+
+# Values typed into the page (quoted text, emails, numbers) rarely repeat, and
+# case matters for them, so requests carrying them are not cached
+_LITERAL_VALUE = re.compile(r"[\"'“”‘’@\d]")
+
+
+def normalize_query(query: str) -> str:
+    """Reduce a query to the words that determine its plan."""
+    words = re.findall(r"[a-z]+", query.lower())
+    return " ".join(word for word in words if word not in _FILLER_WORDS)
+
+
+def bypass_reason(query: str) -> Optional[str]:
+    """Return why `query` must not be answered from the cache, or None if it may be."""
+    if _HISTORY_REFERENCE.search(query):
+        return "history"
+    if _LITERAL_VALUE.search(query):
+        return "literal_values"
+    return None
+
+
+@dataclass
+class CachedPlan:
+    """Final answer of an agent run and the tool calls it made, one list per step."""
+    answer: str
+    steps: List[List[PlannedCall]]
+    stored_at: float
+    hits: int = 0
+
+
+class PlanCache:
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600):
+        """
+        LRU cache of agent answers and tool-call plans for repeated queries.
+
+        Entries are keyed on the normalized query plus the page the client is
+        on, so "Go to the blog!" and "go to blog" share one entry while the
+        same words on a different page do not. The OrderedDict is kept in
+        recency order; the least recently used entry is evicted when full and
+        entries older than `ttl_seconds` are dropped on lookup.
+
+        Args:
+            max_entries: Maximum number of cached plans; 0 disables the cache
+            ttl_seconds: Seconds a cached plan stays valid
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[Tuple[str, str], CachedPlan]" = OrderedDict()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.bypassed: Dict[str, int] = {}
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key(self, query: str, page: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """Build the cache key for a query, or None if the query must bypass the cache."""
+        if not self.enabled:
+            return None
+        reason = bypass_reason(query)
+        if reason is None and not normalize_query(query):
+            reason = "empty"
+        if reason:
+            self.bypassed[reason] = self.bypassed.get(reason, 0) + 1
+            return None
+        return normalize_query(query), page or ""
+
+    def get(self, key: Tuple[str, str]) -> Optional[CachedPlan]:
+        """Look up a cached plan, refreshing its recency."""
+        entry = self.entries.get(key)
+        if entry is not None and time.monotonic() - entry.stored_at > self.ttl_seconds:
+            del self.entries[key]
+            self.evictions += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        entry.hits += 1
+        self.hits += 1
+        return entry
+
+    def put(self, key: Tuple[str, str], answer: str, steps: List[List[PlannedCall]]):
+        """Cache the outcome of a successful agent run."""
+        self.entries[key] = CachedPlan(answer=answer, steps=steps, stored_at=time.monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Tuple[str, str]):
+        """Drop a plan that no longer works, e.g. because the page changed."""
+        if self.entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> int:
+        count = len(self.entries)
+        self.entries.clear()
+        return count
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache size and hit-rate statistics."""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bypassed": dict(self.bypassed),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
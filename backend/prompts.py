@@ -0,0 +1,98 @@
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from typing import Dict, Any, List, Optional, Sequence
+from tokens import estimate_tokens, estimate_message_tokens
+
+# Static agent instructions. They never change at runtime, so every request
+# starts with byte-identical system text that provider-side context caching
+# can reuse.
+SYSTEM_INSTRUCTIONS = """You are a Website Interaction Agent that completes user requests by interacting with web pages.
+
+### CRITICAL RULES
+1. ALWAYS complete the user's ENTIRE request - never stop midway
+2. Execute ALL necessary steps parallelly until you fill this steps need sequencial execution.
+3. For form submissions: fill ALL fields AND click submit - this is ONE complete task
+4. Only use "Final Answer" after ALL steps are complete and verified
+5. REMEMBER previous conversations and use that context to provide better responses
+
+
+
+### Combine Actions
+Prefer one composite tool over several single actions:
+- fill_form fills all fields of a form in one call and can click its submit button
+- navigate_and_wait goes to a page and waits for an element on it
+- sequence runs several other actions in order
+
+### Contact Form Workflow
+When filling and submitting a contact form, you MUST do ALL these steps:
+1. Navigate to contact page (/contact) and wait for the form (#agent-name)
+2. Fill name (#agent-name), email (#agent-email) and message (#agent-message) and click submit (#agent-submit), all with one fill_form call
+3. Verify success
+4. Only then respond with completion message
+If any field is not provide by user ask for it and then fill it and then submit the form.
+
+### Example Workflow
+User: "Fill contact form with John Doe, john@example.com, 'Hello'"
+
+Step 1: Call navigate_and_wait with path="/contact", selector="#agent-name"
+Step 2: Call fill_form with fields=[{selector: "#agent-name", value: "John Doe"}, {selector: "#agent-email", value: "john@example.com"}, {selector: "#agent-message", value: "Hello"}], submit_selector="#agent-submit"
+Step 3: Final Response with tool execution summary
+
+IMPORTANT: Do not stop until ALL steps are complete!
+"""
+
+
+class PromptAssembler:
+    def __init__(self, instructions: str = SYSTEM_INSTRUCTIONS):
+        """
+        Builds agent input messages around a fixed system prompt prefix.
+
+        The prefix SystemMessage is created once and shared by every request.
+        Per-request context (such as the conversation summary) goes into a
+        separate SystemMessage after it, which Gemini appends to the system
+        instruction, so the prefix itself never changes.
+
+        Args:
+            instructions: Static system instructions used as the prompt prefix
+        """
+        # A fixed ID stops LangGraph from assigning one to the shared message
+        self.prefix = SystemMessage(content=instructions, id="system-prompt-prefix")
+        self.prefix_tokens = estimate_tokens(instructions)
+
+        # Stats
+        self.total_prompts = 0
+        self.total_prompt_tokens = 0
+
+    def build(self, history: Sequence[BaseMessage], query_message: HumanMessage,
+              context: Optional[Dict[str, str]] = None) -> List[BaseMessage]:
+        """Assemble the messages for one agent run.
+
+        Args:
+            history: Previous conversation turns, oldest first
+            query_message: The user's current query
+            context: Per-request context sections, keyed by heading; empty values are skipped
+
+        Returns:
+            The prefix, any context, the history and the query, in that order
+        """
+        messages: List[BaseMessage] = [self.prefix]
+        sections = [f"### {heading}\n{body}" for heading, body in (context or {}).items() if body]
+        if sections:
+            messages.append(SystemMessage(content="\n\n".join(sections)))
+        messages.extend(history)
+        messages.append(query_message)
+
+        self.total_prompts += 1
+        self.total_prompt_tokens += self.prefix_tokens + estimate_message_tokens(
+            message.content for message in messages[1:]
+        )
+        return messages
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get prompt size statistics in estimated tokens."""
+        avg_prompt_tokens = self.total_prompt_tokens / self.total_prompts if self.total_prompts else 0.0
+        return {
+            "prefix_tokens": self.prefix_tokens,
+            "total_prompts": self.total_prompts,
+            "avg_prompt_tokens": round(avg_prompt_tokens, 1),
+            "avg_cacheable_ratio": round(self.prefix_tokens / avg_prompt_tokens, 3) if avg_prompt_tokens else 0.0,
+        }
@@ -0,0 +1,242 @@
+"""Offline replay of recorded agent runs.
+
+Feeds the runs of a trace file (recorded with AGENT_TRACE_PATH) back
+through the request pipeline in-process: memory, prompt building, the agent
+graph, tool dispatch and the outbound queues all run for real, while the
+LLM answers with the recorded responses and a stub browser answers tool
+calls with the recorded results. Runs are replayed one at a time, in order.
+
+With the default latency scale of 0 the replay measures only our own
+overhead, so it can be compared between commits.
+
+Usage:
+    python replay.py traces.jsonl --repeat 5
+    python replay.py traces.jsonl --llm-latency-scale 1 --tool-latency-scale 1
+    python replay.py traces.jsonl --profile replay.prof
+"""
+from collections import deque
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# Replay every run the way it was answered, without recording it again
+os.environ.setdefault("PLAN_CACHE_MAX_ENTRIES", "0")
+os.environ.setdefault("MEMORY_BACKEND", "memory")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["AGENT_TRACE_PATH"] = ""
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from tracing import deserialize_ai_message, read_traces
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+class ReplayChatModel(BaseChatModel):
+    """Chat model that answers with the responses recorded for the current run.
+
+    Each turn waits for the recorded latency times `latency_scale`. Once the
+    recorded responses run out it answers with `fallback`.
+    """
+    responses: Any = None
+    fallback: str = ""
+    latency_scale: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def load(self, record: Dict[str, Any]):
+        self.responses = deque(event for event in record["events"] if event["type"] == "llm")
+        self.fallback = record.get("answer") or ""
+
+    def _next(self):
+        if not self.responses:
+            return 0.0, ChatResult(generations=[ChatGeneration(message=deserialize_ai_message({"content": self.fallback}))])
+        event = self.responses.popleft()
+        message = deserialize_ai_message(event["message"])
+        return event["ms"] / 1000 * self.latency_scale, ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, result = self._next()
+        time.sleep(delay)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, result = self._next()
+        await asyncio.sleep(delay)
+        return result
+
+
+class ReplayBrowser:
+    def __init__(self, manager, latency_scale: float = 0.0):
+        """
+        Stands in for a client's WebSocket and answers tool calls with recorded results.
+
+        Calls are matched to the recorded ones by tool name and arguments, in
+        order; calls that were never recorded succeed with a generic result.
+
+        Args:
+            manager: Connection manager the results are reported to
+            latency_scale: Multiplier for the recorded tool latencies
+        """
+        self.manager = manager
+        self.latency_scale = latency_scale
+        self.recorded: List[Dict[str, Any]] = []
+        self.unmatched = 0
+
+    def load(self, record: Dict[str, Any]):
+        self.recorded = [
+            event for event in record["events"] if event["type"] == "tool" and event["outcome"] != "rejected"
+        ]
+
+    def _result(self, call: Dict[str, Any]):
+        for index, event in enumerate(self.recorded):
+            if event["tool"] == call["tool"] and event["args"] == call["args"]:
+                del self.recorded[index]
+                success = not event["result"].startswith("Error:")
+                return event["ms"] / 1000, {
+                    "id": call["id"], "success": success,
+                    "result": event["result"], "error": None if success else event["result"][len("Error: "):],
+                }
+        self.unmatched += 1
+        return 0.0, {"id": call["id"], "success": True, "result": f"{call['tool']} done"}
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        frame = json.loads(data)
+        loop = asyncio.get_running_loop()
+        for message in frame["messages"] if frame.get("type") == "batch" else [frame]:
+            if message.get("type") == "tool_call":
+                delay, result = self._result(message)
+                loop.call_later(delay * self.latency_scale, self.manager.resolve_tool_result, result)
+            elif message.get("type") == "tool_batch":
+                answers = [self._result(call) for call in message["calls"]]
+                delay = max((delay for delay, _ in answers), default=0.0)
+                loop.call_later(delay * self.latency_scale, self.manager.resolve_tool_batch_result, {
+                    "id": message["id"], "results": [result for _, result in answers],
+                })
+
+
+def stage_means(histogram) -> Dict[str, float]:
+    """Mean milliseconds per stage from a latency histogram."""
+    return {
+        key[0]: round(total / count * 1000, 3)
+        for key, (_, total, count) in sorted(histogram.series.items()) if count
+    }
+
+
+async def replay(records: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    import main
+
+    model = ReplayChatModel(latency_scale=args.llm_latency_scale)
+    main.agent_factory.build_llm = lambda name: model
+    main.agent_factory.warmup = False
+    await main.agent_factory.get_agent()
+
+    browsers: Dict[str, ReplayBrowser] = {}
+    replayed: List[float] = []
+    recorded: List[float] = []
+    matched = errors = 0
+    for _ in range(args.repeat):
+        for record in records:
+            client_id = record.get("client_id")
+            browser = None
+            if client_id:
+                browser = browsers.get(client_id)
+                if browser is None:
+                    browser = browsers[client_id] = ReplayBrowser(main.manager, args.tool_latency_scale)
+                    await main.manager.connect(browser, client_id)
+                browser.load(record)
+            model.load(record)
+
+            started = time.perf_counter()
+            try:
+                response = await main.run_agent(main.AgentRequest(
+                    query=record["query"], client_id=client_id, page=record.get("page")
+                ))
+            except Exception as e:
+                errors += 1
+                print(f"Run {record['run_id']} failed: {e}", file=sys.stderr)
+                continue
+            replayed.append(time.perf_counter() - started)
+            recorded.append(record["ms"] / 1000)
+            matched += response.content == record.get("answer")
+
+    return {
+        "runs": len(replayed),
+        "errors": errors,
+        "matching_answers": matched,
+        "unmatched_tool_calls": sum(browser.unmatched for browser in browsers.values()),
+        "recorded_ms": {
+            "p50": round(percentile(recorded, 50) * 1000, 1),
+            "p95": round(percentile(recorded, 95) * 1000, 1),
+        },
+        "replay_ms": {
+            "p50": round(percentile(replayed, 50) * 1000, 3),
+            "p95": round(percentile(replayed, 95) * 1000, 3),
+            "p99": round(percentile(replayed, 99) * 1000, 3),
+        },
+        "stage_mean_ms": stage_means(main.STAGE_SECONDS),
+    }
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded agent runs offline")
+    parser.add_argument("trace", help="Trace file written with AGENT_TRACE_PATH")
+    parser.add_argument("--limit", type=int, default=0, help="Replay only the first N runs")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the runs this many times")
+    parser.add_argument("--llm-latency-scale", type=float, default=0.0, help="Multiplier for recorded LLM latency")
+    parser.add_argument("--tool-latency-scale", type=float, default=0.0, help="Multiplier for recorded tool latency")
+    parser.add_argument("--profile", help="Write cProfile stats of the replay to this file")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    records = [record for record in read_traces(args.trace) if not record.get("error")]
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("No completed runs in the trace", file=sys.stderr)
+        return 1
+
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        report = profiler.runcall(asyncio.run, replay(records, args))
+        profiler.dump_stats(args.profile)
+    else:
+        report = asyncio.run(replay(records, args))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['runs']} runs replayed, {report['errors']} errors, "
+              f"{report['matching_answers']} with the recorded answer, "
+              f"{report['unmatched_tool_calls']} tool calls not in the trace")
+        print(f"recorded ms:  p50 {report['recorded_ms']['p50']}  p95 {report['recorded_ms']['p95']}")
+        replayed = report["replay_ms"]
+        print(f"replay ms:    p50 {replayed['p50']}  p95 {replayed['p95']}  p99 {replayed['p99']}")
+        for stage, mean in report["stage_mean_ms"].items():
+            print(f"  {stage:<16} {mean} ms mean")
+
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
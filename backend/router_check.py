@@ -0,0 +1,181 @@
+"""Offline check of model routing and fallback.
+
+Runs queries through the request pipeline in-process with a fake chat model
+per model name instead of Gemini, and checks which model answered each one:
+simple commands on the fast model, everything else on the default model,
+and simple commands back on the default model when the fast model fails,
+is too slow to start or cannot be built. Streamed runs must stream exactly
+the answer, never a failed call's partial answer followed by the
+fallback's, and a fast model that fails to build must not be built again
+for every query. Nothing leaves the machine.
+
+Usage:
+    python router_check.py
+
+Exits non-zero if any query was answered by the wrong model, streamed the
+wrong text or did not fail or succeed as expected.
+"""
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+FAST_MODEL = "fast-model"
+
+# Route between two fake models and keep every request on the agent path
+os.environ["ROUTER_FAST_MODEL"] = FAST_MODEL
+os.environ["LLM_FALLBACK_MODEL"] = ""
+os.environ.setdefault("PLAN_CACHE_MAX_ENTRIES", "0")
+os.environ.setdefault("WORKFLOW_FAST_PATH", "0")
+os.environ.setdefault("MEMORY_BACKEND", "memory")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+SIMPLE_QUERIES = ["go to the about page", "highlight the pricing table", "scroll to the footer"]
+COMPLEX_QUERIES = [
+    "fill the contact form with my email and submit it",
+    "open the blog then tell me what the latest post is about",
+    "why is the pricing page different from the features page",
+]
+# Characters of the answer in each streamed chunk
+STREAM_CHUNK_CHARS = 3
+
+
+class NamedChatModel(BaseChatModel):
+    """Fake chat model that answers with its own name.
+
+    Each turn sleeps for `latency` seconds first; with `fail` set it then
+    raises instead of answering. When streamed, the name arrives a few
+    characters at a time, `chunk_delay` seconds apart, and with `fail_after`
+    set the stream raises after that many chunks.
+    """
+    name: str = ""
+    latency: float = 0.0
+    fail: bool = False
+    chunk_delay: float = 0.0
+    fail_after: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "named"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError(f"{self.name} is unavailable")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.name))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return asyncio.run(self._agenerate(messages, stop, run_manager, **kwargs))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError(f"{self.name} is unavailable")
+        for index in range(0, len(self.name), STREAM_CHUNK_CHARS):
+            if index and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            if self.fail_after is not None and index >= self.fail_after * STREAM_CHUNK_CHARS:
+                raise RuntimeError(f"{self.name} stopped answering")
+            yield ChatGenerationChunk(message=AIMessageChunk(content=self.name[index:index + STREAM_CHUNK_CHARS]))
+
+
+async def run_scenario(main, name: str, fast: Dict, queries: List[Tuple[str, str]],
+                       stream: Optional[str] = None) -> Dict:
+    """Answer `queries` with the fast model set up from `fast` and report the wrong answers.
+
+    Args:
+        main: The app module
+        name: Scenario name for the report
+        fast: Fields of the fast model, or "build_error" to make building it fail
+        queries: Each query with the model that should answer it, or "error" if the run should fail
+        stream: Text every query should stream; the runs are not streamed if not given
+    """
+    builds = 0
+
+    def build_llm(model: str) -> NamedChatModel:
+        nonlocal builds
+        if model != FAST_MODEL:
+            return NamedChatModel(name=model)
+        builds += 1
+        if fast.get("build_error"):
+            raise RuntimeError("fast model client could not be created")
+        return NamedChatModel(name=model, **fast)
+
+    factory = main.agent_factory
+    factory.build_llm = build_llm
+    factory.llms.clear()
+    factory.agents.clear()
+    factory.build_failures.clear()
+
+    wrong = []
+    for query, expected in queries:
+        tokens: List[str] = []
+        try:
+            response = await main.run_agent(main.AgentRequest(query=query), tokens.append if stream is not None else None)
+            answered = response.content
+        except Exception:
+            answered = "error"
+        if answered != expected:
+            wrong.append({"query": query, "expected": expected, "answered": answered})
+        elif stream is not None and "".join(tokens) != stream:
+            wrong.append({"query": query, "expected": f"{stream!r} streamed", "answered": f"{''.join(tokens)!r} streamed"})
+    if fast.get("build_error") and builds != 1:
+        wrong.append({"query": "(all)", "expected": "1 build of the fast model", "answered": f"{builds} builds"})
+    return {"scenario": name, "queries": len(queries), "wrong": wrong}
+
+
+async def run_checks(args) -> List[Dict]:
+    import main
+
+    default = main.model_router.default_model
+    main.agent_factory.warmup = False
+    main.agent_factory.fallback_timeout = args.fallback_timeout
+    routed = [(query, FAST_MODEL) for query in SIMPLE_QUERIES] + [(query, default) for query in COMPLEX_QUERIES]
+    fallen_back = [(query, default) for query in SIMPLE_QUERIES]
+    slow_start = {"latency": args.fallback_timeout * 5}
+    # Starts right away but takes longer than the fallback timeout in all
+    slow_stream = {"chunk_delay": args.fallback_timeout}
+    return [
+        await run_scenario(main, "routing", {}, routed),
+        await run_scenario(main, "call error", {"fail": True}, fallen_back),
+        await run_scenario(main, "call timeout", slow_start, fallen_back),
+        await run_scenario(main, "build error", {"build_error": True}, fallen_back),
+        await run_scenario(main, "stream timeout", slow_start, fallen_back, stream=default),
+        await run_scenario(main, "slow stream", slow_stream, [(query, FAST_MODEL) for query in SIMPLE_QUERIES],
+                           stream=FAST_MODEL),
+        await run_scenario(main, "stream error", {"fail_after": 2}, [(query, "error") for query in SIMPLE_QUERIES],
+                           stream=FAST_MODEL[:2 * STREAM_CHUNK_CHARS]),
+    ]
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline check of model routing and fallback")
+    parser.add_argument("--fallback-timeout", type=float, default=0.2,
+                        help="Seconds a fast model call may take to start answering before it falls back")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_checks(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for scenario in report:
+            print(f"{scenario['scenario']:<14} {scenario['queries'] - len(scenario['wrong'])}/{scenario['queries']} "
+                  f"answered by the expected model")
+            for wrong in scenario["wrong"]:
+                print(f"  {wrong['query']!r}: expected {wrong['expected']}, got {wrong['answered']}")
+
+    return 1 if any(scenario["wrong"] for scenario in report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from metrics import STAGE_SECONDS
+
+
+class AgentScheduler:
+    def __init__(self, max_concurrent_runs: int = 4, max_queued_per_client: int = 8):
+        """
+        Bounded scheduler for agent runs.
+
+        Caps the number of agent runs executing at once and queues the rest
+        per client. When a slot frees up, clients are served round-robin so a
+        single chatty client cannot starve everyone else.
+
+        Args:
+            max_concurrent_runs: Maximum number of agent runs in flight
+            max_queued_per_client: Maximum number of runs a client may have waiting
+        """
+        self.max_concurrent_runs = max_concurrent_runs
+        self.max_queued_per_client = max_queued_per_client
+        self.in_flight = 0
+        # client_id -> waiting futures, in arrival order. The OrderedDict order
+        # is the round-robin order in which clients get the next free slot.
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+        # Stats
+        self.total_runs = 0
+        self.total_rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    async def run(self, client_id: Optional[str], fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `fn` once a slot is available and return its result.
+
+        The coroutine runs in the caller's task, so context variables set by
+        the caller are visible to it.
+        """
+        key = client_id or "anonymous"
+        enqueued_at = time.monotonic()
+        await self._acquire(key)
+
+        wait = time.monotonic() - enqueued_at
+        self.total_runs += 1
+        self.total_wait_seconds += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        STAGE_SECONDS.observe(wait, stage="scheduler_wait")
+
+        try:
+            return await fn()
+        finally:
+            self._release()
+
+    async def _acquire(self, key: str):
+        if self.in_flight < self.max_concurrent_runs and not self._waiting:
+            self.in_flight += 1
+            return
+
+        waiters = self._waiting.get(key)
+        if waiters is not None and len(waiters) >= self.max_queued_per_client:
+            self.total_rejected += 1
+            raise SchedulerFullError(f"Too many queued requests for client {key}")
+
+        future = asyncio.get_running_loop().create_future()
+        if waiters is None:
+            waiters = self._waiting[key] = deque()
+        waiters.append(future)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed to us just before cancellation; pass it on.
+                self._release()
+            else:
+                self._discard(key, future)
+            raise
+
+    def _release(self):
+        # Hand the slot straight to the next client in round-robin order
+        while self._waiting:
+            key, waiters = next(iter(self._waiting.items()))
+            future = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(key)
+            else:
+                del self._waiting[key]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _discard(self, key: str, future: asyncio.Future):
+        waiters = self._waiting.get(key)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(future)
+        except ValueError:
+            return
+        if not waiters:
+            del self._waiting[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get scheduler statistics."""
+        return {
+            "max_concurrent_runs": self.max_concurrent_runs,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "queued_clients": len(self._waiting),
+            "total_runs": self.total_runs,
+            "total_rejected": self.total_rejected,
+            "avg_wait_ms": round(self.total_wait_seconds / self.total_runs * 1000, 2) if self.total_runs else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+        }
+
+
+class SchedulerFullError(Exception):
+    """Raised when a client already has too many agent runs waiting."""
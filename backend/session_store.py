@@ -0,0 +1,584 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Callable, List, Optional, Tuple, TypeVar, Union
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from datetime import datetime
+from langchain_core.messages import HumanMessage, AIMessage
+from tokens import estimate_tokens, MESSAGE_TOKEN_OVERHEAD
+import asyncio
+import sqlite3
+import threading
+import time
+import uuid
+
+
+ConversationMessage = Union[HumanMessage, AIMessage]
+
+T = TypeVar("T")
+
+_MESSAGE_TYPES = {cls.__name__: cls for cls in (HumanMessage, AIMessage)}
+
+
+class MessageRecord:
+    """A stored conversation message, kept as a ready-to-use LangChain message."""
+
+    __slots__ = ('message', 'timestamp', 'tokens')
+
+    def __init__(self, message: ConversationMessage, timestamp: Optional[str] = None):
+        self.message = message
+        self.timestamp = timestamp or datetime.now().isoformat()
+        self.tokens = estimate_tokens(message.content) + MESSAGE_TOKEN_OVERHEAD
+
+    @property
+    def type(self) -> str:
+        return self.message.__class__.__name__
+
+    @property
+    def content(self) -> str:
+        return self.message.content
+
+    @classmethod
+    def from_row(cls, type_name: str, content: str, timestamp: str) -> "MessageRecord":
+        return cls(_MESSAGE_TYPES[type_name](content=content), timestamp)
+
+
+class RollingSummary:
+    """Compact running summary of messages that fell out of the history window.
+
+    Each evicted message is folded in as one short line; once the summary
+    exceeds its token budget the oldest lines are dropped. Nothing is ever
+    regenerated, so folding a message costs O(1).
+    """
+
+    __slots__ = ('lines', 'tokens', 'max_tokens')
+
+    # Characters of each evicted message kept in its summary line
+    LINE_CHARS = 160
+
+    def __init__(self, max_tokens: int, text: str = ""):
+        self.max_tokens = max_tokens
+        self.lines: deque = deque()
+        self.tokens = 0
+        for line in text.splitlines():
+            self._append(line)
+
+    def _append(self, line: str):
+        self.lines.append(line)
+        self.tokens += estimate_tokens(line) + 1
+        while self.tokens > self.max_tokens and self.lines:
+            self.tokens -= estimate_tokens(self.lines.popleft()) + 1
+
+    def fold(self, record: MessageRecord):
+        """Add an evicted message to the summary."""
+        role = "User" if isinstance(record.message, HumanMessage) else "Assistant"
+        content = " ".join(record.content.split())
+        if len(content) > self.LINE_CHARS:
+            content = content[:self.LINE_CHARS] + "..."
+        self._append(f"{role}: {content}")
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+class SessionStore(ABC):
+    """Storage backend for conversation sessions.
+
+    Messages are kept as MessageRecords so callers can hand the stored
+    LangChain messages straight to the agent without rebuilding them.
+
+    History is bounded by an estimated token budget: the newest messages
+    that fit are kept (always at least one, starting on a user turn when
+    possible), and older ones are folded into the session's RollingSummary. `max_messages_per_session` is a secondary
+    cap on the message count.
+    """
+
+    def __init__(self, max_messages_per_session: int, session_timeout_seconds: float,
+                 token_budget: int = 2000, summary_token_budget: int = 300):
+        self.max_messages_per_session = max_messages_per_session
+        self.session_timeout_seconds = session_timeout_seconds
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+
+    def _over_budget(self, count: int, tokens: int) -> bool:
+        return count > self.max_messages_per_session or (count > 1 and tokens > self.token_budget)
+
+    @abstractmethod
+    def get_or_create_session(self, client_id: str) -> str:
+        """Return the client's session ID, starting a new session if none is live."""
+
+    @abstractmethod
+    def append_message(self, client_id: str, record: MessageRecord):
+        """Append a message to the client's session."""
+
+    @abstractmethod
+    def get_messages(self, client_id: str) -> List[MessageRecord]:
+        """Return the client's stored messages, oldest first."""
+
+    @abstractmethod
+    def get_summary(self, client_id: str) -> str:
+        """Return the rolling summary of messages evicted from the client's history."""
+
+    @abstractmethod
+    def clear_session(self, client_id: str):
+        """Drop the client's messages and start a new session."""
+
+    @abstractmethod
+    def cleanup_expired(self) -> int:
+        """Remove expired sessions and return how many were removed."""
+
+    @abstractmethod
+    def session_count(self) -> int:
+        """Return the number of stored sessions."""
+
+    def approximate_session_count(self) -> int:
+        """Return the number of stored sessions without waiting on storage I/O."""
+        return self.session_count()
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Call one of the store's methods from the event loop.
+
+        Stores whose calls can block on I/O run them off the loop.
+        """
+        return fn(*args)
+
+    def flush(self):
+        """Persist any buffered writes."""
+
+    def close(self):
+        """Flush and release resources."""
+        self.flush()
+
+
+class InMemorySessionStore(SessionStore):
+    def __init__(self, max_messages_per_session: int, session_timeout_seconds: float,
+                 token_budget: int = 2000, summary_token_budget: int = 300, max_sessions: int = 10000):
+        """
+        Process-local session store; history is lost on restart.
+
+        Sessions are kept in an OrderedDict ordered by last activity, so the
+        least recently active session is always first. That single ordering
+        serves as both the expiry index and the LRU list: expired sessions are
+        evicted from the front in O(expired) on every write, and the oldest
+        session is dropped when `max_sessions` is exceeded.
+
+        Args:
+            max_messages_per_session: Maximum number of messages to keep per session
+            session_timeout_seconds: Seconds of inactivity after which a session expires
+            token_budget: Estimated tokens of history to keep per session
+            summary_token_budget: Estimated tokens of rolling summary to keep per session
+            max_sessions: Hard cap on the number of live sessions
+        """
+        super().__init__(max_messages_per_session, session_timeout_seconds, token_budget, summary_token_budget)
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.evicted_sessions = 0
+
+    def _touch(self, client_id: str, now: float) -> Dict[str, Any]:
+        """Mark the client's session active, creating it if needed."""
+        session_data = self.sessions.get(client_id)
+        if session_data is None:
+            session_data = self.sessions[client_id] = {
+                'messages': deque(),
+                'tokens': 0,
+                'summary': RollingSummary(self.summary_token_budget),
+                'last_activity': now,
+                'session_id': str(uuid.uuid4())
+            }
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted_sessions += 1
+        else:
+            session_data['last_activity'] = now
+            self.sessions.move_to_end(client_id)
+        return session_data
+
+    def _evict_expired(self, now: float) -> int:
+        cutoff = now - self.session_timeout_seconds
+        removed = 0
+        while self.sessions:
+            client_id, session_data = next(iter(self.sessions.items()))
+            if session_data['last_activity'] >= cutoff:
+                break
+            del self.sessions[client_id]
+            removed += 1
+        return removed
+
+    def _live_session(self, client_id: str, now: float) -> Optional[Dict[str, Any]]:
+        """Look up a session without creating or refreshing it."""
+        session_data = self.sessions.get(client_id)
+        if session_data is None or now - session_data['last_activity'] > self.session_timeout_seconds:
+            return None
+        return session_data
+
+    def get_or_create_session(self, client_id: str) -> str:
+        now = time.monotonic()
+        # Drops this client's session too if it has expired, so a new one is created
+        self._evict_expired(now)
+        return self._touch(client_id, now)['session_id']
+
+    def append_message(self, client_id: str, record: MessageRecord):
+        now = time.monotonic()
+        self._evict_expired(now)
+        session_data = self._touch(client_id, now)
+        messages = session_data['messages']
+        messages.append(record)
+        session_data['tokens'] += record.tokens
+
+        # Fold the oldest messages into the summary until the rest fit the budget,
+        # then keep going so the history starts on a user turn
+        while self._over_budget(len(messages), session_data['tokens']) or (
+                len(messages) > 1 and isinstance(messages[0].message, AIMessage)):
+            evicted = messages.popleft()
+            session_data['tokens'] -= evicted.tokens
+            session_data['summary'].fold(evicted)
+
+    def get_messages(self, client_id: str) -> List[MessageRecord]:
+        session_data = self._live_session(client_id, time.monotonic())
+        return list(session_data['messages']) if session_data else []
+
+    def get_summary(self, client_id: str) -> str:
+        session_data = self._live_session(client_id, time.monotonic())
+        return session_data['summary'].text if session_data else ""
+
+    def clear_session(self, client_id: str):
+        session_data = self._live_session(client_id, time.monotonic())
+        if session_data:
+            session_data['messages'].clear()
+            session_data['tokens'] = 0
+            session_data['summary'] = RollingSummary(self.summary_token_budget)
+            session_data['session_id'] = str(uuid.uuid4())
+
+    def cleanup_expired(self) -> int:
+        return self._evict_expired(time.monotonic())
+
+    def session_count(self) -> int:
+        return len(self.sessions)
+
+
+class _CachedHistory:
+    """Messages of one SQLite session already turned into MessageRecords."""
+
+    __slots__ = ('session_id', 'last_row_id', 'row_ids', 'records')
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.last_row_id = 0
+        self.row_ids: deque = deque()
+        self.records: deque = deque()
+
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, max_messages_per_session: int, session_timeout_seconds: float,
+                 token_budget: int = 2000, summary_token_budget: int = 300,
+                 path: str = "memory.db", batch_size: int = 64, flush_interval_seconds: float = 0.5,
+                 max_sessions: int = 100000):
+        """
+        SQLite-backed session store shared by every worker process on the host.
+
+        The database runs in WAL mode so readers in one worker do not block
+        writers in another. Appends are buffered and written in a single
+        transaction once `batch_size` messages are pending or
+        `flush_interval_seconds` have passed; reads flush first so a worker
+        always sees its own writes. Expiry and the session cap are enforced
+        by `cleanup_expired` using the last_activity index, so each sweep
+        only touches the rows it deletes. The token budget is applied to
+        every client written in a flush.
+
+        A query can wait up to the busy timeout for another worker's write
+        lock, so `run` executes calls on a dedicated database thread instead
+        of the event loop.
+
+        Args:
+            max_messages_per_session: Maximum number of messages to keep per session
+            session_timeout_seconds: Seconds of inactivity after which a session expires
+            token_budget: Estimated tokens of history to keep per session
+            summary_token_budget: Estimated tokens of rolling summary to keep per session
+            path: Database file path
+            batch_size: Number of buffered messages that triggers a flush
+            flush_interval_seconds: Maximum age of buffered writes before a flush
+            max_sessions: Cap on the number of sessions; the least recently active are evicted
+        """
+        super().__init__(max_messages_per_session, session_timeout_seconds, token_budget, summary_token_budget)
+        self.max_sessions = max_sessions
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+
+        self._lock = threading.Lock()
+        self._pending_messages: List[Tuple[str, str, str, str, int]] = []
+        self._pending_activity: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        # Materialized histories of recently read clients, in LRU order
+        self.history_cache_size = 1024
+        self._history_cache: "OrderedDict[str, _CachedHistory]" = OrderedDict()
+        # Calls made through `run` queue on one thread, as they would on the lock anyway
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-store")
+        self._session_count = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                client_id TEXT PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                last_activity REAL NOT NULL,
+                summary TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_activity ON sessions (last_activity);
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id TEXT NOT NULL,
+                type TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                tokens INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_client_id ON messages (client_id, id);
+        """)
+        # Databases created before token budgets lack these columns
+        self._ensure_column("sessions", "summary", "TEXT NOT NULL DEFAULT ''")
+        self._ensure_column("messages", "tokens", "INTEGER NOT NULL DEFAULT 0")
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _ensure_column(self, table: str, column: str, definition: str):
+        columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _expiry_cutoff(self) -> float:
+        return time.time() - self.session_timeout_seconds
+
+    def get_or_create_session(self, client_id: str) -> str:
+        with self._lock:
+            self._flush_locked()
+            row = self._conn.execute(
+                "SELECT session_id, last_activity FROM sessions WHERE client_id = ?", (client_id,)
+            ).fetchone()
+
+            now = time.time()
+            if row is not None and row[1] >= self._expiry_cutoff():
+                self._conn.execute(
+                    "UPDATE sessions SET last_activity = ? WHERE client_id = ?", (now, client_id)
+                )
+                return row[0]
+
+            # No session yet or it expired: start a new one
+            session_id = str(uuid.uuid4())
+            with self._transaction():
+                self._conn.execute("DELETE FROM messages WHERE client_id = ?", (client_id,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (client_id, session_id, last_activity, summary) "
+                    "VALUES (?, ?, ?, '')",
+                    (client_id, session_id, now)
+                )
+            return session_id
+
+    def append_message(self, client_id: str, record: MessageRecord):
+        with self._lock:
+            self._pending_messages.append(
+                (client_id, record.type, record.content, record.timestamp, record.tokens)
+            )
+            self._pending_activity[client_id] = time.time()
+            if (len(self._pending_messages) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval_seconds):
+                self._flush_locked()
+
+    def get_messages(self, client_id: str) -> List[MessageRecord]:
+        with self._lock:
+            self._flush_locked()
+            row = self._conn.execute(
+                "SELECT session_id, last_activity FROM sessions WHERE client_id = ?", (client_id,)
+            ).fetchone()
+            if row is None or row[1] < self._expiry_cutoff():
+                self._history_cache.pop(client_id, None)
+                return []
+
+            # Only materialize rows added since the last read; a new session ID
+            # means the history was cleared or expired, possibly by another worker
+            cached = self._history_cache.get(client_id)
+            if cached is None or cached.session_id != row[0]:
+                cached = _CachedHistory(row[0])
+            for row_id, type_name, content, timestamp in self._conn.execute(
+                "SELECT id, type, content, timestamp FROM messages WHERE client_id = ? AND id > ? ORDER BY id",
+                (client_id, cached.last_row_id)
+            ):
+                cached.row_ids.append(row_id)
+                cached.records.append(MessageRecord.from_row(type_name, content, timestamp))
+                cached.last_row_id = row_id
+
+            # Drop messages that have since been folded into the summary
+            first_id = self._conn.execute(
+                "SELECT MIN(id) FROM messages WHERE client_id = ?", (client_id,)
+            ).fetchone()[0]
+            while cached.row_ids and (first_id is None or cached.row_ids[0] < first_id):
+                cached.row_ids.popleft()
+                cached.records.popleft()
+
+            self._history_cache[client_id] = cached
+            self._history_cache.move_to_end(client_id)
+            if len(self._history_cache) > self.history_cache_size:
+                self._history_cache.popitem(last=False)
+            return list(cached.records)
+
+    def get_summary(self, client_id: str) -> str:
+        with self._lock:
+            self._flush_locked()
+            row = self._conn.execute(
+                "SELECT summary FROM sessions WHERE client_id = ? AND last_activity >= ?",
+                (client_id, self._expiry_cutoff())
+            ).fetchone()
+        return row[0] if row else ""
+
+    def clear_session(self, client_id: str):
+        with self._lock:
+            self._flush_locked()
+            with self._transaction():
+                self._conn.execute("DELETE FROM messages WHERE client_id = ?", (client_id,))
+                self._conn.execute(
+                    "UPDATE sessions SET session_id = ?, summary = '' WHERE client_id = ?",
+                    (str(uuid.uuid4()), client_id)
+                )
+
+    def cleanup_expired(self) -> int:
+        with self._lock:
+            self._flush_locked()
+            cutoff = self._expiry_cutoff()
+            with self._transaction():
+                # Expired sessions plus the least recently active ones beyond the cap
+                self._conn.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS evicted (client_id TEXT PRIMARY KEY)
+                """)
+                self._conn.execute("DELETE FROM evicted")
+                self._conn.execute(
+                    "INSERT INTO evicted SELECT client_id FROM sessions WHERE last_activity < ?", (cutoff,)
+                )
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO evicted SELECT client_id FROM sessions "
+                    "ORDER BY last_activity DESC LIMIT -1 OFFSET ?", (self.max_sessions,)
+                )
+                self._conn.execute("DELETE FROM messages WHERE client_id IN (SELECT client_id FROM evicted)")
+                removed = self._conn.execute(
+                    "DELETE FROM sessions WHERE client_id IN (SELECT client_id FROM evicted)"
+                ).rowcount
+            self._session_count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return removed
+
+    def session_count(self) -> int:
+        with self._lock:
+            self._flush_locked()
+            self._session_count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            return self._session_count
+
+    def approximate_session_count(self) -> int:
+        # As of the last count or expiry sweep
+        return self._session_count
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._pending_messages and not self._pending_activity:
+            return
+
+        pending_messages, self._pending_messages = self._pending_messages, []
+        pending_activity, self._pending_activity = self._pending_activity, {}
+
+        try:
+            self._write_batch(pending_messages, pending_activity)
+        except sqlite3.Error:
+            # Keep the batch so the next flush retries it
+            self._pending_messages = pending_messages + self._pending_messages
+            pending_activity.update(self._pending_activity)
+            self._pending_activity = pending_activity
+            raise
+
+    def _write_batch(self, pending_messages: List[Tuple[str, str, str, str, int]],
+                     pending_activity: Dict[str, float]):
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT INTO messages (client_id, type, content, timestamp, tokens) VALUES (?, ?, ?, ?, ?)",
+                pending_messages
+            )
+            # Appending to a client without a session row starts one, matching the in-memory store
+            self._conn.executemany(
+                "INSERT INTO sessions (client_id, session_id, last_activity) VALUES (?, ?, ?) "
+                "ON CONFLICT(client_id) DO UPDATE SET last_activity = excluded.last_activity",
+                [(client_id, str(uuid.uuid4()), ts) for client_id, ts in pending_activity.items()]
+            )
+            for client_id in pending_activity:
+                self._apply_budget(client_id)
+
+    def _apply_budget(self, client_id: str):
+        """Fold the client's messages that no longer fit the budgets into its summary."""
+        # A message is kept if it and everything newer fit the token budget,
+        # or if it is the newest one
+        evicted = self._conn.execute("""
+            SELECT id, type, content, timestamp FROM (
+                SELECT id, type, content, timestamp,
+                       SUM(tokens) OVER (ORDER BY id DESC) AS newer_tokens,
+                       ROW_NUMBER() OVER (ORDER BY id DESC) AS position
+                FROM messages WHERE client_id = ?
+            )
+            WHERE position > 1 AND (position > ? OR newer_tokens > ?)
+            ORDER BY id
+        """, (client_id, self.max_messages_per_session, self.token_budget)).fetchall()
+
+        # Keep going so the remaining history starts on a user turn
+        remaining = self._conn.execute(
+            "SELECT id, type, content, timestamp FROM messages WHERE client_id = ? AND id > ? ORDER BY id",
+            (client_id, evicted[-1][0] if evicted else 0)
+        ).fetchall()
+        for row in remaining[:-1]:
+            if row[1] != 'AIMessage':
+                break
+            evicted.append(row)
+        if not evicted:
+            return
+
+        row = self._conn.execute("SELECT summary FROM sessions WHERE client_id = ?", (client_id,)).fetchone()
+        summary = RollingSummary(self.summary_token_budget, row[0] if row else "")
+        for _, type_name, content, timestamp in evicted:
+            summary.fold(MessageRecord.from_row(type_name, content, timestamp))
+
+        self._conn.execute("UPDATE sessions SET summary = ? WHERE client_id = ?", (summary.text, client_id))
+        self._conn.execute(
+            "DELETE FROM messages WHERE client_id = ? AND id <= ?", (client_id, evicted[-1][0])
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
+
+
+def create_session_store(backend: str, max_messages_per_session: int, session_timeout_seconds: float,
+                         token_budget: int = 2000, summary_token_budget: int = 300,
+                         sqlite_path: Optional[str] = None, max_sessions: int = 10000) -> SessionStore:
+    """Create the session store selected by `backend` ("memory" or "sqlite")."""
+    if backend == "memory":
+        return InMemorySessionStore(max_messages_per_session, session_timeout_seconds,
+                                    token_budget, summary_token_budget, max_sessions=max_sessions)
+    if backend == "sqlite":
+        return SQLiteSessionStore(max_messages_per_session, session_timeout_seconds,
+                                  token_budget, summary_token_budget,
+                                  path=sqlite_path or "memory.db", max_sessions=max_sessions)
+    raise ValueError(f"Unknown memory backend: {backend}")
@@ -0,0 +1,17 @@
+from typing import Iterable
+
+# Rough characters-per-token ratio for English text with Gemini/GPT tokenizers
+CHARS_PER_TOKEN = 4
+
+# Per-message framing overhead (role markers, separators)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheaply estimate the number of tokens in `text` without a tokenizer."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_message_tokens(contents: Iterable[str]) -> int:
+    """Estimate the tokens used by a list of message contents, including framing."""
+    return sum(estimate_tokens(content) + MESSAGE_TOKEN_OVERHEAD for content in contents)
@@ -0,0 +1,171 @@
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from langchain_core.messages import AIMessage
+
+logger = logging.getLogger(__name__)
+
+# Version of the trace record layout
+TRACE_VERSION = 1
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def serialize_ai_message(message: AIMessage) -> Dict[str, Any]:
+    """The parts of a model response needed to replay it."""
+    record: Dict[str, Any] = {"content": message.content}
+    if message.tool_calls:
+        record["tool_calls"] = [
+            {"name": call["name"], "args": call["args"], "id": call.get("id")} for call in message.tool_calls
+        ]
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        record["usage"] = dict(usage)
+    return record
+
+
+def deserialize_ai_message(record: Dict[str, Any]) -> AIMessage:
+    return AIMessage(content=record.get("content", ""), tool_calls=record.get("tool_calls", []))
+
+
+class RunTrace:
+    def __init__(self, client_id: Optional[str], query: str, page: Optional[str] = None):
+        """
+        Record of one agent run: the request, every model response and tool
+        call with its timing, and the time spent in each stage.
+
+        Event times ("at_ms") are offsets from the start of the run.
+        """
+        self.started = time.perf_counter()
+        self.path: Optional[str] = None
+        self.model: Optional[str] = None
+        self.record: Dict[str, Any] = {
+            "v": TRACE_VERSION,
+            "run_id": str(uuid.uuid4()),
+            "ts": datetime.now().isoformat(),
+            "client_id": client_id,
+            "query": query,
+            "page": page,
+        }
+        self.events: List[Dict[str, Any]] = []
+
+    def _event(self, event_type: str, **fields: Any):
+        self.events.append({"type": event_type, "at_ms": _ms(time.perf_counter() - self.started), **fields})
+
+    def stage(self, stage: str, seconds: float):
+        self._event("stage", stage=stage, ms=_ms(seconds))
+
+    def llm_turn(self, message: AIMessage, seconds: float):
+        self._event("llm", ms=_ms(seconds), message=serialize_ai_message(message))
+
+    def tool_call(self, tool: str, args: Dict[str, Any], seconds: float, outcome: str, result: str):
+        self._event("tool", tool=tool, args=args, ms=_ms(seconds), outcome=outcome, result=result)
+
+    def finish(self, answer: Optional[str] = None, error: Optional[str] = None) -> Dict[str, Any]:
+        """Complete the record once the run is over."""
+        self.record.update({
+            "path": self.path,
+            "model": self.model,
+            "ms": _ms(time.perf_counter() - self.started),
+            "answer": answer,
+            "error": error,
+            "events": self.events,
+        })
+        return self.record
+
+
+class TraceRecorder:
+    def __init__(self, path: Optional[str] = None, max_bytes: int = 50 * 1024 * 1024, backups: int = 3):
+        """
+        Appends one compact JSON line per agent run to `path`; disabled without a path.
+
+        When the file would grow past `max_bytes` it is rotated to
+        `path.1`, shifting older files up to `path.<backups>`.
+
+        Args:
+            path: Trace file, or None to record nothing
+            max_bytes: Size at which the file is rotated
+            backups: Number of rotated files kept
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = None
+        self._lock = threading.Lock()
+
+        # Stats
+        self.runs_recorded = 0
+        self.bytes_written = 0
+        self.rotations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def write(self, record: Dict[str, Any]):
+        """Append a finished run; failures are logged rather than raised."""
+        if not self.enabled:
+            return
+        data = (json.dumps(record, separators=(",", ":"), default=str) + "\n").encode()
+        try:
+            with self._lock:
+                if self._file is None:
+                    self._file = open(self.path, "ab")
+                if self._file.tell() and self._file.tell() + len(data) > self.max_bytes:
+                    self._rotate()
+                self._file.write(data)
+                self._file.flush()
+        except OSError as e:
+            logger.warning("Failed to write agent trace: %s", e)
+            return
+        self.runs_recorded += 1
+        self.bytes_written += len(data)
+
+    def _rotate(self):
+        self._file.close()
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{index}"):
+                    os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "wb")
+        self.rotations += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get trace recording statistics."""
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "runs_recorded": self.runs_recorded,
+            "bytes_written": self.bytes_written,
+            "rotations": self.rotations,
+        }
+
+
+def read_traces(path: str) -> Iterator[Dict[str, Any]]:
+    """Read the run records of a trace file, skipping lines cut off by a crash."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+# Trace of the agent run executing in the current context, if recording is enabled
+current_trace: ContextVar[Optional[RunTrace]] = ContextVar("current_trace", default=None)
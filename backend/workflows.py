@@ -0,0 +1,132 @@
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Pattern, Tuple
+import re
+
+# A tool call in a workflow plan: (tool name, arguments)
+PlannedCall = Tuple[str, Dict[str, Any]]
+
+
+def _fill_slots(value: Any, slots: Dict[str, str]) -> Any:
+    """Format the slot values into every string of a (nested) argument value."""
+    if isinstance(value, str):
+        return value.format(**slots)
+    if isinstance(value, dict):
+        return {key: _fill_slots(item, slots) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill_slots(item, slots) for item in value]
+    return value
+
+
+@dataclass
+class Workflow:
+    """A known multi-step flow that can run without asking the LLM to plan it.
+
+    `steps` are tool calls whose string arguments, including those nested
+    in lists and objects, may reference slots as "{slot_name}". A workflow only fires when one of its triggers matches
+    and every slot can be extracted from the query; otherwise the request
+    goes to the agent, which can ask the user for what is missing.
+    """
+    name: str
+    triggers: List[Pattern]
+    slots: Dict[str, List[Pattern]]
+    steps: List[PlannedCall]
+    response: str
+    hits: int = field(default=0, compare=False)
+
+    def extract_slots(self, query: str) -> Optional[Dict[str, str]]:
+        """Return the slot values found in `query`, or None if it does not fully match."""
+        if not any(trigger.search(query) for trigger in self.triggers):
+            return None
+
+        values = {}
+        for slot, patterns in self.slots.items():
+            for pattern in patterns:
+                match = pattern.search(query)
+                if match:
+                    values[slot] = match.group(1).strip()
+                    break
+            else:
+                return None
+        return values
+
+    def plan(self, slots: Dict[str, str]) -> List[PlannedCall]:
+        """Fill the slot values into the workflow's tool calls."""
+        return [(tool_name, _fill_slots(args, slots)) for tool_name, args in self.steps]
+
+
+class WorkflowRegistry:
+    def __init__(self):
+        """Registry of deterministic workflows, checked in registration order."""
+        self.workflows: List[Workflow] = []
+        self.misses = 0
+
+    def register(self, workflow: Workflow):
+        self.workflows.append(workflow)
+
+    def match(self, query: str) -> Optional[Tuple[Workflow, Dict[str, str]]]:
+        """Find the first workflow whose triggers and slots all match `query`."""
+        for workflow in self.workflows:
+            slots = workflow.extract_slots(query)
+            if slots is not None:
+                workflow.hits += 1
+                return workflow, slots
+        self.misses += 1
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-workflow hit counts."""
+        return {
+            "hits": {workflow.name: workflow.hits for workflow in self.workflows},
+            "misses": self.misses,
+        }
+
+
+def _compile(*patterns: str) -> List[Pattern]:
+    return [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+
+
+_PERSON_NAME = r"([A-Z][\w'.-]*(?:\s+[A-Z][\w'.-]*){0,3})"
+
+CONTACT_FORM_WORKFLOW = Workflow(
+    name="contact_form",
+    triggers=_compile(
+        r"\bcontact\s+form\b",
+        r"\b(?:fill|submit|send)\b.*\bcontact\b",
+    ),
+    slots={
+        "email": _compile(r"([\w.+-]+@[\w-]+(?:\.[\w-]+)+)"),
+        # Names are matched case-sensitively so ordinary words are not taken for one
+        "name": [
+            re.compile(r"\b(?:[Nn]ame\s*(?:is\b|:|=|as\b)?|[Ii] am\b|I'm\b)\s*" + _PERSON_NAME),
+            re.compile(r"\bwith\s+" + _PERSON_NAME + r"\s*,"),
+        ],
+        "message": _compile(
+            r"\bmessage\s*(?:is|:|=|saying|that says|as)?\s*[\"'“‘](.+?)[\"'”’]",
+            r"[\"“](.+?)[\"”]",
+            r"(?:^|[\s,])'(.+?)'(?:$|[\s,.!?])",
+            r"\bmessage\s*(?:is|:|=|saying|that says|as)\s+(.+?)\s*$",
+        ),
+    },
+    steps=[
+        ("navigate_and_wait", {"path": "/contact", "selector": "#agent-submit", "timeout": 5000}),
+        ("fill_form", {
+            "fields": [
+                {"selector": "#agent-name", "value": "{name}"},
+                {"selector": "#agent-email", "value": "{email}"},
+                {"selector": "#agent-message", "value": "{message}"},
+            ],
+            "submit_selector": "#agent-submit",
+        }),
+    ],
+    response=(
+        "I've filled out the contact form with name {name}, email {email} "
+        "and message \"{message}\", and submitted it."
+    ),
+)
+
+
+def create_default_registry() -> WorkflowRegistry:
+    """Create a registry with the site's built-in workflows."""
+    registry = WorkflowRegistry()
+    registry.register(CONTACT_FORM_WORKFLOW)
+    return registry
@@ -4,8 +4,17 @@ import "./Chatbot.css";
 
 // Configuration
 const AGENT_API_URL = "http://127.0.0.1:8000/agent";
+const AGENT_STREAM_URL = "http://127.0.0.1:8000/agent/stream";
 const WS_URL = "ws://127.0.0.1:8000/ws";
 
+// WebSocket reconnection: full-jitter exponential backoff, so clients dropped
+// together (e.g. by a backend restart) do not all reconnect at the same moment
+const RECONNECT_BASE_DELAY = 500;
+const RECONNECT_MAX_DELAY = 30000;
+
+const reconnectDelay = (attempt) =>
+  Math.random() * Math.min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt);
+
 // Voice Activity Detection Configuration
 const VAD_CONFIG = {
   SILENCE_THRESHOLD: 0.01, // Minimum audio level to consider as speech
@@ -16,141 +25,200 @@ const VAD_CONFIG = {
   BUFFER_SIZE: 4096,
 };
 
-// Tool Registry - Safe, whitelisted functions
-const createToolRegistry = (navigate, wsConnection) => ({
-  highlight_element: async ({ selector, duration = 2000 }) => {
-    const el = document.querySelector(selector);
-    if (!el) throw new Error(`Element not found: ${selector}`);
-
-    el.classList.add("agent-highlight");
-    await new Promise((resolve) => setTimeout(resolve, duration));
-    el.classList.remove("agent-highlight");
-    return `Highlighted element ${selector} for ${duration}ms`;
-  },
-
-  fill_input: async ({ selector, value }) => {
-    // Wait for element to be available (up to 5 seconds)
-    let el = null;
-    const maxWaitTime = 5000;
-    const startTime = Date.now();
-
-    while (!el && Date.now() - startTime < maxWaitTime) {
-      el = document.querySelector(selector);
-      if (!el) {
-        await new Promise((resolve) => setTimeout(resolve, 200));
-      }
+// Read a Server-Sent Events response from the agent, passing answer pieces
+// to onToken as they arrive. Resolves with the complete answer.
+const readAgentStream = async (response, onToken) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      rawEvent.split("\n").forEach((line) => {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      });
+
+      const payload = JSON.parse(data);
+      if (event === "token") onToken(payload);
+      else if (event === "done") return payload;
+      else if (event === "error") throw new Error(payload);
     }
+  }
+  throw new Error("Agent stream ended without an answer");
+};
 
-    if (!el)
-      throw new Error(
-        `Element not found: ${selector} (waited ${maxWaitTime}ms)`
-      );
+// Resolve with the element matching selector as soon as it is in the DOM
+const waitForElement = (selector, timeout = 5000) => {
+  const found = document.querySelector(selector);
+  if (found) return Promise.resolve(found);
+
+  return new Promise((resolve, reject) => {
+    const observer = new MutationObserver(() => {
+      const el = document.querySelector(selector);
+      if (el) {
+        observer.disconnect();
+        clearTimeout(timer);
+        resolve(el);
+      }
+    });
+    const timer = setTimeout(() => {
+      observer.disconnect();
+      reject(new Error(`Element ${selector} not found within ${timeout}ms`));
+    }, timeout);
+    observer.observe(document.body, { childList: true, subtree: true });
+  });
+};
 
-    if (el.tagName !== "INPUT" && el.tagName !== "TEXTAREA") {
-      throw new Error(`Element is not an input field: ${selector}`);
-    }
+// Set an input's value and notify React of the change
+const setInputValue = (el, selector, value) => {
+  if (el.tagName !== "INPUT" && el.tagName !== "TEXTAREA") {
+    throw new Error(`Element is not an input field: ${selector}`);
+  }
 
-    el.value = value;
-    console.log(`🔧 Set DOM value for ${selector}: "${value}"`);
+  el.value = value;
+  console.log(`🔧 Set DOM value for ${selector}: "${value}"`);
 
-    // Dispatch standard events
-    el.dispatchEvent(new Event("input", { bubbles: true }));
-    el.dispatchEvent(new Event("change", { bubbles: true }));
+  // Dispatch standard events
+  el.dispatchEvent(new Event("input", { bubbles: true }));
+  el.dispatchEvent(new Event("change", { bubbles: true }));
 
-    // Dispatch custom event for React state synchronization
-    const customEvent = new CustomEvent("agent-fill", {
-      bubbles: true,
-      detail: { value, selector },
-    });
+  // Dispatch custom event for React state synchronization
+  const customEvent = new CustomEvent("agent-fill", {
+    bubbles: true,
+    detail: { value, selector },
+  });
 
-    console.log(`📤 Dispatching agent-fill event:`, { value, selector });
-    el.dispatchEvent(customEvent);
+  console.log(`📤 Dispatching agent-fill event:`, { value, selector });
+  el.dispatchEvent(customEvent);
+};
 
-    return `Filled input ${selector} with value '${value}'`;
-  },
+// Turn fill_form fields, given as [{selector, value}] or {selector: value}, into pairs
+const formFieldEntries = (fields) =>
+  Array.isArray(fields)
+    ? fields.map(({ selector, value }) => [selector, value])
+    : Object.entries(fields || {});
 
-  navigate_to_page: async ({ path }) => {
-    if (!path) throw new Error("Path is required for navigation");
+// Tool Registry - Safe, whitelisted functions
+const createToolRegistry = (navigate, wsConnection) => {
+  const registry = {
+    highlight_element: async ({ selector, duration = 2000 }) => {
+      const el = await waitForElement(selector);
+
+      el.classList.add("agent-highlight");
+      await new Promise((resolve) => setTimeout(resolve, duration));
+      el.classList.remove("agent-highlight");
+      return `Highlighted element ${selector} for ${duration}ms`;
+    },
 
-    // Use React Router's navigate function
-    navigate(path);
-    console.log(`✅ Navigated to: ${path}`);
+    fill_input: async ({ selector, value }) => {
+      setInputValue(await waitForElement(selector), selector, value);
+      return `Filled input ${selector} with value '${value}'`;
+    },
 
-    // Wait for navigation to complete and DOM to update
-    await new Promise((resolve) => setTimeout(resolve, 300));
-    return `Navigated to ${path}`;
-  },
+    navigate_to_page: async ({ path }) => {
+      if (!path) throw new Error("Path is required for navigation");
 
-  click_element: async ({ selector }) => {
-    // Wait for element to be available (up to 5 seconds)
-    let el = null;
-    const maxWaitTime = 5000;
-    const startTime = Date.now();
+      // Use React Router's navigate function
+      navigate(path);
+      console.log(`✅ Navigated to: ${path}`);
 
-    while (!el && Date.now() - startTime < maxWaitTime) {
-      el = document.querySelector(selector);
-      if (!el) {
-        await new Promise((resolve) => setTimeout(resolve, 100));
-      }
-    }
+      // Let React commit the new route; tools that follow wait for their own elements
+      await new Promise((resolve) => requestAnimationFrame(resolve));
+      return `Navigated to ${path}`;
+    },
 
-    if (!el)
-      throw new Error(
-        `Element not found: ${selector} (waited ${maxWaitTime}ms)`
-      );
+    click_element: async ({ selector }) => {
+      (await waitForElement(selector)).click();
+      return `Clicked element ${selector}`;
+    },
 
-    el.click();
-    return `Clicked element ${selector}`;
-  },
-
-  wait_for_element: async ({ selector, timeout = 5000 }) => {
-    return new Promise((resolve, reject) => {
-      const startTime = Date.now();
-
-      const checkElement = () => {
-        const el = document.querySelector(selector);
-        if (el) {
-          resolve(`Element ${selector} found`);
-        } else if (Date.now() - startTime > timeout) {
-          reject(
-            new Error(`Element ${selector} not found within ${timeout}ms`)
-          );
-        } else {
-          setTimeout(checkElement, 100);
-        }
-      };
+    wait_for_element: async ({ selector, timeout = 5000 }) => {
+      await waitForElement(selector, timeout);
+      return `Element ${selector} found`;
+    },
 
-      checkElement();
-    });
-  },
+    scroll_to_element: async ({ selector }) => {
+      const el = await waitForElement(selector);
 
-  scroll_to_element: async ({ selector }) => {
-    const el = document.querySelector(selector);
-    if (!el) throw new Error(`Element not found: ${selector}`);
+      el.scrollIntoView({ behavior: "smooth", block: "center" });
+      await new Promise((resolve) => setTimeout(resolve, 500)); // Wait for scroll to complete
+      return `Scrolled to element ${selector}`;
+    },
 
-    el.scrollIntoView({ behavior: "smooth", block: "center" });
-    await new Promise((resolve) => setTimeout(resolve, 500)); // Wait for scroll to complete
-    return `Scrolled to element ${selector}`;
-  },
+    get_element_text: async ({ selector }) => {
+      const el = await waitForElement(selector);
 
-  get_element_text: async ({ selector }) => {
-    const el = document.querySelector(selector);
-    if (!el) throw new Error(`Element not found: ${selector}`);
+      const text = el.textContent || el.innerText || "";
+      return `Text from ${selector}: "${text}"`;
+    },
 
-    const text = el.textContent || el.innerText || "";
-    return `Text from ${selector}: "${text}"`;
-  },
+    take_screenshot: async ({ filename = null }) => {
+      // This is a placeholder - actual screenshot would require a more complex implementation
+      const timestamp = new Date().toISOString().replace(/[:.]/g, "-");
+      const screenshotName = filename || `screenshot-${timestamp}`;
 
-  take_screenshot: async ({ filename = null }) => {
-    // This is a placeholder - actual screenshot would require a more complex implementation
-    const timestamp = new Date().toISOString().replace(/[:.]/g, "-");
-    const screenshotName = filename || `screenshot-${timestamp}`;
+      // For now, we'll just return a success message
+      // In a real implementation, you might use html2canvas or similar
+      return `Screenshot taken: ${screenshotName}`;
+    },
 
-    // For now, we'll just return a success message
-    // In a real implementation, you might use html2canvas or similar
-    return `Screenshot taken: ${screenshotName}`;
-  },
-});
+    // Composite tools - several actions in one call, without a round trip to the agent between them
+
+    fill_form: async ({ fields, submit_selector = null }) => {
+      const entries = formFieldEntries(fields);
+      if (!entries.length) throw new Error("No fields to fill");
+
+      const elements = await Promise.all(
+        entries.map(([selector]) => waitForElement(selector))
+      );
+      entries.forEach(([selector, value], index) =>
+        setInputValue(elements[index], selector, value)
+      );
+
+      if (submit_selector) {
+        (await waitForElement(submit_selector)).click();
+        return `Filled ${entries.length} fields and clicked ${submit_selector}`;
+      }
+      return `Filled ${entries.length} fields`;
+    },
+
+    navigate_and_wait: async ({ path, selector = null, timeout = 5000 }) => {
+      if (!path) throw new Error("Path is required for navigation");
+
+      navigate(path);
+      if (!selector) return `Navigated to ${path}`;
+      await waitForElement(selector, timeout);
+      return `Navigated to ${path}, ${selector} is ready`;
+    },
+
+    sequence: async ({ actions = [] }) => {
+      const results = [];
+      for (const [index, { tool, ...args }] of actions.entries()) {
+        const handler = tool !== "sequence" && registry[tool];
+        if (!handler) throw new Error(`Step ${index + 1}: unknown tool ${tool}`);
+        try {
+          results.push(await handler(args));
+        } catch (error) {
+          throw new Error(`Step ${index + 1} (${tool}): ${error.message}`);
+        }
+      }
+      return results.join("; ");
+    },
+  };
+
+  return registry;
+};
 
 const Chatbot = () => {
   const navigate = useNavigate();
@@ -178,6 +246,8 @@ const Chatbot = () => {
   const [isProcessingQueue, setIsProcessingQueue] = useState(false);
   const toolQueueRef = useRef([]);
   const isProcessingRef = useRef(false);
+  const cancelledToolsRef = useRef(new Set());
+  const wsRef = useRef(null);
 
   // Enhanced Speech-to-Speech state for continuous conversation
   const [isListening, setIsListening] = useState(false);
@@ -441,6 +511,7 @@ const Chatbot = () => {
           body: JSON.stringify({
             query: messageText,
             client_id: memoryEnabled ? clientId : null, // Only send client_id if memory is enabled
+            page: window.location.pathname,
           }),
         });
 
@@ -1121,31 +1192,102 @@ const Chatbot = () => {
     setIsProcessingQueue(true);
     console.log("🔄 Starting tool queue processing...");
     while (toolQueueRef.current.length > 0) {
-      const toolCall = toolQueueRef.current.shift();
-      console.log(`⚡ Processing tool: ${toolCall.tool}`, toolCall.args);
-
-      try {
-        await executeToolCall(toolCall);
-        console.log(`✅ Tool ${toolCall.tool} completed successfully`);
-
-        // Add a small delay between tool executions to ensure DOM updates
-        await new Promise((resolve) => setTimeout(resolve, 300));
-      } catch (error) {
-        console.error(`❌ Tool ${toolCall.tool} failed:`, error);
-        // Continue with next tool even if one fails
+      const item = toolQueueRef.current.shift();
+
+      if (item.calls) {
+        // All tool calls of one agent step, answered with a single frame
+        console.log(`⚡ Processing batch of ${item.calls.length} tools`);
+        const results = await executeToolBatch(item.calls);
+        sendToolBatchResult(item.id, results);
+        continue;
       }
+
+      console.log(`⚡ Processing tool: ${item.tool}`, item.args);
+      sendToolResult(item.id, await runToolCall(item));
     }
 
+    cancelledToolsRef.current.clear();
     isProcessingRef.current = false;
     setIsProcessingQueue(false);
     console.log("🏁 Tool queue processing completed");
   };
 
+  // Run one tool call and describe its outcome for the agent
+  const runToolCall = async (toolCall) => {
+    if (cancelledToolsRef.current.has(toolCall.id)) {
+      return { success: false, error: "Cancelled" };
+    }
+
+    try {
+      const result = await executeToolCall(toolCall);
+      console.log(`✅ Tool ${toolCall.tool} completed successfully`);
+      return { success: true, result };
+    } catch (error) {
+      console.error(`❌ Tool ${toolCall.tool} failed:`, error);
+      // Continue with next tool even if one fails
+      return { success: false, error: error.message || String(error) };
+    }
+  };
+
+  // Run a batch in order; adjacent calls marked concurrent run together
+  const executeToolBatch = async (calls) => {
+    const results = [];
+    let i = 0;
+    while (i < calls.length) {
+      let end = i + 1;
+      if (calls[i].concurrent) {
+        while (end < calls.length && calls[end].concurrent) end++;
+      }
+
+      const group = calls.slice(i, end);
+      const outcomes = await Promise.all(group.map(runToolCall));
+      group.forEach((toolCall, index) =>
+        results.push({ id: toolCall.id, ...outcomes[index] })
+      );
+      i = end;
+    }
+    return results;
+  };
+
+  // Report a tool result back to the agent
+  const sendToolResult = (id, payload) => {
+    if (!id) return;
+    const ws = wsRef.current;
+    if (!ws || ws.readyState !== WebSocket.OPEN) {
+      console.warn(`⚠️ Cannot report result for tool call ${id}: not connected`);
+      return;
+    }
+    ws.send(JSON.stringify({ type: "tool_result", id, ...payload }));
+  };
+
+  // Report the results of a whole batch back to the agent in one frame
+  const sendToolBatchResult = (id, results) => {
+    const ws = wsRef.current;
+    if (!ws || ws.readyState !== WebSocket.OPEN) {
+      console.warn(`⚠️ Cannot report results for tool batch ${id}: not connected`);
+      return;
+    }
+    ws.send(JSON.stringify({ type: "tool_batch_result", id, results }));
+  };
+
+  // Drop a queued tool call the agent is no longer waiting for
+  const cancelQueuedTool = (id) => {
+    // Calls inside a batch are skipped when the batch reaches them
+    cancelledToolsRef.current.add(id);
+    const before = toolQueueRef.current.length;
+    toolQueueRef.current = toolQueueRef.current.filter(
+      (toolCall) => toolCall.id !== id
+    );
+    if (toolQueueRef.current.length !== before) {
+      console.log(`🚫 Cancelled queued tool call ${id}`);
+    }
+  };
+
   // Add tool to queue
   const addToolToQueue = (toolCall) => {
     toolQueueRef.current.push(toolCall);
     console.log(
-      `📝 Added tool to queue: ${toolCall.tool}`,
+      `📝 Added to queue: ${toolCall.calls ? "tool batch" : toolCall.tool}`,
       toolQueueRef.current.length,
       "tools in queue"
     );
@@ -1158,29 +1300,94 @@ const Chatbot = () => {
 
   // WebSocket connection management
   useEffect(() => {
+    let stopped = false;
+    let attempt = 0;
+    let retryAfter = 0;
+    let resumeToken = null;
+    let reconnectTimer = null;
+    let watchdogTimer = null;
+    let currentWs = null;
+
+    const scheduleReconnect = () => {
+      if (stopped) return;
+      // A server that turned us away says how long to wait at least
+      const delay = Math.max(reconnectDelay(attempt), retryAfter * 1000);
+      attempt += 1;
+      retryAfter = 0;
+      console.log(`Reconnecting in ${Math.round(delay)}ms`);
+      reconnectTimer = setTimeout(connectWebSocket, delay);
+    };
+
+    // Ping a quiet server and drop a socket it has stopped answering on,
+    // which the browser may otherwise not notice for minutes
+    const startWatchdog = (ws, heartbeatInterval, idleTimeout) => {
+      clearInterval(watchdogTimer);
+      if (!heartbeatInterval) return;
+      let lastMessage = Date.now();
+      ws.addEventListener("message", () => {
+        lastMessage = Date.now();
+      });
+      watchdogTimer = setInterval(() => {
+        const silent = Date.now() - lastMessage;
+        if (silent >= idleTimeout * 1000) {
+          console.warn("WebSocket silent too long, reconnecting");
+          ws.close();
+        } else if (silent >= heartbeatInterval * 1000 && ws.readyState === WebSocket.OPEN) {
+          ws.send(JSON.stringify({ type: "ping" }));
+        }
+      }, (heartbeatInterval * 1000) / 2);
+    };
+
     const connectWebSocket = () => {
+      if (stopped) return null;
       try {
-        const ws = new WebSocket(`${WS_URL}/${clientId}`);
+        const query = resumeToken ? `?resume=${encodeURIComponent(resumeToken)}` : "";
+        const ws = new WebSocket(`${WS_URL}/${clientId}${query}`);
+        currentWs = ws;
 
         ws.onopen = () => {
           console.log("WebSocket connected");
           console.log("Client ID:", clientId);
+          wsRef.current = ws;
           setWsConnection(ws);
           setIsConnected(true);
         };
 
+        const handleServerMessage = (message) => {
+          if (message.type === "batch") {
+            // Several queued messages delivered in one frame, in order
+            message.messages.forEach(handleServerMessage);
+          } else if (message.type === "welcome") {
+            // Connection accepted; keep the token to resume this session after a drop
+            attempt = 0;
+            resumeToken = message.resume_token;
+            startWatchdog(ws, message.heartbeat_interval, message.idle_timeout);
+          } else if (message.type === "rejected") {
+            console.warn(`WebSocket refused: ${message.reason}`);
+            retryAfter = message.retry_after || 0;
+            if (message.reason === "Client id in use") resumeToken = null;
+          } else if (message.type === "ping") {
+            ws.send(JSON.stringify({ type: "pong" }));
+          } else if (message.type === "tool_batch") {
+            // Tool calls from one agent step, executed as a unit
+            addToolToQueue({ id: message.id, calls: message.calls });
+          } else if (message.type === "tool_cancel") {
+            cancelQueuedTool(message.id);
+          } else if (message.tool && message.args) {
+            // Add tool to queue for sequential execution
+            addToolToQueue({
+              id: message.id,
+              tool: message.tool,
+              args: message.args,
+            });
+          }
+        };
+
         ws.onmessage = (event) => {
           try {
             const message = JSON.parse(event.data);
             console.log("WebSocket message received:", message);
-
-            if (message.tool && message.args) {
-              // Add tool to queue for sequential execution
-              addToolToQueue({
-                tool: message.tool,
-                args: message.args,
-              });
-            }
+            handleServerMessage(message);
           } catch (error) {
             console.error("Error parsing WebSocket message:", error);
           }
@@ -1188,10 +1395,12 @@ const Chatbot = () => {
 
         ws.onclose = () => {
           console.log("WebSocket disconnected");
+          if (currentWs !== ws) return;
+          clearInterval(watchdogTimer);
+          wsRef.current = null;
           setWsConnection(null);
           setIsConnected(false);
-          // Attempt to reconnect after 3 seconds
-          setTimeout(connectWebSocket, 3000);
+          scheduleReconnect();
         };
 
         ws.onerror = (error) => {
@@ -1203,15 +1412,19 @@ const Chatbot = () => {
       } catch (error) {
         console.error("Failed to create WebSocket connection:", error);
         setIsConnected(false);
+        scheduleReconnect();
         return null;
       }
     };
 
-    const ws = connectWebSocket();
+    connectWebSocket();
 
     return () => {
-      if (ws) {
-        ws.close();
+      stopped = true;
+      clearTimeout(reconnectTimer);
+      clearInterval(watchdogTimer);
+      if (currentWs) {
+        currentWs.close();
       }
     };
   }, [clientId]);
@@ -1232,9 +1445,31 @@ const Chatbot = () => {
     setCurrentTranscript(""); // Clear speech transcript when sending message
     setIsTyping(true);
 
+    const aiMessageId = messages.length + 2;
+    let aiMessageShown = false;
+    // Show the answer as it streams in, replacing the typing indicator
+    const showAnswer = (text, append) => {
+      if (!aiMessageShown) {
+        aiMessageShown = true;
+        setIsTyping(false);
+        setMessages((prev) => [
+          ...prev,
+          { id: aiMessageId, text, sender: "ai", timestamp: new Date() },
+        ]);
+        return;
+      }
+      setMessages((prev) =>
+        prev.map((message) =>
+          message.id === aiMessageId
+            ? { ...message, text: append ? message.text + text : text }
+            : message
+        )
+      );
+    };
+
     try {
-      // Call the agent API
-      const response = await fetch(AGENT_API_URL, {
+      // Call the agent API, streaming the answer
+      const response = await fetch(AGENT_STREAM_URL, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -1242,6 +1477,7 @@ const Chatbot = () => {
         body: JSON.stringify({
           query: currentInput,
           client_id: memoryEnabled ? clientId : null, // Only send client_id if memory is enabled
+          page: window.location.pathname,
         }),
       });
 
@@ -1249,29 +1485,24 @@ const Chatbot = () => {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const agentResponse = await response.json();
+      const content = await readAgentStream(response, (token) =>
+        showAnswer(token, true)
+      );
 
       // Validate the response format
-      if (!agentResponse.content) {
+      if (!content) {
         throw new Error("Invalid response format: missing content");
       }
 
-      // Create AI message with the content from the agent response
-      const aiResponse = {
-        id: messages.length + 2,
-        text: agentResponse.content,
-        sender: "ai",
-        timestamp: new Date(),
-      };
-
-      setMessages((prev) => [...prev, aiResponse]);
+      // The final answer is authoritative over the streamed pieces
+      showAnswer(content, false);
       setIsConnected(true);
 
       // Automatically speak the AI response
-      if (autoSpeak && agentResponse.content) {
+      if (autoSpeak && content) {
         setTimeout(() => {
           if (speakTextRef.current) {
-            speakTextRef.current(agentResponse.content);
+            speakTextRef.current(content);
           }
         }, 500);
       }
@@ -1281,13 +1512,13 @@ const Chatbot = () => {
 
       // Fallback to local response if API fails
       const fallbackResponse = {
-        id: messages.length + 2,
+        id: aiMessageId,
         text: "I'm sorry, I'm having trouble connecting to the server right now. Please try again later or contact support.",
         sender: "ai",
         timestamp: new Date(),
       };
 
-      setMessages((prev) => [...prev, fallbackResponse]);
+      showAnswer(fallbackResponse.text, false);
 
       // Automatically speak the fallback response
       if (autoSpeak) {